@@ -0,0 +1,63 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   __main__.py
+@Time        :   2024/04/24 15:41:19
+@Author      :   Shiqi Duan
+@Description :   Run the offline benchmarks and compare runs of two commits
+
+                     python -m benchmarks run [-k pattern]
+                     python -m benchmarks compare [base] [head] [--fail]
+                     python -m benchmarks list
+
+                 base and head are commits or result files, the two latest
+                 runs by default.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import sys
+import argparse
+
+from benchmarks import harness
+from benchmarks import bench_trace32, bench_rumi, bench_library
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = "python -m benchmarks")
+    commands = parser.add_subparsers(dest = "command", required = True)
+
+    runParser = commands.add_parser("run", help = "Run the benchmarks")
+    runParser.add_argument("-k", dest = "pattern", help = "Only the benchmarks containing it")
+
+    compareParser = commands.add_parser("compare", help = "Compare two runs")
+    compareParser.add_argument("base", nargs = "?")
+    compareParser.add_argument("head", nargs = "?")
+    compareParser.add_argument("--fail", action = "store_true", \
+                               help = "Exit with 1 when a case regressed")
+
+    commands.add_parser("list", help = "List the benchmark cases")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for bench in harness.get_benchmarks():
+            for param in bench.params:
+                print(bench.case_name(param))
+        return 0
+
+    if args.command == "run":
+        resultFile = harness.run(args.pattern)
+        print(f"Results stored in {resultFile}")
+        return 0
+
+    [base, head] = [args.base, args.head]
+    if base is None or head is None:
+        latest = harness.latest_results(2)
+        if len(latest) < 2:
+            print("Two runs are needed to compare")
+            return 1
+        [base, head] = [base or latest[0], head or latest[1]]
+    regressions = harness.compare(base, head)
+    return 1 if args.fail and regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
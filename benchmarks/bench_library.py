@@ -0,0 +1,78 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   bench_library.py
+@Time        :   2024/04/24 15:03:37
+@Author      :   Shiqi Duan
+@Description :   Benchmarks of the VerificationLibrary keywords and of the
+                 test platform creation from large platform files, the
+                 platforms talk to the trace32 API stand-in.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import os
+import json
+import shutil
+import tempfile
+
+from benchmarks.harness import benchmark
+from benchmarks.standins import RUMIStandIn, T32ApiStandIn
+
+from hardware import trace32
+from hardware.test_platform import create_test_platforms_from_json_file
+from VerificationLibrary import VerificationLibrary
+
+def platform_config(index):
+    return {
+        "name": f"tp{index}",
+        "dut": {
+            "basic": {"name": f"dut{index}", "type": "rumi", "project": "miami", \
+                      "addr": "0x0", "src": "bench"},
+            "core": {"type": "arm", "width": 64},
+            "ddr": {"type": 160, "width": 1},
+            "apc": {"ip": "127.0.0.1", "port": index % 24 + 1},
+        },
+        "trace32": {
+            "apc": {"ip": "127.0.0.1", "port": index % 24 + 1},
+            "ip": "localhost",
+            "port": 20000 + index,
+            "config": f"config{index}.t32",
+            "initCmm": "init.cmm",
+        },
+    }
+
+def write_platform_file(count):
+    directory = tempfile.mkdtemp(prefix = "qverify_bench_")
+    platformFile = os.path.join(directory, "test_platforms.json")
+    with open(platformFile, 'w') as pf:
+        json.dump({"test_platforms": [platform_config(i) for i in range(count)]}, pf)
+    return [directory, platformFile]
+
+@benchmark("test_platform.create_from_json_file", params = [10, 100, 1000], repeat = 5)
+def create_from_json_file(count):
+    [directory, platformFile] = write_platform_file(count)
+    yield lambda: create_test_platforms_from_json_file(platformFile)
+    shutil.rmtree(directory)
+
+@benchmark("library.keyword", repeat = 5, number = 100, params = [
+    "get_test_platform_by_name", "execute_trace32_command", \
+    "read_term_and_compare", "rumi_pipeline"])
+def keyword(name):
+    trace32.t32api = T32ApiStandIn(term = b"x" * 4096 + b"Boot done")
+    [directory, platformFile] = write_platform_file(100)
+    library = VerificationLibrary()
+    library._testPlatforms = create_test_platforms_from_json_file(platformFile)
+    server = RUMIStandIn("framed").start()
+
+    calls = {
+        "get_test_platform_by_name": lambda: library.get_test_platform_by_name("tp99"),
+        "execute_trace32_command":   lambda: library.execute_trace32_command("tp99", "Break"),
+        "read_term_and_compare":     lambda: library.read_term_and_compare("tp99", ["Boot done"]),
+        "rumi_pipeline":             lambda: library.rumi_pipeline("127.0.0.1", server.port, \
+                                                                   10, "RESET_JTAG"),
+    }
+    yield calls[name]
+
+    server.stop()
+    shutil.rmtree(directory)
@@ -0,0 +1,47 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   bench_rumi.py
+@Time        :   2024/04/24 14:12:51
+@Author      :   Shiqi Duan
+@Description :   Benchmarks of the RUMI requests against a fleet of local
+                 RUMI server stand-ins, the same command is sent to every
+                 RUMI of the fleet with a varying concurrency.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.harness import benchmark
+from benchmarks.standins import RUMIStandIn
+
+from hardware.rumi import RUMI
+
+fleetSize = 16
+commandLatency = 0.02
+
+@benchmark("rumi.fleet_execute", repeat = 3, params = [
+    "legacy-1", "legacy-4", "legacy-16", "framed-1", "framed-4", "framed-16"])
+def fleet_execute(case):
+    [protocol, concurrency] = case.split("-")
+    servers = [RUMIStandIn(protocol, commandLatency).start() for _ in range(fleetSize)]
+    rumis = [RUMI("127.0.0.1", server.port, 10, protocol) for server in servers]
+    executor = ThreadPoolExecutor(max_workers = int(concurrency))
+
+    def run():
+        results = list(executor.map(lambda rumi: rumi.execute("RESET_JTAG")[0], rumis))
+        assert results == [0] * fleetSize
+    yield run
+
+    executor.shutdown()
+    for server in servers:
+        server.stop()
+
+@benchmark("rumi.pipeline", params = ["legacy", "framed"], repeat = 3)
+def pipeline(protocol):
+    server = RUMIStandIn(protocol, commandLatency).start()
+    rumi = RUMI("127.0.0.1", server.port, 10, protocol)
+    commands = ["RESET_JTAG", "RESET_RUMI", "RESET_JTAG", "RESET_RUMI"]
+    yield lambda: rumi.pipeline(commands)
+    server.stop()
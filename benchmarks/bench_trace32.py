@@ -0,0 +1,62 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   bench_trace32.py
+@Time        :   2024/04/24 13:40:08
+@Author      :   Shiqi Duan
+@Description :   Benchmarks of the Trace32 hot paths against the trace32 API
+                 stand-in: reading and comparing the TERM view, and the
+                 latency of the PRACTICE state polling.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import time
+
+from benchmarks.harness import benchmark
+from benchmarks.standins import T32ApiStandIn
+
+from hardware import trace32
+from hardware.apc import APC
+
+def make_trace32(api):
+    trace32.t32api = api
+    return trace32.Trace32(APC(), "localhost", 20000, "config.t32", "init.cmm")
+
+def make_term(sizeMB, marker = b"Boot done"):
+    line = b"[    1.000000] qverify: benchmark line of the TERM view output\r\n"
+    data = line * (sizeMB * 1024 * 1024 // len(line))
+    return data + marker
+
+@benchmark("trace32.read_term_and_compare", params = [1, 10, 100], repeat = 3)
+def read_term_and_compare(sizeMB):
+    t32 = make_trace32(T32ApiStandIn(term = make_term(sizeMB)))
+    yield lambda: t32.read_term_and_compare({"Boot done"})
+
+@benchmark("trace32.read_window", params = [1, 10, 100], repeat = 3)
+def read_window(sizeMB):
+    t32 = make_trace32(T32ApiStandIn(term = make_term(sizeMB)))
+    yield lambda: t32.read_window("TERM.HARDCOPY", 0, 64 * 1024)
+
+@benchmark("trace32.execute_cmm_script.latency", params = [100, 500], repeat = 5)
+def execute_cmm_script(delayTime):
+    # The script runs 0.2 s, the latency is the time from its end to the
+    # return of execute_cmm_script
+    api = T32ApiStandIn(practiceTime = 0.2)
+    t32 = make_trace32(api)
+
+    def run():
+        t32.execute_cmm_script("init.cmm", delayTime)
+        return {"latency": time.monotonic() - api.practiceEnd}
+    yield run
+
+@benchmark("trace32.wait_until_not_running.latency", repeat = 5)
+def wait_until_not_running():
+    api = T32ApiStandIn(runTime = 0.2)
+    t32 = make_trace32(api)
+
+    def run():
+        api.T32_Cmd(b"Go")
+        t32.wait_until_not_running(10)
+        return {"latency": time.monotonic() - api.runEnd}
+    yield run
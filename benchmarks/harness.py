@@ -0,0 +1,192 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   harness.py
+@Time        :   2024/04/24 11:05:12
+@Author      :   Shiqi Duan
+@Description :   Minimal benchmark harness. Benchmarks are generators
+                 registered with @benchmark: the code before the yield is
+                 the setup, the yielded callable is timed, the code after
+                 the yield is the teardown. Results are stored per commit
+                 under results/benchmarks so two commits can be compared.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import os
+import sys
+import json
+import time
+import platform
+import statistics
+import subprocess
+
+projectDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+resultsDir = os.path.join(projectDir, 'results', 'benchmarks')
+
+# The framework modules import each other from src, like robot loads them
+libraryDir = os.path.join(projectDir, 'src')
+if libraryDir not in sys.path:
+    sys.path.insert(0, libraryDir)
+
+# A median slower than the base by this ratio is reported as a regression
+regressionRatio = 1.10
+
+_benchmarks = []
+
+class Benchmark:
+    def __init__(self, name, func, params, repeat, number):
+        self.name   = name
+        self.func   = func
+        self.params = params if params is not None else [None]
+        self.repeat = repeat
+        self.number = number
+
+    def case_name(self, param):
+        return self.name if param is None else f"{self.name}[{param}]"
+
+def benchmark(name, params = None, repeat = 5, number = 1):
+    """Register a benchmark
+
+    Args:
+        name (str): Name of the benchmark, e.g. "trace32.read_term"
+        params (list): Values passed to the benchmark, one case per value
+        repeat (int): Timed rounds, the statistics are over the rounds
+        number (int): Calls of the timed callable in a round
+    """
+    def register(func):
+        _benchmarks.append(Benchmark(name, func, params, repeat, number))
+        return func
+    return register
+
+def get_benchmarks(pattern = None):
+    return [bench for bench in _benchmarks if pattern is None or pattern in bench.name]
+
+def run_case(bench, param):
+    """Run a benchmark case
+
+    Returns:
+        Dict: seconds per call (min, median, mean, stdev) and the median of
+        the metrics returned by the timed callable, if any
+    """
+    generator = bench.func(param) if param is not None else bench.func()
+    timed = next(generator)
+    try:
+        rounds = []
+        metrics = {}
+        for _ in range(bench.repeat):
+            start = time.perf_counter()
+            for _ in range(bench.number):
+                result = timed()
+            rounds.append((time.perf_counter() - start) / bench.number)
+            if isinstance(result, dict):
+                for key, value in result.items():
+                    metrics.setdefault(key, []).append(value)
+    finally:
+        # Run the teardown after the yield
+        next(generator, None)
+
+    case = {
+        "min":    min(rounds),
+        "median": statistics.median(rounds),
+        "mean":   statistics.mean(rounds),
+        "stdev":  statistics.stdev(rounds) if len(rounds) > 1 else 0.0,
+        "repeat": bench.repeat,
+        "number": bench.number,
+    }
+    for key, values in metrics.items():
+        case[key] = statistics.median(values)
+    return case
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short=12", "HEAD"], cwd = projectDir, \
+                                capture_output = True, text = True, check = True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], \
+                               cwd = projectDir, capture_output = True, text = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ["unknown", False]
+    return [commit, bool(dirty)]
+
+def run(pattern = None, output = True):
+    """Run the benchmarks matching the pattern and store the results
+
+    Returns:
+        Path of the result file
+    """
+    [commit, dirty] = git_commit()
+    results = {}
+    for bench in get_benchmarks(pattern):
+        for param in bench.params:
+            name = bench.case_name(param)
+            case = run_case(bench, param)
+            results[name] = case
+            if output:
+                extra = "".join(f"  {key} {value * 1000:.3f} ms" for key, value in case.items() \
+                                if key not in ("min", "median", "mean", "stdev", "repeat", "number"))
+                print(f"{name:60s} {case['median'] * 1000:12.3f} ms  "\
+                      f"(min {case['min'] * 1000:.3f}){extra}")
+
+    record = {
+        "commit":   commit,
+        "dirty":    dirty,
+        "time":     time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python":   platform.python_version(),
+        "platform": platform.platform(),
+        "results":  results,
+    }
+    os.makedirs(resultsDir, exist_ok = True)
+    resultFile = os.path.join(resultsDir, f"{commit}{'-dirty' if dirty else ''}.json")
+    if pattern is not None and os.path.exists(resultFile):
+        # A partial run updates the cases it ran
+        with open(resultFile) as rf:
+            previous = json.load(rf)
+        previous["results"].update(results)
+        record["results"] = previous["results"]
+    with open(resultFile, 'w') as rf:
+        json.dump(record, rf, indent = 1)
+    return resultFile
+
+def load(nameOrPath):
+    path = nameOrPath if os.path.exists(nameOrPath) \
+           else os.path.join(resultsDir, f"{nameOrPath}.json")
+    with open(path) as rf:
+        return json.load(rf)
+
+def latest_results(count = 2):
+    """Result files ordered from the oldest to the newest run"""
+    if not os.path.isdir(resultsDir):
+        return []
+    files = [os.path.join(resultsDir, name) for name in os.listdir(resultsDir) \
+             if name.endswith(".json")]
+    return sorted(files, key = os.path.getmtime)[-count:]
+
+def compare(base, head, output = True):
+    """Compare the medians of two runs
+
+    Returns:
+        List of the names of the cases which regressed
+    """
+    [baseRecord, headRecord] = [load(base), load(head)]
+    regressions = []
+    if output:
+        print(f"base {baseRecord['commit']} ({baseRecord['time']})  "\
+              f"head {headRecord['commit']} ({headRecord['time']})")
+    for name in sorted(set(baseRecord["results"]) | set(headRecord["results"])):
+        baseCase = baseRecord["results"].get(name)
+        headCase = headRecord["results"].get(name)
+        if baseCase is None or headCase is None:
+            if output:
+                print(f"{name:60s} {'only in base' if headCase is None else 'only in head'}")
+            continue
+        ratio = headCase["median"] / baseCase["median"] if baseCase["median"] else 1.0
+        mark = ""
+        if ratio > regressionRatio:
+            mark = "  REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 / regressionRatio:
+            mark = "  improved"
+        if output:
+            print(f"{name:60s} {baseCase['median'] * 1000:12.3f} -> "\
+                  f"{headCase['median'] * 1000:12.3f} ms  x{ratio:.2f}{mark}")
+    return regressions
@@ -0,0 +1,337 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   standins.py
+@Time        :   2024/04/24 10:22:45
+@Author      :   Shiqi Duan
+@Description :   Local stand-ins of the RUMI servers, the APC PDUs and of the
+                 trace32 API for the offline benchmarks and tests. The RUMI
+                 stand-in is a real TCP server speaking the legacy or the
+                 framed protocol, the APC stand-in serves the telnet command
+                 line of a PDU, the trace32 stand-in replaces the t32api DLL
+                 with the same functions and serves a TERM buffer from memory.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import time
+import ctypes
+import threading
+import socketserver
+
+#----------------------------------------------------------------
+# RUMI server stand-in
+#----------------------------------------------------------------
+class _LegacyHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        data = b""
+        while not data.endswith(b"\n"):
+            chunk = self.request.recv(1024)
+            if not chunk:
+                return
+            data = data + chunk
+        time.sleep(self.server.latency)
+        command = data.decode().split()[0]
+        self.request.sendall(f"{command} done\n".encode())
+
+class _FramedHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        # Requests of a connection are served one after another like on
+        # the real server, the client pipelines them
+        for line in self.rfile:
+            [requestId, command] = (line.decode().strip().split(" ", 1) + [""])[:2]
+            time.sleep(self.server.latency)
+            self.wfile.write(f"{requestId}-{command} started\n"\
+                             f"{requestId} OK {command} done\n".encode())
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class RUMIStandIn:
+    """
+    A local RUMI server answering every command after a fixed latency.
+
+    Attributes:
+        protocol (str)   : "legacy" or "framed"
+        latency  (float) : Seconds spent on every command
+        port     (int)   : Port the server listens on, picked by the system
+
+    Usage:
+        with RUMIStandIn("framed", 0.01) as server:
+            rumi = RUMI("127.0.0.1", server.port, 10, "framed")
+    """
+    def __init__(self, protocol = "legacy", latency = 0.0):
+        self.protocol = protocol
+        self.latency  = latency
+        handler = _FramedHandler if protocol == "framed" else _LegacyHandler
+        self._server = _Server(("127.0.0.1", 0), handler)
+        self._server.latency = latency
+        self.port = self._server.server_address[1]
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target = self._server.serve_forever, daemon = True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, excType, excValue, traceback):
+        self.stop()
+
+#----------------------------------------------------------------
+# APC PDU stand-in
+#----------------------------------------------------------------
+class _APCHandler(socketserver.BaseRequestHandler):
+    def _read_line(self):
+        while b"\n" not in self._buffer:
+            data = self.request.recv(1024)
+            if not data:
+                return None
+            self._buffer = self._buffer + data
+        [line, self._buffer] = self._buffer.split(b"\n", 1)
+        # Answers of the client to the option negotiation are dropped
+        return bytes(byte for byte in line if 32 <= byte < 127).decode().strip()
+
+    def handle(self):
+        pdu = self.server.pdu
+        self._buffer = b""
+        # Ask for echo like the PDU does, the client must refuse it
+        self.request.sendall(bytes([255, 251, 1]) + b"\r\nUser Name : ")
+        user = self._read_line()
+        self.request.sendall(b"\r\nPassword  : ")
+        password = self._read_line()
+        if [user, password] != [pdu.user, pdu.password]:
+            return
+        pdu.logins = pdu.logins + 1
+        self.request.sendall(b"\r\napc>")
+        while True:
+            line = self._read_line()
+            if line is None or line == "exit":
+                return
+            self.request.sendall(pdu.execute(line).encode() + b"\r\napc>")
+            if pdu.dropAfter is not None:
+                pdu.dropAfter = pdu.dropAfter - 1
+                if pdu.dropAfter <= 0:
+                    pdu.dropAfter = None
+                    return
+
+class APCStandIn:
+    """
+    A local APC PDU serving the olOn, olOff, olReboot and olStatus
+    commands of the telnet command line.
+
+    Attributes:
+        outlets   (dict) : outlet -> True if on
+        commands  (list) : Command lines received
+        logins    (int)  : Telnet sessions opened
+        dropAfter (int)  : Close the session after this many commands, to
+                           test a stale session, None to keep it
+        port      (int)  : Port the server listens on, picked by the system
+
+    Usage:
+        with APCStandIn(outlets = 8) as pdu:
+            apc = APC("127.0.0.1", 5, pduPort = pdu.port)
+    """
+    actions = {"olOn": True, "olOff": False, "olReboot": True}
+
+    def __init__(self, outlets = 8, user = "apc", password = "apc"):
+        self.outlets   = {outlet: False for outlet in range(1, outlets + 1)}
+        self.user      = user
+        self.password  = password
+        self.commands  = []
+        self.logins    = 0
+        self.dropAfter = None
+        self._lock     = threading.Lock()
+        self._server   = _Server(("127.0.0.1", 0), _APCHandler)
+        self._server.pdu = self
+        self.port = self._server.server_address[1]
+
+    def execute(self, line):
+        with self._lock:
+            self.commands.append(line)
+            [command, arguments] = (line.split(None, 1) + [""])[:2]
+            try:
+                outlets = [int(outlet) for outlet in arguments.split(",") if outlet]
+            except ValueError:
+                return "E102: Parameter Error"
+            if command not in self.actions and command != "olStatus":
+                return "E101: Command Not Found"
+            if not outlets or any(outlet not in self.outlets for outlet in outlets):
+                return "E102: Parameter Error"
+            if command != "olStatus":
+                for outlet in outlets:
+                    self.outlets[outlet] = self.actions[command]
+                return "E000: Success"
+            states = "".join(f"\r\n {outlet}: Outlet {outlet}: "\
+                             f"{'On' if self.outlets[outlet] else 'Off'}" for outlet in outlets)
+            return "E000: Success" + states
+
+    def start(self):
+        self._thread = threading.Thread(target = self._server.serve_forever, daemon = True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, excType, excValue, traceback):
+        self.stop()
+
+#----------------------------------------------------------------
+# trace32 API stand-in
+#----------------------------------------------------------------
+class T32ApiStandIn:
+    """
+    A class with the functions of the t32api DLL used by Trace32, the
+    results are written through the ctypes references like the DLL does.
+
+    Attributes:
+        term         (bytes) : Contents of the TERM view
+        practiceTime (float) : Seconds a PRACTICE script keeps running
+        runTime      (float) : Seconds the target runs after a Go
+        practiceEnd  (float) : time.monotonic() the last script ended at
+        commands     (int)   : Number of T32_Cmd calls
+        memory       (dict)  : Target memory, address -> byte
+        memoryCalls  (int)   : Number of T32_ReadMemory/T32_WriteMemory calls
+        callLatency  (float) : Seconds spent in every T32_Go/T32_Break call
+        traceRecords (int)   : Records in the trace buffer, numbered from
+                               -traceRecords + 1 to 0 like in trace32
+        channel      (int)   : Key of the current channel, 0 for the default
+
+    The run state is kept per channel, Go and Break apply to the current one.
+
+    Usage:
+        trace32.t32api = T32ApiStandIn(term = b"Boot done")
+    """
+    def __init__(self, term = b"", practiceTime = 0.0, runTime = 0.0):
+        self.term = term
+        self.practiceTime = practiceTime
+        self.runTime = runTime
+        self.practiceEnd = 0.0
+        self.commands = 0
+        self.memory = {}
+        self.memoryCalls = 0
+        self.callLatency = 0.0
+        self.traceRecords = 0
+        self.channel = 0
+        self.runEnds = {}
+
+    @property
+    def runEnd(self):
+        return self.runEnds.get(self.channel, 0.0)
+
+    @runEnd.setter
+    def runEnd(self, value):
+        self.runEnds[self.channel] = value
+
+    #----------------------------------------------------------------
+    # Channels, keyed by the address of their buffer
+    #----------------------------------------------------------------
+    def T32_GetChannelSize(self):
+        return 64
+
+    def T32_GetChannelDefaults(self, channel):
+        return 0
+
+    def T32_GetChannel0(self):
+        return 0
+
+    def T32_SetChannel(self, channel):
+        if isinstance(channel, ctypes.c_void_p):
+            self.channel = channel.value or 0
+        else:
+            self.channel = ctypes.addressof(channel)
+        return 0
+
+    def T32_Go(self):
+        time.sleep(self.callLatency)
+        self.runEnd = time.monotonic() + self.runTime
+        return 0
+
+    def T32_Break(self):
+        time.sleep(self.callLatency)
+        self.runEnd = 0.0
+        return 0
+
+    def T32_Config(self, key, value):
+        return 0
+
+    def T32_Init(self):
+        return 0
+
+    def T32_Attach(self, device):
+        return 0
+
+    def T32_Exit(self):
+        return 0
+
+    def T32_Ping(self):
+        return 0
+
+    def T32_Cmd(self, command, *response):
+        self.commands = self.commands + 1
+        if isinstance(command, bytes) and command.startswith(b"CD.DO"):
+            self.practiceEnd = time.monotonic() + self.practiceTime
+        elif isinstance(command, bytes) and command.strip() == b"Go":
+            self.runEnd = time.monotonic() + self.runTime
+        return 0
+
+    def T32_GetPracticeState(self, state):
+        state._obj.value = 1 if time.monotonic() < self.practiceEnd else 0
+        return 0
+
+    def T32_GetState(self, state):
+        state._obj.value = 3 if time.monotonic() < self.runEnd else 2
+        return 0
+
+    def T32_GetMessage(self, message, status):
+        status._obj.value = 0
+        return 0
+
+    def T32_GetWindowContent(self, command, buffer, size, offset, code):
+        data = self.term[offset:offset + size]
+        ctypes.memmove(buffer._obj, data, len(data))
+        return len(data)
+
+    def T32_ReadMemory(self, address, access, buffer, size):
+        self.memoryCalls = self.memoryCalls + 1
+        data = bytes(self.memory.get(address + i, 0) for i in range(size))
+        ctypes.memmove(buffer, data, size)
+        return 0
+
+    def T32_ReadRegisterByName(self, name, value, hvalue):
+        value._obj.value = 0
+        hvalue._obj.value = 0
+        return 0
+
+    def T32_WriteMemory(self, address, access, buffer, size):
+        self.memoryCalls = self.memoryCalls + 1
+        for i, value in enumerate(ctypes.string_at(buffer, size)):
+            self.memory[address + i] = value
+        return 0
+
+    def T32_GetTraceState(self, traceType, state, size, first, last):
+        state._obj.value = 2
+        size._obj.value = self.traceRecords
+        first._obj.value = 1 - self.traceRecords
+        last._obj.value = 0
+        return 0
+
+    def T32_ReadTrace(self, traceType, record, count, mask, buffer):
+        # Every item of a record is the record number and the item bit
+        items = [bit for bit in range(32) if mask & (1 << bit)]
+        data = b"".join(((record + index) * 32 + bit & 0xffffffff).to_bytes(4, 'little') \
+                        for index in range(count) for bit in items)
+        ctypes.memmove(buffer, data, len(data))
+        return 0
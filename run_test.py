@@ -1,15 +1,40 @@
 import os
+import sys
 import datetime
 
 from robot import run_cli
 
+from src.utils.output_merge import merge_output_files, summarize_output_files
+
+def write_summary(log_dir, summary):
+    with open(os.path.join(log_dir, 'summary.txt'), 'w') as sf:
+        sf.write(str(summary))
+    print(summary)
+
+def merge_results(log_dir, output_files):
+    """Merge the output.xml of several workers in bounded memory"""
+    os.makedirs(log_dir, exist_ok=True)
+    summary = merge_output_files(output_files, os.path.join(log_dir, 'output.xml'))
+    write_summary(log_dir, summary)
+    return 0 if summary.failed == 0 else 1
+
 if __name__ == '__main__':
 
     now = datetime.datetime.now()
     timestamp = now.strftime("%Y-%m-%d_%H-%M-%S")
 
+    # python run_test.py merge <output.xml> <output.xml> ...
+    if len(sys.argv) > 2 and sys.argv[1] == 'merge':
+        log_dir = os.path.join(os.getcwd(), 'results/merged', timestamp)
+        sys.exit(merge_results(log_dir, sys.argv[2:]))
+
     log_dir = os.path.join(os.getcwd(), 'results/TMEL', timestamp)
     os.makedirs(log_dir)
 
     args = ['-d', log_dir, '-P', 'libraries', 'tests/TMEL']
-    run_cli(args)
\ No newline at end of file
+    rc = run_cli(args, exit=False)
+
+    output_file = os.path.join(log_dir, 'output.xml')
+    if os.path.exists(output_file):
+        write_summary(log_dir, summarize_output_files([output_file]))
+    sys.exit(rc)
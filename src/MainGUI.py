@@ -7,169 +7,299 @@ import tkinter as tk
 from tkinter import filedialog
 from tkinter import ttk
 
-from robot.api import logger
-
 ################################################################
-# APP initialization, environment paths read and configuration
-# file import
+# APP initialization, environment paths. Configuration files are
+# read by the background worker once the window is shown, so a
+# slow share never blocks the start of the GUI
 ################################################################
-sys.path.insert(1, 'src/hardware')
 import env
-import rumi
-import test_platform
-
-# Get RUMI info from rumi config json
-rumis = rumi.create_rumi_list_json_file(env.rumiListFile)
-
-# Read configuration from framework_config.json
-try:
-    with open(env.settingsFile, 'r') as config_file:
-        config_data = json.load(config_file)
-except FileNotFoundError:
-    print("FileNotFound! No default config json file")
-    
-default2NodeRumi = config_data.get("default_2node_rumi")
-default3NodeRumi = config_data.get("default_3node_rumi")
-currentRumi = default2NodeRumi    # Record current rumi
-
-def OpenRumiConfigFolder():
-    # Open folder dialog and get selected directory
-    directory = filedialog.askdirectory(initialdir=env.rumiConfigPath)
-    
-    if directory:
-        # Clear existing listbox items
-        listbox.delete(0, tk.END)
-        
-        # List subfolders in the selected directory
-        subfolders = [name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name))]
-        
-        print(subfolders)
-        
-        # Add subfolder names to the listbox
+from hardware import rumi
+from utils.subprocess_control import subprocess_start
+from gui.worker import BackgroundWorker
+from gui.rumi_status import RumiStatusBoard
+from utils.rumi_config_index import get_rumi_config_index
+from utils.t32_config_template import render_t32_config
+
+# Milliseconds between two rounds of RUMI health probes
+probeInterval = 10000
+
+def LoadConfiguration():
+    """Read rumi.json, settings.json and chip_config.json, runs in worker"""
+    rumis = rumi.create_rumi_list_json_file(env.rumiListFile)
+
+    config_data = {}
+    missing = []
+    for configFile in (env.settingsFile, env.chipConfigFile):
+        try:
+            with open(configFile, 'r') as config_file:
+                config_data.update(json.load(config_file))
+        except FileNotFoundError:
+            missing.append(configFile)
+    return [rumis, config_data, missing]
+
+def ListRumiFolders(directory):
+    """Refresh the config index of the directory, runs in worker"""
+    index = get_rumi_config_index(directory)
+    return [index.rumi_ids(), index.mismatches]
+
+#----------------------------------------------------------------
+# Main window
+#----------------------------------------------------------------
+class MainApp:
+    """
+    The RUMI / Trace32 control window. Every network or process call runs
+    in the BackgroundWorker, widgets are only updated from the Tk thread.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.worker = BackgroundWorker(root, onError = self.OnJobError)
+        self.rumis = {}
+        self.config_data = {}
+        self.board = RumiStatusBoard({})
+        self.configPath = env.rumiConfigPath
+        self.currentRumi = ""
+
+        self._create_widgets()
+        self._place_widgets()
+
+        self.set_status("Loading configuration...")
+        self.worker.submit(LoadConfiguration, onDone = self.OnConfigurationLoaded,
+                           onError = self.OnJobError)
+        self.worker.submit(ListRumiFolders, self.configPath,
+                           onDone = self.OnRumiFoldersListed, onError = self.OnJobError)
+        root.protocol("WM_DELETE_WINDOW", self.OnClose)
+
+    ################################################################
+    # APP GUI construction, weiget create
+    ################################################################
+    def _create_widgets(self):
+        root = self.root
+
+        # Create button to open folder dialog
+        self.RUMI_config_folder_choose_button = tk.Button(root, text="Select RUMI config",
+                                                          command=self.OpenRumiConfigFolder)
+
+        # Create select bar for RUMI selection
+        self.rumi_type_select = ttk.Combobox(root, values=["2node", "3node"])
+        self.rumi_type_select.set("2node")  # Set default value to "2node"
+        self.rumi_type_select.bind("<<ComboboxSelected>>", lambda event: self.SelectRUMIType())
+
+        # Create text box to show default 2node RUMI
+        self.twoNodeRumi_text = tk.Text(root, height=1, width=20)
+        self.update_button_2node = tk.Button(root, text="Update 2node",
+            command=lambda: self.UpdateRumiConfig(self.twoNodeRumi_text))
+
+        # Create text box to show default 3node RUMI
+        self.threeNodeRumi_text = tk.Text(root, height=1, width=20)
+        self.update_button_3node = tk.Button(root, text="Update 3node",
+            command=lambda: self.UpdateRumiConfig(self.threeNodeRumi_text))
+
+        # Create text box to show current config path
+        self.config_path_text = tk.Text(root, height=1, width=50)
+        self.config_path_text.insert(tk.END, self.configPath)
+
+        # Create listbox to display subfolders
+        self.listbox = tk.Listbox(root)
+
+        # Live status of the RUMI farm
+        self.status_tree = ttk.Treeview(root, columns=("state", "latency"), height=8)
+        self.status_tree.heading("#0", text="RUMI")
+        self.status_tree.heading("state", text="State")
+        self.status_tree.heading("latency", text="Latency")
+        self.status_tree.column("#0", width=80)
+        self.status_tree.column("state", width=80)
+        self.status_tree.column("latency", width=80)
+
+        self.start_apss_button = tk.Button(root, text="APSS T32 Start",
+            command = partial(self.StartupT32, env.CORE.APSS))
+        self.start_riscv_button = tk.Button(root, text="TMEL T32 Start",
+            command = partial(self.StartupT32, env.CORE.RISCV))
+        self.start_q6_button = tk.Button(root, text="Q6 T32 Start",
+            command = partial(self.StartupT32, env.CORE.Q6))
+
+        self.reload_image_button = tk.Button(root, text="Reload RUMI Image",
+            command = partial(self.SendRUMICommand, "RELOAD_IMAGE"))
+        self.rumi_reset_button = tk.Button(root, text="Reset RUMI",
+            command = partial(self.SendRUMICommand, "RESET_RUMI"))
+        self.jtag_reset_button = tk.Button(root, text="Reset JTAG",
+            command = partial(self.SendRUMICommand, "RESET_JTAG"))
+        self.rumi_quit_button = tk.Button(root, text="Quit RUMI",
+            command = partial(self.SendRUMICommand, "QUIT_RUMI"))
+
+        self.status_label = tk.Label(root, anchor=tk.W)
+
+    ################################################################
+    # APP GUI construction, weiget placement
+    ################################################################
+    def _place_widgets(self):
+        self.config_path_text.grid(row = 1, column = 2, sticky = tk.S + tk.N
+            + tk.W)
+        self.RUMI_config_folder_choose_button.grid(row = 1, column = 0, sticky = tk.S + tk.N
+            + tk.W)
+        self.rumi_type_select.grid(row = 2, column = 0, pady = 10)
+        self.twoNodeRumi_text.grid(row = 3, column = 0, pady = 10)
+        self.update_button_2node.place(in_=self.twoNodeRumi_text, relx=1.0, x=20, rely=0, y=0)
+
+        self.threeNodeRumi_text.grid(row = 4, column = 0, pady = 10)
+        self.update_button_3node.place(in_=self.threeNodeRumi_text, relx=1.0, x=20, rely=0, y=0)
+
+        self.listbox.grid(row = 5, column = 0, pady = 10)
+        self.status_tree.grid(row = 5, column = 2, pady = 10, sticky = tk.N + tk.W)
+        self.start_apss_button.grid(row = 6, column = 0, pady = 10)
+        self.start_riscv_button.grid(row = 6, column = 1, pady = 10)
+        self.start_q6_button.grid(row = 6, column = 2, pady = 10)
+
+        self.reload_image_button.grid(row = 7, column = 1, pady = 10)
+        self.rumi_reset_button.grid(row = 7, column = 2, pady = 10)
+        self.jtag_reset_button.grid(row = 8, column = 1, pady = 10)
+        self.rumi_quit_button.grid(row = 8, column = 2, pady = 10)
+        self.status_label.grid(row = 9, column = 0, columnspan = 3, sticky = tk.W + tk.E)
+
+    def set_status(self, message):
+        self.status_label.config(text = message)
+
+    def OnJobError(self, exception):
+        self.set_status(f"Error: {exception}")
+
+    ################################################################
+    # Configuration and RUMI folders
+    ################################################################
+    def OnConfigurationLoaded(self, result):
+        [self.rumis, self.config_data, missing] = result
+        self.board = RumiStatusBoard(self.rumis)
+
+        self.twoNodeRumi_text.delete(1.0, tk.END)
+        self.twoNodeRumi_text.insert(tk.END, self.config_data.get("default_2node_rumi", ""))
+        self.threeNodeRumi_text.delete(1.0, tk.END)
+        self.threeNodeRumi_text.insert(tk.END, self.config_data.get("default_3node_rumi", ""))
+        self.SelectRUMIType()
+
+        for name in self.board.status:
+            self.status_tree.insert("", tk.END, iid=name, text=name, values=("unknown", "-"))
+        self.worker.every(probeInterval, self.ProbeRumis)
+        if missing:
+            self.set_status(f"Configuration loaded, no config json file {', '.join(missing)}")
+        else:
+            self.set_status("Configuration loaded")
+
+    def OnRumiFoldersListed(self, result):
+        [subfolders, mismatches] = result
+
+        # Clear existing listbox items, then add subfolder names
+        self.listbox.delete(0, tk.END)
         for subfolder in subfolders:
-            listbox.insert(tk.END, subfolder)
-        
+            self.listbox.insert(tk.END, subfolder)
+
         # Display current config path in the text box
-        config_path_text.delete(1.0, tk.END)  # Clear previous text
-        config_path_text.insert(tk.END, directory)
-        
-def UpdateRumiConfig(text_widget):
-    # Get selected item from listbox
-    selected_item = listbox.curselection()
-    if selected_item:
-        # Get folder name from listbox
-        folder_name = listbox.get(selected_item)
-
-        # Update text widget with selected folder name
-        text_widget.delete(1.0, tk.END)
-        text_widget.insert(tk.END, folder_name)
-        currentRumi = str(text_widget.get("1.0", "end"))
-
-        # Updating current RUMI configure files
-
-def SelectRUMIType():
-    selected_rumi = rumi_type_select.get()
-    if selected_rumi == "2node":
-        currentRumi = str(twoNodeRumi_text.get("1.0", "end"))
-        twoNodeRumi_text.config(state=tk.NORMAL)
-        threeNodeRumi_text.config(state=tk.DISABLED)
-    elif selected_rumi == "3node":
-        currentRumi = str(threeNodeRumi_text.get("1.0", "end"))
-        twoNodeRumi_text.config(state=tk.DISABLED)
-        threeNodeRumi_text.config(state=tk.NORMAL)
-        
-def StartupT32(coreType = env.CORE.APSS):
-    if coreType == env.CORE.APSS:
-        # Start up APSS T32
-        test_platform.create_APSS_T32_process(1)
-        
-    elif coreType == env.CORE.RISCV:
-        print("Hello: RISCV")
-    elif coreType == env.CORE.Q6:
-        print("Hello: Q6")
+        self.config_path_text.delete(1.0, tk.END)
+        self.config_path_text.insert(tk.END, self.configPath)
 
-################################################################
-# APP GUI construction, weiget create
-################################################################
-# Create APP window
-root = tk.Tk()
-root.title("Config File Explorer")
-root.geometry("640x480")
-
-# Create button to open folder dialog
-RUMI_config_folder_choose_button = tk.Button(root, text="Select RUMI config",
-                                             command=OpenRumiConfigFolder)
-
-# Create select bar for RUMI selection
-rumi_type_select = ttk.Combobox(root, values=["2node", "3node"])
-rumi_type_select.set("2node")  # Set default value to "2node"
-rumi_type_select.bind("<<ComboboxSelected>>", lambda event: SelectRUMIType())
-
-# Create text box to show default 2node RUMI
-twoNodeRumi_text = tk.Text(root, height=1, width=20)
-twoNodeRumi_text.insert(tk.END, default2NodeRumi)
-
-# Create button to update env.twoNodeRumi_text
-update_button_2node = tk.Button(root, text="Update 2node", command=lambda: UpdateRumiConfig(twoNodeRumi_text))
-
-# Create text box to show env.default3NodeRumi
-threeNodeRumi_text = tk.Text(root, height=1, width=20)
-threeNodeRumi_text.insert(tk.END, default3NodeRumi)
-
-# Create button to update env.threeNodeRumi_text
-update_button_3node = tk.Button(root, text="Update 3node", command=lambda: UpdateRumiConfig(threeNodeRumi_text))
-
-# Create text box to show current config path
-config_path_text = tk.Text(root, height=1, width=50)
-config_path_text.insert(tk.END, env.rumiConfigPath)  # Show default path initially
-
-# Create listbox to display subfolders
-listbox = tk.Listbox(root)
-
-# List subfolders in the default directory and add them to the listbox
-subfolders_default = [name for name in os.listdir(env.rumiConfigPath) if os.path.isdir(os.path.join(env.rumiConfigPath, name))]
-for subfolder in subfolders_default:
-    listbox.insert(tk.END, subfolder)
-    
-start_apss_button = tk.Button(root, text="APSS T32 Start",
-    command = partial(StartupT32, env.CORE.APSS))
-start_riscv_button = tk.Button(root, text="TMEL T32 Start",
-    command = partial(StartupT32, env.CORE.RISCV))
-start_q6_button = tk.Button(root, text="Q6 T32 Start",
-    command = partial(StartupT32, env.CORE.Q6))
-
-reload_image_button = tk.Button(root, text="Reload RUMI Image",
-    command = partial(SendRUMICommand, currentRumi, "RELOAD_IMAGE"))
-rumi_reset_button = tk.Button(root, text="Reset RUMI",
-    command = partial(SendRUMICommand, currentRumi, "RESET_RUMI"))
-jtag_reset_button = tk.Button(root, text="Reset JTAG",
-    command = partial(SendRUMICommand, currentRumi, "RESET_JTAG"))
-rumi_quit_button = tk.Button(root, text="Quit RUMI",
-    command = partial(SendRUMICommand, currentRumi, "QUIT_RUMI"))
+        if mismatches:
+            self.set_status(f"{len(mismatches)} RUMI config mismatches: {'; '.join(mismatches)}")
 
-################################################################
-# APP GUI construction, weiget placement
-################################################################
-config_path_text.grid(row = 1, column = 2, sticky = tk.S + tk.N
-    + tk.W)
-RUMI_config_folder_choose_button.grid(row = 1, column = 0, sticky = tk.S + tk.N
-    + tk.W)
-rumi_type_select.grid(row = 2, column = 0, pady = 10)
-twoNodeRumi_text.grid(row = 3, column = 0, pady = 10)
-update_button_2node.place(in_=twoNodeRumi_text, relx=1.0, x=20, rely=0, y=0)
-
-threeNodeRumi_text.grid(row = 4, column = 0, pady = 10)
-update_button_3node.place(in_=threeNodeRumi_text, relx=1.0, x=20, rely=0, y=0)
-
-listbox.grid(row = 5, column = 0, pady = 10)
-start_apss_button.grid(row = 6, column = 0, pady = 10)
-start_riscv_button.grid(row = 6, column = 1, pady = 10)
-start_q6_button.grid(row = 6, column = 2, pady = 10)
-
-reload_image_button.grid(row = 7, column = 1, pady = 10)
-rumi_reset_button.grid(row = 7, column = 2, pady = 10)
-jtag_reset_button.grid(row = 8, column = 1, pady = 10)
-rumi_quit_button.grid(row = 8, column = 2, pady = 10)
-
-# Run the Tkinter event loop
-root.mainloop()
+    def OpenRumiConfigFolder(self):
+        # Open folder dialog and get selected directory
+        directory = filedialog.askdirectory(initialdir=self.configPath)
+        if directory:
+            self.configPath = directory
+            self.worker.submit(ListRumiFolders, directory,
+                               onDone = self.OnRumiFoldersListed, onError = self.OnJobError)
+
+    def UpdateRumiConfig(self, text_widget):
+        # Get selected item from listbox
+        selected_item = self.listbox.curselection()
+        if selected_item:
+            # Get folder name from listbox
+            folder_name = self.listbox.get(selected_item)
+
+            # Update text widget with selected folder name
+            text_widget.delete(1.0, tk.END)
+            text_widget.insert(tk.END, folder_name)
+            self.SelectRUMIType()
+
+    def SelectRUMIType(self):
+        selected_rumi = self.rumi_type_select.get()
+        if selected_rumi == "2node":
+            self.currentRumi = self.twoNodeRumi_text.get("1.0", "end").strip()
+            self.twoNodeRumi_text.config(state=tk.NORMAL)
+            self.threeNodeRumi_text.config(state=tk.DISABLED)
+        elif selected_rumi == "3node":
+            self.currentRumi = self.threeNodeRumi_text.get("1.0", "end").strip()
+            self.twoNodeRumi_text.config(state=tk.DISABLED)
+            self.threeNodeRumi_text.config(state=tk.NORMAL)
+        self.board.lease(self.currentRumi)
+        self.RefreshStatus()
+
+    ################################################################
+    # RUMI farm status
+    ################################################################
+    def ProbeRumis(self):
+        for name in self.board.status:
+            self.worker.submit(self.board.probe, name, onDone = self.RefreshStatus)
+
+    def RefreshStatus(self, name = None):
+        for [rumiName, state, latency] in self.board.rows():
+            if name is None or name == rumiName:
+                if self.status_tree.exists(rumiName):
+                    self.status_tree.item(rumiName, values=(state, latency))
+
+    ################################################################
+    # RUMI commands and Trace32 startup, both run in the worker
+    ################################################################
+    def SendRUMICommand(self, command):
+        rumiObj = self.rumis.get(self.currentRumi)
+        if rumiObj is None:
+            self.set_status(f"Unknown RUMI {self.currentRumi}")
+            return
+
+        if command == "RELOAD_IMAGE":
+            self.board.mark_reloading(self.currentRumi)
+            self.RefreshStatus(self.currentRumi)
+        self.set_status(f"Sending {command} to {self.currentRumi}...")
+        self.worker.submit(rumiObj.send_command, command,
+            onDone = lambda result: self.set_status(f"{command} sent to {self.currentRumi}"),
+            onError = self.OnJobError)
+
+    def GetT32Command(self, coreType):
+        core = env.coreConfigSuffix[coreType]
+        try:
+            # Render the config from rumi.json, fall back to the static copy
+            # for the RUMIs which are not described there
+            configFile = render_t32_config(self.currentRumi, core, env.rumiListFile)
+        except (KeyError, ValueError, OSError):
+            index = get_rumi_config_index(self.configPath, refresh = False)
+            configFile = index.get_config(self.currentRumi, core)
+        if configFile is None:
+            configFile = os.path.join(self.configPath, self.currentRumi,
+                f"config{self.currentRumi}_{core}.t32")
+        t32app = os.path.join(self.config_data.get("t32dir", ""),
+                              self.config_data.get(env.coreT32AppKey[coreType], ""))
+        return [t32app, '-c', configFile]
+
+    def StartupT32(self, coreType = env.CORE.APSS):
+        command = self.GetT32Command(coreType)
+        self.set_status(f"Starting {coreType.name} T32...")
+
+        def started(result):
+            [process, outs, errs] = result
+            if process is None:
+                self.set_status(f"Failed to start {coreType.name} T32: {' '.join(command)}")
+            else:
+                self.set_status(f"{coreType.name} T32 started, pid {process.pid}")
+
+        self.worker.submit(subprocess_start, command, 2,
+                           onDone = started, onError = self.OnJobError)
+
+    def OnClose(self):
+        self.worker.shutdown()
+        self.root.destroy()
+
+if __name__ == '__main__':
+    # Create APP window
+    root = tk.Tk()
+    root.title("Config File Explorer")
+    root.geometry("640x480")
+    app = MainApp(root)
+
+    # Run the Tkinter event loop
+    root.mainloop()
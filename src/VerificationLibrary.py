@@ -11,43 +11,190 @@
 '''
 
 from os import sys, path
+import os
 import errno
+import json
 import time
+import struct
+import functools
 sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
 
 from hardware.rumi          import *
+from hardware.reload_tracker import ReloadTracker
+from hardware.apc           import APC, Power
+from hardware.power_sequencer import PowerSequencer, add_platform_reset
+from hardware.test_platform import create_test_platforms_from_json_file
+from hardware.run_control   import RunControl
+from hardware.sampler       import Sampler, SampleChannel
+from hardware.event_bus     import get_event_bus, running_event_bus, BusCapture, \
+                                   EventType, stateStopped, PracticeInterpreterState
+from utils.capture_archive  import CaptureWriter, CaptureReader, WindowCapture
+from utils.log_index        import LogIndex
+from utils.signatures       import get_signature_library, FailureClassifier
+from utils.watchdog         import Watchdog
+from utils.rumi_config_index import get_rumi_config_index
+from utils.t32_config_template import render_t32_config
+from utils.health           import get_health_monitor
+from utils.snapshot_cache   import SnapshotCache, snapshot_key, defaultCacheDir
+from utils.register_map     import get_register_map, RegisterAccess
+from utils.symbol_index     import get_symbol_index
+from utils.artifact_cache   import get_artifact_cache, PrefetchListener
+from utils.cmm_bundle       import get_cmm_bundler, CmmProfiler
+from utils.sample_store     import SampleStore
+from utils.trace_file       import TraceWriter, TraceReader
+from utils.golden_diff      import GoldenDiff, get_normalizer, iter_lines, file_lines, \
+                                   format_hunk
+from settings               import Settings
+from remote.client          import RemoteClient
+from remote.protocol        import keyword_method
 
 from robot.api import logger
 from robot.api.logger import info, debug, trace, console
+from robot.libraries.BuiltIn import BuiltIn, RobotNotRunningError
+
+def _remote_keyword(function):
+    """Run the keyword on the remote agent when the library is in remote mode"""
+    @functools.wraps(function)
+    def wrapper(self, *args, **kwargs):
+        if self._remote is None:
+            return function(self, *args, **kwargs)
+        # The agent is not a robot run, it gets the test from the controller
+        return self._remote.batch([[function.__name__, args, kwargs]], \
+                                  context = self._test_context())[0]
+    return wrapper
 
 class VerificationLibrary:
     
     ROBOT_LIBRARY_SCOPE = 'SUITE'
 
-    def __init__(self) -> None:
-        self._settings      = None
+    def __init__(self, remote = None, token = None) -> None:
+        self._settings      = Settings()
         self._testPlatforms = []
         self._rumis         = []
+        self._captures      = {}
+        self._watchdog      = Watchdog()
+        self._testTokens    = {}
+        self._expiries      = {}
+        self._activeRumis   = []
+        self._reloads       = {}
+        self._snapshots     = None
+        self._remote        = None
+        self._testContext   = None
+        self._registerCaches = {}
+        self._registerCacheTest = None
+        self._symbols       = {}
+        self._cmmProfile    = []
+        self._runControl    = None
+        self._samplers      = {}
+        self.ROBOT_LIBRARY_LISTENER = PrefetchListener(self._artifact_cache)
+        if remote is not None:
+            self.connect_remote_agent(remote, token)
 
     ################################################################
     # RUMI operations:
     #     -- Reload image: Reload the RUMI image
+    #     -- Wait ready  : Wait until the reloaded RUMI is ready
     #     -- Reset RUMI  : Do RUMI reset
     #     -- Reset JTAG  : Do JTAG reset
     #     -- Quit RUMI   : Quit the RUMI
     ################################################################
-    def reload_image(self, ip: str, port: int, timeout: int):
-        """Reload RUMI image of specific RUMI server
+    def reload_image(self, ip: str, port: int, timeout: int, image = None, \
+                     name = None, banner = None, protocol = "legacy"):
+        """Reload RUMI image of specific RUMI server, the reload is tracked
+           in background until Wait For RUMI Ready is called
 
         Args:
             ip(str)      : ip of the RUMI server
             port(int)    : port of the RUMI server
             timeout(int) : timeout value for connection
+            image(str)   : Image to reload, the default image if not given
+            name(str)    : Test platform whose trace32 is polled for readiness
+            banner(str)  : TERM text printed once the image booted
+            protocol(str): "legacy", or "framed" for servers sending progress
         """
-        ret = 0
-        rumi = RUMI(ip, port, timeout)
-        rumi.send_command("RELOAD_IMAGE")
+        key = (ip, int(port))
+        if key in self._reloads:
+            self._reloads.pop(key).cancel()
+        if not get_health_monitor().allow(ip, port):
+            logger.error(f"RUMI {ip}:{port} is down, reload not sent!", html = False)
+            return -errno.EHOSTUNREACH
+        tracker = self._create_reload_tracker(ip, port, timeout, image, name, \
+                                              banner, protocol)
+        if tracker is None:
+            return -errno.EINVAL
+        predicted = tracker.predict()
+        if predicted is not None:
+            logger.info(f"Reload of RUMI {ip}:{port} usually takes {predicted:.0f}s", \
+                        html = False)
+        tracker.start(timeout)
+        self._reloads[key] = tracker
+        return 0
+
+    def wait_for_rumi_ready(self, ip: str, port: int, timeout = None, name = None, \
+                            banner = None):
+        """Wait until the RUMI finished its reload and the target is ready.
+           The reload started by Reload Image is waited for, without one the
+           readiness of the trace32 of the test platform is polled
+
+        Args:
+            ip(str)      : ip of the RUMI server
+            port(int)    : port of the RUMI server
+            timeout(int) : Seconds, reload_timeout of the settings by default
+            name(str)    : Test platform whose trace32 is polled for readiness
+            banner(str)  : TERM text printed once the image booted
+
+        Returns:
+            0: RUMI ready
+            -EINVAL: Neither a reload nor a test platform to wait for
+            -ETIMEDOUT: Not ready before the timeout
+            -ECANCELED: The wait is aborted by the test watchdog
+        """
+        if timeout is None:
+            timeout = self._get_timeout('reload_timeout', 600)
+        tracker = self._reloads.get((ip, int(port)))
+        if tracker is None and name is None:
+            logger.error(f"No reload of RUMI {ip}:{port} in progress and no test "\
+                         f"platform to poll!", html = False)
+            return -errno.EINVAL
+        if tracker is None:
+            tracker = self._create_reload_tracker(ip, port, timeout, None, name, \
+                                                  banner, "legacy")
+            if tracker is None:
+                return -errno.EINVAL
+            tracker.start(timeout, send = False)
+
+        ret = tracker.wait(float(timeout))
+        for message in tracker.progress:
+            logger.info(f"RUMI {ip}:{port}: {message}", html = False)
+        if ret == 0 and tracker.duration is not None:
+            logger.info(f"RUMI {ip}:{port} ready after {tracker.duration:.1f}s", \
+                        html = False)
+        elif ret == -errno.ETIMEDOUT:
+            tracker.cancel()
+            logger.error(f"RUMI {ip}:{port} not ready in {timeout}s!", html = False)
+        self._reloads.pop((ip, int(port)), None)
         return ret
+
+    def get_reload_duration(self, ip: str, port: int, image = None):
+        """Get the usual duration of a reload, the median of the last ones
+
+        Returns:
+            Seconds, 0 if the RUMI has never been reloaded with the image
+        """
+        tracker = ReloadTracker(RUMI(ip, int(port)), image)
+        predicted = tracker.predict()
+        return 0 if predicted is None else predicted
+
+    def _create_reload_tracker(self, ip, port, timeout, image, name, banner, protocol):
+        trace32 = None
+        if name is not None:
+            tp = self.get_test_platform_by_name(name)
+            if tp is None:
+                logger.error(f"Failed to find DUT with name {name}!", html = False)
+                return None
+            trace32 = tp.trace32
+        rumi = RUMI(ip, int(port), float(timeout), protocol)
+        return ReloadTracker(rumi, image, trace32, banner)
     
     def reset_rumi(self, ip: str, port: int, timeout: int):
         """Reset specific
@@ -57,10 +204,7 @@ class VerificationLibrary:
             port(int)    : port of the RUMI server
             timeout(int) : timeout value for connection
         """
-        ret = 0
-        rumi = RUMI(ip, port, timeout)
-        rumi.send_command("RESET_RUMI")
-        return ret
+        return self._send_rumi_command(ip, port, timeout, "RESET_RUMI")
     
     def reset_jtag(self, ip: str, port: int, timeout: int):
         """Reset JTAG on specific RUMI
@@ -70,10 +214,7 @@ class VerificationLibrary:
             port(int)    : port of the RUMI server
             timeout(int) : timeout value for connection
         """
-        ret = 0
-        rumi = RUMI(ip, port, timeout)
-        rumi.send_command("RESET_JTAG")
-        return ret
+        return self._send_rumi_command(ip, port, timeout, "RESET_JTAG")
     
     def quit_rumi(self, ip: str, port: int, timeout: int):
         """Quit RUMI
@@ -83,11 +224,113 @@ class VerificationLibrary:
             port(int)    : port of the RUMI server
             timeout(int) : timeout value for connection
         """
+        return self._send_rumi_command(ip, port, timeout, "QUIT_RUMI")
+    
+    def rumi_pipeline(self, ip: str, port: int, timeout: int, *commands, protocol = "legacy"):
+        """Send several RUMI commands and wait for their responses, e.g.
+           RESET_JTAG then RELOAD_IMAGE over a single connection
+
+        Args:
+            ip(str)      : ip of the RUMI server
+            port(int)    : port of the RUMI server
+            timeout(int) : timeout value for connection
+            commands     : RUMI commands, e.g. RESET_JTAG RELOAD_IMAGE
+            protocol(str): "legacy", or "framed" for servers sending progress
+
+        Returns:
+            [ret, responses]
+        """
+        rumi = RUMI(ip, int(port), float(timeout), protocol)
+        return rumi.pipeline(list(commands))
+
+    def _send_rumi_command(self, ip, port, timeout, command):
         ret = 0
         rumi = RUMI(ip, port, timeout)
-        rumi.send_command("QUIT_RUMI")
+        # Keep the request reachable so the watchdog can abort it
+        self._activeRumis = [r for r in self._activeRumis if r.thread_running]
+        self._activeRumis.append(rumi)
+        ret = rumi.send_command(command)
         return ret
-    
+
+    def get_rumi_config(self, rumiId, core = "arm"):
+        """Get the trace32 config file of a RUMI core from the config index
+
+        Args:
+            rumiId (str): RUMI id, e.g. 7558
+            core (str): arm, riscv, riscv_q6 or single_riscv
+
+        Returns:
+            Path of the config file, empty if the RUMI has no such config
+        """
+        configFile = get_rumi_config_index().get_config(rumiId, core)
+        if configFile is None:
+            logger.error(f"No {core} config for RUMI {rumiId}!", html = False)
+            return ""
+        return configFile
+
+    def render_trace32_config(self, rumiId, core = "arm"):
+        """Render the trace32 config of a RUMI core from rumi.json, the
+           rendered file is cached in the temp directory
+
+        Args:
+            rumiId (str): RUMI id, e.g. 7558
+            core (str): arm, riscv, riscv_q6 or single_riscv
+
+        Returns:
+            Path of the rendered config file, empty if it failed
+        """
+        try:
+            return render_t32_config(rumiId, core)
+        except (KeyError, ValueError, OSError) as e:
+            logger.error(f"Render {core} config of RUMI {rumiId} failed, {e}", \
+                         html = False)
+            return ""
+
+    def check_rumi_configs(self):
+        """Check the RUMI config folders, every config whose file name or
+           NODE does not belong to its folder is reported
+
+        Returns:
+            List of the mismatches
+        """
+        mismatches = get_rumi_config_index().mismatches
+        for mismatch in mismatches:
+            logger.warn(f"RUMI config mismatch: {mismatch}", html = False)
+        return mismatches
+
+    def start_health_monitor(self, interval = 10):
+        """Probe the RUMI servers and the trace32 API ports in background,
+           requests to an endpoint whose circuit breaker is open fail at
+           once instead of waiting for the socket timeout
+
+        Args:
+            interval (float): Seconds between two rounds of probes
+        """
+        monitor = get_health_monitor()
+        for rumi in (self._rumis or {}).values():
+            if rumi is not None:
+                monitor.register("rumi", rumi.ip, rumi.port)
+        for tp in self._testPlatforms:
+            monitor.register("trace32", "localhost", tp.trace32.port)
+        monitor.start(float(interval))
+        return 0
+
+    def get_healthy_rumi(self):
+        """Get the name of the reachable RUMI with the lowest latency
+
+        Returns:
+            Name of the RUMI, empty if no RUMI is healthy
+        """
+        name = get_health_monitor().pick_rumi(self._rumis or {})
+        if name is None:
+            logger.error(f"No healthy RUMI!", html = False)
+            return ""
+        return name
+
+    def log_endpoint_health(self):
+        for endpoint in get_health_monitor().endpoints.values():
+            logger.info(str(endpoint), html = False)
+
     def rumi_initialization(self, rumiConfig):
         ret = 0
         try:
@@ -108,14 +351,24 @@ class VerificationLibrary:
             -EAGAIN: Test initialization failed, please refer to error log
         """
         ret = 0
+        if self._settings.read_settings_from_file(settings) != 0:
+            logger.error("Do test initialization failed!", html = False)
+            return -errno.EAGAIN
         try:
-            self._settings.read_settings_from_file(settings)
             self._rumis = create_rumi_list_json_file(self._settings.rumiListFile)
         except Exception as e:
             ret = -errno.EAGAIN
-            logger.error("Do test initialization failed!", html = False)
+            logger.error(f"Do test initialization failed, {e}!", html = False)
         return ret
 
+    def _get_setting(self, name, default = None):
+        """Value of an option of the settings loaded by Test Initialization,
+           default if the option is not set
+        """
+        value = getattr(self._settings, name, None)
+        return default if value is None else value
+
+    @_remote_keyword
     def print_test_platform(self):
         for tp in self._testPlatforms:
             logger.debug(tp.name, html = False)
@@ -128,6 +381,71 @@ class VerificationLibrary:
                 break
         return tp
 
+    @_remote_keyword
+    def load_test_platforms(self, jsonFile):
+        """Create the test platforms described by a json file
+
+        Returns:
+            0: success
+            -EINVAL: The file is missing or wrong, please refer to error log
+        """
+        testPlatforms = create_test_platforms_from_json_file(jsonFile)
+        if testPlatforms is None:
+            return -errno.EINVAL
+        self._testPlatforms = testPlatforms
+        return 0
+
+    ################################################################
+    # Remote agent:
+    #     -- Connect   : Run the trace32 keywords on an agent next to
+    #                    the debugger
+    #     -- Batch     : Run several keywords in one round trip
+    #     -- Disconnect: Go back to the local test platforms
+    ################################################################
+    def connect_remote_agent(self, address, token = None):
+        """Forward the test platform keywords to a remote agent
+
+        Args:
+            address (str): host:port of the agent
+            token (str): Shared secret the agent was started with
+        """
+        self.disconnect_remote_agent()
+        self._remote = RemoteClient(address, token)
+        logger.info(f"Test platform keywords run on agent {address}", html = False)
+        return 0
+
+    def disconnect_remote_agent(self):
+        if self._remote is not None:
+            self._remote.close()
+            self._remote = None
+        return 0
+
+    def run_remote_keywords(self, *keywords):
+        """Run keywords separated by AND in one round trip to the agent, like
+           Run Keywords. The keywords run locally without an agent
+
+        Examples:
+            Run Remote Keywords    Connect Trace32    TestPlatform1    AND
+            ...                    Execute Trace32 Command    TestPlatform1    Go
+
+        Returns:
+            List of the keyword results
+        """
+        calls = []
+        newKeyword = True
+        for word in keywords:
+            if word == "AND":
+                newKeyword = True
+            elif newKeyword:
+                calls.append([word, [], {}])
+                newKeyword = False
+            else:
+                calls[-1][1].append(word)
+
+        if self._remote is not None:
+            return self._remote.batch(calls, context = self._test_context())
+        return [getattr(self, keyword_method(keyword))(*args) for [keyword, args, kwargs] in calls]
+
     """
         Interfaces to control trace32
 
@@ -137,6 +455,7 @@ class VerificationLibrary:
         end_trace32_process(self, name)
             End trace32 process
     """
+    @_remote_keyword
     def start_trace32_process(self, name: str):
         """Start a trace32 process for given test platform
 
@@ -161,6 +480,7 @@ class VerificationLibrary:
 
         return ret
 
+    @_remote_keyword
     def kill_trace32_process(self, name):
         ret = 0
         tp = None
@@ -182,6 +502,7 @@ class VerificationLibrary:
         # Process normal
         pass
 
+    @_remote_keyword
     def connect_trace32(self, name):
         ret = 0
         tp = None
@@ -191,10 +512,16 @@ class VerificationLibrary:
             ret = errno.EINVAL
             logger.error(f"Failed to find DUT with name {name}!", html = False)
         else:
+            # Only checks the trace32 answers, every keyword connects on its
+            # own. A connection kept between the keywords would hold the
+            # t32api lock and block the event bus and the samplers
             ret = tp.trace32.connect()
+            if ret == 0:
+                tp.trace32.disconnect()
 
         return ret
 
+    @_remote_keyword
     def disconnect_trace32(self, name):
         ret = 0
         tp = None
@@ -203,23 +530,25 @@ class VerificationLibrary:
         if tp is None:
             ret = errno.EINVAL
             logger.error(f"Failed to find DUT with name {name}!", html = False)
-        else:
-            tp.trace32.disconnect()
 
         return ret
 
     def check_connection(self, name):
         pass
 
+    @_remote_keyword
     def power_on_trace32(self, name):
-        pass
+        return self._switch_power([name], "trace32", Power.ON)
 
+    @_remote_keyword
     def power_off_trace32(self, name):
-        pass
+        return self._switch_power([name], "trace32", Power.OFF)
 
+    @_remote_keyword
     def reset_trace32(self, name):
-        pass
+        return self._reset_power([name], "trace32")
 
+    @_remote_keyword
     def read_term_and_compare(self, name, keywords: list):
         ret = 0
         matchAll = False
@@ -234,7 +563,430 @@ class VerificationLibrary:
 
         return [ret, matchAll]
 
-    def wait_until_not_running(self, name, timeout = 300):
+    @_remote_keyword
+    def classify_term_failures(self, name):
+        """Read the TERM view and classify the failures found in it with
+           the signatures of the DUT project
+
+        Args:
+            name (str): Name of the test platform
+
+        Returns:
+            [ret, failures]: failures is category -> matched lines
+        """
+        ret = 0
+        failures = {}
+        tp = self.get_test_platform_by_name(name)
+        if tp is None:
+            ret = -errno.EINVAL
+            logger.error(f"Failed to find DUT with name {name}!", html = False)
+        else:
+            [ret, content, offset] = tp.trace32.read_window()
+            if ret == 0:
+                library = get_signature_library(tp.dut.project)
+                failures = library.classify(content)
+                for category, lines in failures.items():
+                    logger.warn(f"{name}: {category} - {lines[0]}", html = False)
+        return [ret, failures]
+
+    @_remote_keyword
+    def wait_for_term_keywords(self, name, keywords: list, timeout = 1200, interval = 2):
+        """Poll the TERM view until all the keywords are found. The new
+           contents are classified on the way, the wait is aborted as soon
+           as a fatal failure signature shows up instead of running until
+           the timeout
+
+        Args:
+            name (str): Name of the test platform
+            keywords (list): Keywords which should all be found
+            timeout (int): Seconds to wait
+            interval (float): Seconds between two reads of the TERM view
+
+        Returns:
+            0: All keywords found
+            -EIO: A fatal failure signature is found
+            -ETIMEDOUT: Not all keywords found before the timeout
+        """
+        tp = self.get_test_platform_by_name(name)
+        if tp is None:
+            logger.error(f"Failed to find DUT with name {name}!", html = False)
+            return -errno.EINVAL
+
+        keywordsSet = set(keywords)
+        classifier = FailureClassifier(get_signature_library(tp.dut.project))
+        offset = 0
+        lastContent = ""
+        start = time.time()
+        bus = running_event_bus(tp.trace32)
+        if bus is not None:
+            return self._wait_for_term_events(name, bus, keywordsSet, classifier, \
+                                              float(timeout))
+        while True:
+            [ret, content, offset] = tp.trace32.read_window("TERM.HARDCOPY", offset)
+            if ret != 0:
+                return ret
+
+            # Keep the previous piece so keywords across two reads are found
+            currentContent = lastContent + content
+            lastContent = content
+            for keyword in keywordsSet.copy():
+                if keyword in currentContent:
+                    keywordsSet.remove(keyword)
+            if not keywordsSet:
+                return 0
+
+            classifier.feed(content)
+            if classifier.fatal is not None:
+                lines = classifier.failures[classifier.fatal]
+                logger.error(f"{name}: {classifier.fatal} detected, abort! "\
+                             f"{lines[0]}", html = False)
+                return -errno.EIO
+
+            if time.time() - start >= float(timeout):
+                logger.error(f"Wait keywords {keywordsSet} timeout!", html = False)
+                return -errno.ETIMEDOUT
+            time.sleep(float(interval))
+
+    def _wait_for_term_events(self, name, bus, keywordsSet, classifier, timeout):
+        # Same checks as the polling loop, fed by the event bus
+        events = bus.subscribe_term(None)
+        try:
+            lastContent = ""
+            deadline = time.time() + timeout
+            while True:
+                event = events.get(max(deadline - time.time(), 0))
+                if event is None:
+                    logger.error(f"Wait keywords {keywordsSet} timeout!", html = False)
+                    return -errno.ETIMEDOUT
+
+                currentContent = lastContent + event.data
+                lastContent = event.data
+                for keyword in keywordsSet.copy():
+                    if keyword in currentContent:
+                        keywordsSet.remove(keyword)
+                if not keywordsSet:
+                    return 0
+
+                classifier.feed(event.data)
+                if classifier.fatal is not None:
+                    lines = classifier.failures[classifier.fatal]
+                    logger.error(f"{name}: {classifier.fatal} detected, abort! "\
+                                 f"{lines[0]}", html = False)
+                    return -errno.EIO
+
+                if time.time() >= deadline:
+                    logger.error(f"Wait keywords {keywordsSet} timeout!", html = False)
+                    return -errno.ETIMEDOUT
+        finally:
+            events.close()
+
+    ################################################################
+    # Event bus:
+    #     -- Start: Poll the trace32 of a platform once for all the
+    #               keywords, captures and the watchdog
+    #     -- Stop : Go back to the polling of every keyword
+    ################################################################
+    @_remote_keyword
+    def start_event_bus(self, name, interval = 0.5):
+        """Start the event bus of a test platform. While it runs, Wait Until
+           Not Running, Wait For Term Keywords and the TERM captures use its
+           events instead of reading the trace32 themselves
+
+        Args:
+            name (str): Name of the test platform
+            interval (float): Seconds between two polls of the trace32
+
+        Returns:
+            0: success
+            -EINVAL: No such test platform
+        """
+        tp = self.get_test_platform_by_name(name)
+        if tp is None:
+            logger.error(f"Failed to find DUT with name {name}!", html = False)
+            return -errno.EINVAL
+        bus = get_event_bus(tp.trace32, name)
+        bus.interval = float(interval)
+        bus.start()
+        return 0
+
+    @_remote_keyword
+    def stop_event_bus(self, name):
+        tp = self.get_test_platform_by_name(name)
+        if tp is None:
+            logger.error(f"Failed to find DUT with name {name}!", html = False)
+            return -errno.EINVAL
+        bus = running_event_bus(tp.trace32)
+        if bus is not None:
+            bus.stop()
+        return 0
+
+    def _test_context(self):
+        """[output dir, test name] of the running test. On an agent they are
+           sent by the controller with the keywords, outside of a robot run
+           the defaults are used
+        """
+        if self._testContext is not None:
+            return self._testContext
+        try:
+            builtIn   = BuiltIn()
+            outputDir = builtIn.get_variable_value('${OUTPUT DIR}', 'results')
+            testName  = builtIn.get_variable_value('${TEST NAME}') or \
+                        builtIn.get_variable_value('${SUITE NAME}', 'suite')
+        except RobotNotRunningError:
+            [outputDir, testName] = ['results', 'suite']
+        return [outputDir, testName]
+
+    def _capture_dir(self, name, kind = 'captures'):
+        [outputDir, testName] = self._test_context()
+        return path.join(outputDir, kind, testName.replace(' ', '_'), name)
+
+    def start_term_capture(self, name, command = "TERM.HARDCOPY", \
+                           interval = 1, poll = True):
+        """Start capturing a trace32 window into a compressed archive under
+           the output directory of the current test
+
+        Args:
+            name (str): Name of the test platform
+            command (str): Window to capture, "TERM.HARDCOPY" or "AREA"
+            interval (float): Seconds between two reads of the window
+            poll (bool): Read the window in background, otherwise only the
+                         contents read by Read Term And Compare are stored
+
+        Returns:
+            0: success
+            -EINVAL: No such test platform
+            -EEXIST: A capture is already running
+        """
+        ret = 0
+        tp = self.get_test_platform_by_name(name)
+        if name in self._captures:
+            ret = -errno.EEXIST
+            logger.error(f"Capture of {name} is already running!", html = False)
+        elif self._remote is not None:
+            # The agent streams the window into the local archive
+            captureDir = self._capture_dir(name)
+            meta = {
+                'platform': name,
+                'rumi':     "",
+                'test':     path.basename(path.dirname(captureDir)),
+                'command':  command,
+            }
+            writer = CaptureWriter(captureDir, meta = meta)
+            capture = self._remote.stream(name, writer.write, command, float(interval), \
+                                          onEnd = writer.close)
+            self._captures[name] = [captureDir, writer, capture]
+            logger.info(f"Capture {command} of {name} on agent to {captureDir}", html = False)
+        elif tp is None:
+            ret = -errno.EINVAL
+            logger.error(f"Failed to find DUT with name {name}!", html = False)
+        else:
+            captureDir = self._capture_dir(name)
+            meta = {
+                'platform': name,
+                'rumi':     tp.dut.addr if tp.dut is not None else "",
+                'test':     path.basename(path.dirname(captureDir)),
+                'command':  command,
+            }
+            writer = CaptureWriter(captureDir, meta = meta)
+            bus = running_event_bus(tp.trace32)
+            if poll and bus is not None and command == "TERM.HARDCOPY":
+                capture = BusCapture(bus, writer)
+            elif poll:
+                capture = WindowCapture(tp.trace32, writer, command, float(interval))
+                capture.start()
+            else:
+                capture = None
+                tp.trace32.capture = writer
+            self._captures[name] = [captureDir, writer, capture]
+            logger.info(f"Capture {command} of {name} to {captureDir}", html = False)
+        return ret
+
+    def stop_term_capture(self, name):
+        """Stop the capture of a test platform and close the archive
+
+        Returns:
+            Path of the archive, empty if no capture is running
+        """
+        if name not in self._captures:
+            logger.warn(f"No capture running for {name}!", html = False)
+            return ""
+
+        [captureDir, writer, capture] = self._captures.pop(name)
+        if capture is not None:
+            capture.stop()
+        else:
+            tp = self.get_test_platform_by_name(name)
+            if tp is not None:
+                tp.trace32.capture = None
+            writer.close()
+        return captureDir
+
+    def grep_term_capture(self, captureDir, pattern, start = None, end = None):
+        """Search the lines of a capture archive in a time window, only the
+           chunks overlapping the window are decompressed
+
+        Args:
+            captureDir (str): Path returned by Stop Term Capture
+            pattern (str): Regular expression to search
+            start (float): Start of the window, epoch seconds
+            end (float): End of the window, epoch seconds
+
+        Returns:
+            List of the matching lines
+        """
+        start = None if start is None else float(start)
+        end   = None if end is None else float(end)
+        reader = CaptureReader(captureDir)
+        return [line for [ts, lineNo, line] in reader.grep(pattern, start, end)]
+
+    def search_term_logs(self, text, resultsDir = "results"):
+        """Find in which runs and RUMIs a string first appeared in the TERM
+           captures, new captures are indexed before searching
+
+        Args:
+            text (str): The string to search
+            resultsDir (str): Root directory of the test results
+
+        Returns:
+            List of [run, rumi, platform, test, timestamp, line]
+        """
+        index = LogIndex(resultsDir)
+        try:
+            index.update()
+            hits = index.search(text)
+        finally:
+            index.close()
+        for [run, rumi, platform, test, timestamp, line] in hits:
+            logger.info(f"{run} {rumi} {platform} {test}: {line}", html = False)
+        return hits
+
+    ################################################################
+    # Watchdog:
+    #     -- Test watchdog     : case_timeout of the settings per test
+    #     -- Operation watchdog: t32_timeout per trace32 wait, nested
+    #                            under the test watchdog
+    ################################################################
+    def _get_timeout(self, name, default):
+        return self._get_setting(name, default)
+
+    @_remote_keyword
+    def start_test_watchdog(self, name, timeout = None):
+        """Start the watchdog of the current test on a platform, when the
+           test runs over its deadline the trace32 waits in flight are
+           cancelled, a diagnostic snapshot is saved and the RUMI requests
+           and the debugger connection are released
+
+        Args:
+            name (str): Name of the test platform
+            timeout (int): Seconds, case_timeout of the settings by default
+
+        Returns:
+            0: success
+            -EINVAL: No such test platform
+        """
+        tp = self.get_test_platform_by_name(name)
+        if tp is None:
+            logger.error(f"Failed to find DUT with name {name}!", html = False)
+            return -errno.EINVAL
+
+        self.stop_test_watchdog(name)
+        if timeout is None:
+            timeout = self._get_timeout('case_timeout', 1200)
+        snapshotDir = path.join(path.dirname(self._capture_dir(name)), 'diagnostics')
+        self._testTokens[name] = self._watchdog.watch(f"{name} test", timeout, \
+            lambda token: self._on_test_expired(name, snapshotDir))
+        return 0
+
+    @_remote_keyword
+    def stop_test_watchdog(self, name):
+        token = self._testTokens.pop(name, None)
+        if token is None:
+            return 0
+        self._watchdog.release(token)
+        if not token.cancelled():
+            return 0
+
+        # The expiry was handled by the watchdog thread whose log messages
+        # robot drops, report it from here
+        [snapshotFile, error] = self._expiries.pop(name, [None, None])
+        logger.error(f"Test on {name} ran over its deadline!", html = False)
+        if snapshotFile is not None:
+            logger.error(f"Diagnostic snapshot saved to {snapshotFile}", html = False)
+        if error is not None:
+            logger.error(f"Failed to save the diagnostic snapshot, {error}", html = False)
+        return -errno.ETIMEDOUT
+
+    def _on_test_expired(self, name, snapshotDir):
+        """Run by the watchdog thread, the results are kept for
+           stop_test_watchdog to report
+        """
+        try:
+            self._expiries[name] = [self._save_diagnostics(name, snapshotDir), None]
+        except Exception as e:
+            self._expiries[name] = [None, e]
+
+    def _save_diagnostics(self, name, snapshotDir):
+        tp = self.get_test_platform_by_name(name)
+
+        # Free the RUMI connections first so the next test can use them
+        for rumi in self._activeRumis:
+            rumi.cancel()
+        self._activeRumis = []
+        for tracker in self._reloads.values():
+            tracker.cancel()
+        self._reloads = {}
+
+        if tp is None:
+            return None
+        # Every connection holds the t32api lock, the snapshot waits for
+        # the command the main thread may be running
+        snapshot = tp.trace32.get_diagnostic_snapshot()
+        bus = get_event_bus(tp.trace32, create = False)
+        if bus is not None:
+            snapshot['events'] = bus.recent()
+
+        os.makedirs(snapshotDir, exist_ok = True)
+        snapshotFile = path.join(snapshotDir, f"{name}_{int(time.time())}.json")
+        with open(snapshotFile, 'w') as sf:
+            json.dump(snapshot, sf, indent = 4)
+        return snapshotFile
+
+    def _operation(self, name, operation):
+        return self._watchdog.operation(f"{name} {operation}", \
+            self._get_timeout('t32_timeout', 300), \
+            parent = self._testTokens.get(name))
+
+    def _run_cmm_script(self, tp, scriptPath, token, onPoll = None):
+        """Run a cmm script, with the event bus of the platform running the
+           end of the script comes from its PRACTICE_DONE event instead of
+           polling the PRACTICE state again. A poll reading the window in
+           onPoll still needs the polling of the trace32.
+        """
+        bus = running_event_bus(tp.trace32)
+        if bus is None or onPoll is not None:
+            return tp.trace32.execute_cmm_script(scriptPath, cancelToken = token, \
+                                                 onPoll = onPoll)
+
+        done = bus.practiceDone
+        ret = tp.trace32.start_cmm_script(scriptPath)
+        if ret != 0:
+            return ret
+        # A script ending between two polls is never seen running, a poll
+        # started after the script did tells it is not running any more
+        after = bus.polls + 1
+        ret = bus.wait_status(lambda bus: bus.practiceDone > done or \
+            (bus.polls > after and bus.practiceState == PracticeInterpreterState.NOT_RUNNING), \
+            self._get_timeout('t32_timeout', 300), token)
+        if ret != 0:
+            tp.trace32.stop_cmm_script()
+            reason = token.reason if ret == -errno.ECANCELED else \
+                "timed out" if ret == -errno.ETIMEDOUT else "event bus stopped"
+            logger.error(f"Execute {scriptPath} cancelled, {reason}!", html = False)
+            return ret
+        return tp.trace32.get_cmm_result(scriptPath)
+
+    @_remote_keyword
+    def wait_until_not_running(self, name, timeout = None):
         ret = 0
         tp = None
 
@@ -243,10 +995,19 @@ class VerificationLibrary:
             ret = errno.EINVAL
             logger.error(f"Failed to find DUT with name {name}!", html = False)
         else:
-            ret = tp.trace32.wait_until_not_running(timeout)
+            if timeout is None:
+                timeout = self._get_timeout('t32_timeout', 300)
+            bus = running_event_bus(tp.trace32)
+            with self._operation(name, "wait until not running") as token:
+                if bus is not None:
+                    ret = bus.wait_status(lambda bus: bus.state == stateStopped, \
+                                          float(timeout), token, after = bus.polls)
+                else:
+                    ret = tp.trace32.wait_until_not_running(float(timeout), token)
 
         return ret
 
+    @_remote_keyword
     def execute_trace32_command(self, name:str, command:str):
         ret = 0
         tp = None
@@ -260,6 +1021,7 @@ class VerificationLibrary:
 
         return ret
 
+    @_remote_keyword
     def execute_cmm_script(self, name:str, scriptPath:str):
         ret = 0
         tp = None
@@ -269,26 +1031,884 @@ class VerificationLibrary:
             ret = errno.EINVAL
             logger.error(f"Failed to find DUT with name {name}!", html = False)
         else:
-            ret = tp.trace32.execute_cmm_script(scriptPath)
+            with self._operation(name, f"execute {scriptPath}") as token:
+                ret = self._run_cmm_script(tp, scriptPath, token)
 
         return ret
         
+    ################################################################
+    # CMM bundles:
+    #     -- Execute: Run a cmm script from a cached bundle of its
+    #                 nested scripts, optionally timing each of them
+    #     -- Profile: Timing of the last profiled run
+    ################################################################
+    @_remote_keyword
+    def execute_cmm_bundle(self, name, scriptPath, profile = False):
+        """Execute a cmm script from its local bundle. The nested scripts are
+           resolved and copied once, the bundle is reused until a script
+           changes
+
+        Args:
+            name (str): Name of the test platform
+            scriptPath (str): Path to the entry cmm script
+            profile (bool): Time the nested scripts, the AREA window is
+                            cleared first as the timing markers go there
+
+        Returns:
+            0: cmm script runs successfully
+            -ENOENT: The script does not exist
+        """
+        tp = self.get_test_platform_by_name(name)
+        if tp is None:
+            logger.error(f"Failed to find DUT with name {name}!", html = False)
+            return -errno.EINVAL
+
+        bundler = get_cmm_bundler(self._get_setting('cmm_bundle_dir', None), \
+                                  self._artifact_cache().fetch)
+        try:
+            manifest = bundler.bundle(scriptPath, profile)
+        except FileNotFoundError as e:
+            logger.error(f"Failed to bundle {scriptPath}, {e}!", html = False)
+            return -errno.ENOENT
+        for script, lines in manifest['unresolved'].items():
+            for line in lines:
+                logger.warn(f"{path.basename(script)}: not bundled, {line}", html = False)
+        logger.info(f"{'Reuse' if manifest['reused'] else 'Built'} bundle {manifest['key']} "\
+                    f"of {len(manifest['sources'])} files for {scriptPath}", html = False)
+
+        onPoll = None
+        if profile:
+            profiler = CmmProfiler()
+            tp.trace32.execute_command("AREA.CLEAR")
+            offset = [0]
+            def onPoll():
+                [content, offset[0]] = tp.trace32._read_window_content("AREA", offset[0])
+                if content:
+                    profiler.write(content)
+
+        with self._operation(name, f"execute {scriptPath}") as token:
+            ret = self._run_cmm_script(tp, manifest['entry'], token, onPoll)
+
+        if profile:
+            [rc, content, offset[0]] = tp.trace32.read_window("AREA", offset[0])
+            profiler.write(content + "\n")
+            self._cmmProfile = profiler.report()
+            for [script, calls, total, own] in self._cmmProfile[:10]:
+                logger.info(f"{script:40s} {calls:4d} calls  {total:8.1f}s total  "\
+                            f"{own:8.1f}s own", html = False)
+        return ret
+
+    @_remote_keyword
+    def get_cmm_profile(self):
+        """Timing of the nested scripts of the last profiled bundle
+
+        Returns:
+            List of [script, calls, total seconds, own seconds], the most
+            expensive script first
+        """
+        return self._cmmProfile
+
+    ################################################################
+    # Target snapshots:
+    #     -- Save   : Save registers and memory after a known good boot
+    #     -- Restore: Restore them instead of booting again
+    ################################################################
+    def _snapshot_cache(self):
+        if self._snapshots is None:
+            cacheDir = self._get_setting('snapshot_dir', defaultCacheDir)
+            budget = self._get_setting('snapshot_budget', 20480)
+            self._snapshots = SnapshotCache(cacheDir, int(budget) * 1024 * 1024)
+        return self._snapshots
+
+    def _snapshot_key(self, tp, image):
+        platformConfig = {
+            'project': tp.dut.project,
+            'type':    tp.dut.type,
+            'core':    vars(tp.dut.core),
+            'ddr':     vars(tp.dut.ddr),
+            'config':  tp.trace32.config,
+            'initCmm': tp.trace32.initCmm,
+        }
+        return snapshot_key(image, platformConfig)
+
+    @_remote_keyword
+    def save_target_snapshot(self, name, image, *ranges):
+        """Save the registers and memory of a booted target to the snapshot
+           cache, keyed by the image and the platform config
+
+        Args:
+            name (str): Name of the test platform
+            image (str): Name or hash of the booted image
+            ranges: Memory ranges as address:size, e.g. 0x80000000:0x200000
+
+        Returns:
+            0: success
+            -EINVAL: No such test platform or wrong range
+            <0: Failed to save the state
+        """
+        tp = self.get_test_platform_by_name(name)
+        if tp is None:
+            logger.error(f"Failed to find DUT with name {name}!", html = False)
+            return -errno.EINVAL
+
+        memoryRanges = []
+        for memoryRange in ranges:
+            try:
+                [address, size] = memoryRange.rsplit(":", 1)
+                memoryRanges.append([address, int(size, 0)])
+            except ValueError:
+                logger.error(f"Wrong memory range {memoryRange}!", html = False)
+                return -errno.EINVAL
+
+        cache = self._snapshot_cache()
+        key = self._snapshot_key(tp, image)
+        directory = cache.create(key)
+        start = time.time()
+        with self._operation(name, "save snapshot"):
+            ret = tp.trace32.save_state(directory, memoryRanges)
+        if ret != 0:
+            cache.discard(directory)
+            return ret
+
+        manifest = cache.commit(key, directory, {'image': image, 'platform': name, \
+                                                 'ranges': memoryRanges})
+        logger.info(f"Snapshot {key} of {name} saved in {time.time() - start:.1f}s, "\
+                    f"{manifest['size']} bytes", html = False)
+        return 0
+
+    @_remote_keyword
+    def restore_target_snapshot(self, name, image):
+        """Restore the snapshot saved for the image and the platform config
+
+        Args:
+            name (str): Name of the test platform
+            image (str): Name or hash of the image
+
+        Returns:
+            0: Snapshot restored, the boot can be skipped
+            -ENOENT: No snapshot cached, boot the target
+            <0: Failed to restore the snapshot
+        """
+        tp = self.get_test_platform_by_name(name)
+        if tp is None:
+            logger.error(f"Failed to find DUT with name {name}!", html = False)
+            return -errno.EINVAL
+
+        cache = self._snapshot_cache()
+        key = self._snapshot_key(tp, image)
+        manifest = cache.lookup(key)
+        if manifest is None:
+            logger.info(f"No snapshot of {image} for {name}", html = False)
+            return -errno.ENOENT
+
+        start = time.time()
+        with self._operation(name, "restore snapshot") as token:
+            ret = tp.trace32.restore_state(cache.path(key), manifest['ranges'], token)
+        if ret == 0:
+            logger.info(f"Snapshot {key} of {name} restored in "\
+                        f"{time.time() - start:.1f}s", html = False)
+        return ret
+
+    ################################################################
+    # Registers:
+    #     -- Read : Read named registers and fields in one transaction
+    #     -- Write: Write named registers and fields in one transaction
+    ################################################################
+    def _register_access(self, tp):
+        # Static registers are cached until the test changes
+        [outputDir, testName] = self._test_context()
+        if testName != self._registerCacheTest:
+            self._registerCaches = {}
+            self._registerCacheTest = testName
+        cache = self._registerCaches.setdefault(tp.name, {})
+        return RegisterAccess(tp.trace32, get_register_map(tp.dut.project), cache)
+
+    @_remote_keyword
+    def read_registers(self, name, *registers):
+        """Read registers or fields of the register map of the DUT project
+
+        Examples:
+            ${ret}    ${values}=    Read Registers    TestPlatform1
+            ...                     USB.GCTL    USB.GCTL.PRTCAPDIR
+
+        Returns:
+            [ret, values]: values is name -> value
+            -EINVAL: No such test platform, register or field
+        """
+        tp = self.get_test_platform_by_name(name)
+        if tp is None:
+            logger.error(f"Failed to find DUT with name {name}!", html = False)
+            return [-errno.EINVAL, {}]
+        try:
+            return self._register_access(tp).read(list(registers))
+        except KeyError as e:
+            logger.error(f"{name}: {e.args[0]}!", html = False)
+            return [-errno.EINVAL, {}]
+
+    @_remote_keyword
+    def write_registers(self, name, *assignments):
+        """Write registers or fields of the register map of the DUT project,
+           the registers of the fields are read once and written back
+
+        Examples:
+            Write Registers    TestPlatform1    USB.GCTL.PRTCAPDIR=1    USB.DCFG=0x80
+
+        Returns:
+            0: success
+            -EINVAL: No such test platform, register or field, or a value
+                     which does not fit
+        """
+        tp = self.get_test_platform_by_name(name)
+        if tp is None:
+            logger.error(f"Failed to find DUT with name {name}!", html = False)
+            return -errno.EINVAL
+        values = {}
+        for assignment in assignments:
+            [register, _, value] = assignment.partition('=')
+            values[register.strip()] = value.strip()
+        try:
+            return self._register_access(tp).write(values)
+        except (KeyError, ValueError) as e:
+            logger.error(f"{name}: {e.args[0]}!", html = False)
+            return -errno.EINVAL
+
+    ################################################################
+    # Image artifacts:
+    #     -- Cache   : Local copy of an image of a network share
+    #     -- Prefetch: Fetch the images of the next tests in background
+    #     -- Load    : Data.LOAD an image from its cached copy
+    ################################################################
+    def _artifact_cache(self):
+        cacheDir = self._get_setting('artifact_dir', None)
+        budget = self._get_setting('artifact_budget', 51200)
+        return get_artifact_cache(cacheDir, int(budget) * 1024 * 1024)
+
+    def cache_image(self, image):
+        """Get the cached copy of an image, fetched first if it is not cached
+           or if the image changed
+
+        Returns:
+            Path of the cached copy
+        """
+        return self._artifact_cache().fetch(image)
+
+    def prefetch_images(self, *images):
+        """Fetch images into the cache in background. The images tagged
+           image:<path> on the next tests are prefetched automatically
+        """
+        self._artifact_cache().prefetch(list(images))
+        return 0
+
+    @_remote_keyword
+    def load_image(self, name, image, format = "Elf", options = ""):
+        """Load an image with Data.LOAD from its cached copy
+
+        Args:
+            name (str): Name of the test platform
+            image (str): Path of the image
+            format (str): Format of Data.LOAD, e.g. Elf or Binary
+            options (str): Address and options after the file name
+
+        Returns:
+            0: success
+            -EINVAL: No such test platform
+            -ENOENT: No such image
+            -EIO: The image could not be cached
+        """
+        tp = self.get_test_platform_by_name(name)
+        if tp is None:
+            logger.error(f"Failed to find DUT with name {name}!", html = False)
+            return -errno.EINVAL
+        try:
+            cachedPath = self._artifact_cache().fetch(image)
+        except FileNotFoundError:
+            logger.error(f"Image {image} not exists!", html = False)
+            return -errno.ENOENT
+        except Exception as e:
+            logger.error(f"Failed to cache image {image}, {e}", html = False)
+            return -errno.EIO
+        command = f'Data.LOAD.{format} "{cachedPath}" {options}'.strip()
+        [ret, responseBuffer] = tp.trace32.execute_command(command)
+        return ret
+
+    ################################################################
+    # Multi-core run control:
+    #     -- Prepare: Open a channel to the trace32 of every core
+    #     -- Go     : Start all the cores together, report the skew
+    #     -- Halt   : Stop all the cores together, report the skew
+    #     -- Release: Close the channels
+    ################################################################
+    @_remote_keyword
+    def prepare_cores(self, *names):
+        """Open a channel to the trace32 of the test platforms of the cores,
+           Go and Break are later issued in the given order
+
+        Examples:
+            Prepare Cores    APSS_ARM    RISCV    Q6
+
+        Returns:
+            0: All the channels are open
+            -EINVAL: No such test platform
+        """
+        cores = {}
+        for name in names:
+            tp = self.get_test_platform_by_name(name)
+            if tp is None:
+                logger.error(f"Failed to find DUT with name {name}!", html = False)
+                return -errno.EINVAL
+            cores[name] = tp.trace32
+
+        self.release_cores()
+        runControl = RunControl(cores)
+        ret = runControl.prepare()
+        if ret == 0:
+            self._runControl = runControl
+        return ret
+
+    @_remote_keyword
+    def go_cores(self):
+        """Start the prepared cores together
+
+        Returns:
+            [ret, skew]: skew in milliseconds between the first and the
+                         last core
+        """
+        if self._runControl is None:
+            logger.error(f"No cores prepared, use Prepare Cores first!", html = False)
+            return [-errno.ENOTCONN, None]
+        [ret, report] = self._runControl.go()
+        return [ret, report['skew'] if report else None]
+
+    @_remote_keyword
+    def halt_cores(self, timeout = 10):
+        """Stop the prepared cores together and wait until all are stopped
+
+        Returns:
+            [ret, skew]: skew in milliseconds between the first and the
+                         last core
+        """
+        if self._runControl is None:
+            logger.error(f"No cores prepared, use Prepare Cores first!", html = False)
+            return [-errno.ENOTCONN, None]
+        [ret, report] = self._runControl.halt(float(timeout))
+        return [ret, report['skew'] if report else None]
+
+    @_remote_keyword
+    def get_core_skew(self):
+        """Skew report of the last Go or Halt: skew, bound and the offset of
+           every core in milliseconds
+        """
+        if self._runControl is None:
+            return None
+        return self._runControl.lastSkew
+
+    @_remote_keyword
+    def release_cores(self):
+        if self._runControl is not None:
+            self._runControl.release()
+            self._runControl = None
+        return 0
+
+    ################################################################
+    # Symbols:
+    #     -- Load      : Index the symbols of the ELF image of a DUT
+    #     -- Resolve   : Symbol to address and back, locally
+    #     -- Breakpoint: Set a breakpoint on a resolved address
+    #     -- Variable  : Read a variable at its resolved address
+    ################################################################
+    @_remote_keyword
+    def load_symbols(self, name, image = None):
+        """Index the symbols of the ELF image of a test platform, the index
+           of a build is made once and reused by the later runs
+
+        Args:
+            name (str): Name of the test platform
+            image (str): Path of the ELF, relative to the src of the DUT,
+                         the src itself by default
+
+        Returns:
+            0: success
+            -EINVAL: No such test platform or not an ELF image
+            -ENOENT: No such image
+        """
+        tp = self.get_test_platform_by_name(name)
+        if tp is None:
+            logger.error(f"Failed to find DUT with name {name}!", html = False)
+            return -errno.EINVAL
+        elfPath = tp.dut.src if image is None else path.join(tp.dut.src, image)
+        try:
+            self._symbols[name] = get_symbol_index(elfPath)
+        except FileNotFoundError:
+            logger.error(f"Image {elfPath} not exists!", html = False)
+            return -errno.ENOENT
+        except (ValueError, struct.error) as e:
+            logger.error(f"Failed to read symbols of {elfPath}, {e}!", html = False)
+            return -errno.EINVAL
+        logger.info(f"{self._symbols[name].count} symbols of {elfPath}", html = False)
+        return 0
+
+    def _resolve(self, name, location):
+        """Address of "symbol", "symbol+offset" or a number, None if unknown"""
+        index = self._symbols.get(name)
+        [symbol, _, offset] = str(location).partition('+')
+        try:
+            return int(symbol, 0) + (int(offset, 0) if offset else 0)
+        except ValueError:
+            pass
+        found = None if index is None else index.lookup(symbol.strip())
+        if found is None:
+            logger.error(f"{name}: unknown symbol {symbol}, "\
+                         f"{'load the symbols first' if index is None else 'not in the image'}!", \
+                         html = False)
+            return None
+        return found[0] + (int(offset, 0) if offset else 0)
+
+    @_remote_keyword
+    def resolve_symbol(self, name, symbol):
+        """Returns:
+            [ret, address]: -EINVAL if the symbol is unknown
+        """
+        address = self._resolve(name, symbol)
+        return [-errno.EINVAL, 0] if address is None else [0, address]
 
+    @_remote_keyword
+    def symbolize_address(self, name, address):
+        """Name of an address, e.g. "main+0x10", the address if unknown"""
+        address = int(str(address), 0)
+        index = self._symbols.get(name)
+        found = None if index is None else index.symbolize(address)
+        if found is None:
+            return f"{address:#x}"
+        return found[0] if found[1] == 0 else f"{found[0]}+{found[1]:#x}"
+
+    @_remote_keyword
+    def set_breakpoint(self, name, location):
+        """Set a breakpoint, the location is resolved with the loaded symbols
+
+        Args:
+            name (str): Name of the test platform
+            location (str): "symbol", "symbol+offset" or an address
+        """
+        tp = self.get_test_platform_by_name(name)
+        if tp is None:
+            logger.error(f"Failed to find DUT with name {name}!", html = False)
+            return -errno.EINVAL
+        address = self._resolve(name, location)
+        if address is None:
+            return -errno.EINVAL
+        [ret, responseBuffer] = tp.trace32.execute_command(f"Break.Set {address:#x}")
+        return ret
+
+    @_remote_keyword
+    def read_variable(self, name, symbol, size = None):
+        """Read a variable at its resolved address
+
+        Args:
+            name (str): Name of the test platform
+            symbol (str): "symbol", "symbol+offset" or an address
+            size (int): Bytes to read, the size of the symbol by default
+
+        Returns:
+            [ret, value]: value is an int for 1, 2, 4 or 8 bytes, otherwise
+                          the hex string of the bytes
+        """
+        tp = self.get_test_platform_by_name(name)
+        if tp is None:
+            logger.error(f"Failed to find DUT with name {name}!", html = False)
+            return [-errno.EINVAL, 0]
+        address = self._resolve(name, symbol)
+        if address is None:
+            return [-errno.EINVAL, 0]
+        index = self._symbols.get(name)
+        if size is None:
+            found = None if index is None else index.lookup(str(symbol).partition('+')[0].strip())
+            size = found[1] if found is not None and found[1] else 4
+        size = int(size)
+
+        [ret, contents] = tp.trace32.read_memory_blocks([[address, size]])
+        if ret != 0:
+            return [ret, 0]
+        if size not in (1, 2, 4, 8):
+            return [0, contents[0].hex()]
+        byteOrder = 'big' if index is not None and index.bigEndian else 'little'
+        return [0, int.from_bytes(contents[0], byteOrder)]
+
+    ################################################################
+    # Sampling:
+    #     -- Start : Read variables, counters or registers at a fixed rate
+    #                over a trace32 channel kept open
+    #     -- Stop  : Stop the sampling, returns the statistics
+    #     -- Stats : Statistics of the samples so far
+    #     -- Export: All the samples to a CSV or a Parquet file
+    ################################################################
+    def _sample_channel(self, tp, spec):
+        """SampleChannel of "register", "register.field", "symbol",
+           "symbol+offset" or an address, with an optional ":size"
+        """
+        [location, _, size] = str(spec).partition(':')
+        location = location.strip()
+        try:
+            [register, shift, mask] = get_register_map(tp.dut.project).resolve(location)
+            return SampleChannel(location, register.address, register.size, \
+                                 shift = shift, mask = mask)
+        except (KeyError, OSError):
+            pass
+
+        address = self._resolve(tp.name, location)
+        if address is None:
+            return None
+        index = self._symbols.get(tp.name)
+        if not size:
+            found = None if index is None else index.lookup(location.partition('+')[0].strip())
+            size = found[1] if found is not None and 0 < found[1] <= 8 else 4
+        byteOrder = 'big' if index is not None and index.bigEndian else 'little'
+        return SampleChannel(location, address, int(size), byteOrder)
+
+    @_remote_keyword
+    def start_sampler(self, name, rate, *variables):
+        """Start sampling variables of a DUT at a fixed rate, the samples are
+           spilled under the output directory of the current test
+
+        Examples:
+            Start Sampler    TestPlatform1    1000    rxBytes    txBytes:8
+            ...              TIMER.COUNT      0x0C000010:4
+
+        Args:
+            name (str): Name of the test platform
+            rate (float): Samples per second
+            variables: Registers, fields, symbols or addresses, ":size" gives
+                       the bytes of a symbol or an address, 4 by default
+
+        Returns:
+            0: The sampler is running
+            -EINVAL: No such test platform or an unknown variable
+            -EBUSY: A sampler of the platform is running
+        """
+        tp = self.get_test_platform_by_name(name)
+        if tp is None:
+            logger.error(f"Failed to find DUT with name {name}!", html = False)
+            return -errno.EINVAL
+        if name in self._samplers and self._samplers[name].running:
+            logger.error(f"{name}: a sampler is already running!", html = False)
+            return -errno.EBUSY
+
+        channels = []
+        for spec in variables:
+            channel = self._sample_channel(tp, spec)
+            if channel is None:
+                return -errno.EINVAL
+            channels.append(channel)
+        if not channels or float(rate) <= 0:
+            logger.error(f"{name}: nothing to sample at {rate} per second!", html = False)
+            return -errno.EINVAL
+
+        capacity = int(self._get_setting('sample_capacity', 65536))
+        store = SampleStore(self._capture_dir(name, 'samples'), \
+                            [channel.name for channel in channels], capacity)
+        sampler = Sampler(tp.trace32, channels, float(rate), store)
+        ret = sampler.start()
+        if ret != 0:
+            store.close()
+            return ret
+        self._samplers[name] = sampler
+        logger.info(f"{name}: sampling {len(channels)} variables at {rate}/s "\
+                    f"in {len(sampler._blocks)} blocks", html = False)
+        return 0
+
+    def _sampler_stats(self, sampler):
+        stats = sampler.store.stats()
+        stats['sampler'] = {'samples': sampler.store.count, 'missed': sampler.missed, \
+                            'errors': sampler.errors}
+        return stats
+
+    @_remote_keyword
+    def stop_sampler(self, name):
+        """Stop the sampler of a platform
+
+        Returns:
+            [ret, stats]: see Get Sampler Stats
+        """
+        sampler = self._samplers.get(name)
+        if sampler is None:
+            logger.error(f"{name}: no sampler started!", html = False)
+            return [-errno.EINVAL, {}]
+        sampler.stop()
+        return [0, self._sampler_stats(sampler)]
+
+    @_remote_keyword
+    def get_sampler_stats(self, name):
+        """Statistics of the samples so far, the sampler keeps running
+
+        Returns:
+            [ret, stats]: variable -> count, min, max, mean, std and rate
+                          (change per second), plus the samples, missed
+                          ticks and failed reads under 'sampler'
+        """
+        sampler = self._samplers.get(name)
+        if sampler is None:
+            logger.error(f"{name}: no sampler started!", html = False)
+            return [-errno.EINVAL, {}]
+        return [0, self._sampler_stats(sampler)]
+
+    @_remote_keyword
+    def export_samples(self, name, outputPath):
+        """Write the samples of a platform to a .csv or a .parquet file,
+           Parquet needs pyarrow
+
+        Returns:
+            [ret, rows]
+        """
+        sampler = self._samplers.get(name)
+        if sampler is None:
+            logger.error(f"{name}: no sampler started!", html = False)
+            return [-errno.EINVAL, 0]
+        try:
+            rows = sampler.store.export(outputPath)
+        except RuntimeError as e:
+            logger.error(f"{name}: {e}!", html = False)
+            return [-errno.ENOSYS, 0]
+        logger.info(f"{name}: {rows} samples written to {outputPath}", html = False)
+        return [0, rows]
+
+    ################################################################
+    # Trace export:
+    #     -- Export: Stream the trace buffer into a compact trace file
+    #     -- Info  : Records, chunks and description of a trace file
+    #     -- Read  : Some records of a trace file
+    ################################################################
+    @_remote_keyword
+    def export_trace(self, name, outputPath = None, mask = 0x3, traceType = 0, \
+                     chunkRecords = 16384):
+        """Read the trace buffer of a DUT in chunks into a trace file, see
+           utils.trace_file to iterate it
+
+        Args:
+            name (str): Name of the test platform
+            outputPath (str): Trace file, trace.qtrc under the output
+                              directory of the current test by default
+            mask (int): Items of a record given to T32_ReadTrace, 4 bytes
+                        per item
+            traceType (int): tracetype of T32_ReadTrace, 0 for the trace
+            chunkRecords (int): Records read and compressed at once
+
+        Returns:
+            [ret, outputPath]
+            -EINVAL: No such test platform or an empty mask
+        """
+        tp = self.get_test_platform_by_name(name)
+        if tp is None:
+            logger.error(f"Failed to find DUT with name {name}!", html = False)
+            return [-errno.EINVAL, None]
+        mask = int(str(mask), 0)
+        if mask == 0:
+            logger.error(f"{name}: no item selected by the trace mask!", html = False)
+            return [-errno.EINVAL, None]
+        if outputPath is None:
+            outputPath = path.join(self._capture_dir(name, 'traces'), "trace.qtrc")
+
+        meta = {'platform': name, 'time': time.time()}
+        writer = TraceWriter(outputPath, tp.trace32.trace_record_size(mask), mask, \
+                             int(traceType), meta)
+        start = time.time()
+        with self._operation(name, "export trace") as token:
+            [ret, records] = tp.trace32.export_trace(writer, int(traceType), mask, \
+                                                      int(chunkRecords), cancelToken = token)
+        if ret != 0:
+            writer.abort()
+            return [ret, None]
+        writer.close()
+        logger.info(f"{name}: {records} trace records exported to {outputPath} "\
+                    f"in {time.time() - start:.1f}s, {path.getsize(outputPath)} bytes", \
+                    html = False)
+        return [0, outputPath]
+
+    @_remote_keyword
+    def get_trace_file_info(self, tracePath):
+        """Returns:
+            Dict: records, chunks, recordSize, mask, traceType, the number of
+                  the first record and the description
+        """
+        with TraceReader(tracePath) as reader:
+            return reader.info()
+
+    @_remote_keyword
+    def read_trace_records(self, tracePath, start = None, count = 100):
+        """Read some records of a trace file, only the chunks holding them
+           are decompressed
+
+        Returns:
+            List of [record number, items]
+        """
+        start = None if start is None else int(start)
+        records = []
+        with TraceReader(tracePath) as reader:
+            for [number, items] in reader.records_between(start):
+                if len(records) >= int(count):
+                    break
+                records.append([number, list(items)])
+        return records
+
+    ################################################################
+    # Golden logs:
+    #     -- TERM: Compare the TERM view with a golden log
+    #     -- Log : Compare a log file with a golden log
+    ################################################################
+    def _report_golden_diff(self, what, goldenFile, result):
+        if result['equal']:
+            logger.info(f"{what}: {result['matched']} lines match {goldenFile}", html = False)
+            return 0
+        logger.error(f"{what}: differs from {goldenFile}, {result['changed']} changed, "\
+                     f"{result['added']} added, {result['missing']} missing lines, "\
+                     f"first difference:\n{format_hunk(result['first'])}", html = False)
+        for hunk in result['hunks'][1:]:
+            logger.info(format_hunk(hunk), html = False)
+        return -errno.EBADMSG
+
+    @_remote_keyword
+    def compare_term_with_golden(self, name, goldenFile, window = 256):
+        """Compare the TERM view of a DUT with a golden log, both are
+           streamed and normalized by the rules of the DUT project
+
+        Args:
+            name (str): Name of the test platform
+            goldenFile (str): Path of the golden log
+            window (int): Lines looked ahead to align the logs after a
+                          difference
+
+        Returns:
+            [ret, result]: result holds the counts of matched, changed,
+                           added and missing lines, the first difference
+                           and the first hunks
+            -EBADMSG: The TERM view differs from the golden log
+        """
+        tp = self.get_test_platform_by_name(name)
+        if tp is None:
+            logger.error(f"Failed to find DUT with name {name}!", html = False)
+            return [-errno.EINVAL, {}]
+        diff = GoldenDiff(get_normalizer(tp.dut.project), int(window))
+        try:
+            result = diff.compare(iter_lines(tp.trace32.iter_window("TERM.HARDCOPY")), \
+                                  file_lines(goldenFile))
+        except ConnectionError as e:
+            logger.error(f"{name}: {e}!", html = False)
+            return [-errno.EHOSTUNREACH, {}]
+        return [self._report_golden_diff(name, goldenFile, result), result]
+
+    def compare_log_with_golden(self, logFile, goldenFile, project = "common", window = 256):
+        """Compare a log file, e.g. a saved TERM log, with a golden log
+
+        Returns:
+            [ret, result]: see Compare Term With Golden
+        """
+        diff = GoldenDiff(get_normalizer(project), int(window))
+        result = diff.compare(file_lines(logFile), file_lines(goldenFile))
+        return [self._report_golden_diff(logFile, goldenFile, result), result]
+
+    @_remote_keyword
     def get_trace32_view_message(self, name):
         str = ""
         return str
 
     """
-        Interfaces to control dut
+        Interfaces to control dut, the outlets of several DUTs on the same
+        PDU are switched by a single request
     """
-    def power_on_dut(self, name):
-        pass
+    @_remote_keyword
+    def power_on_dut(self, *names):
+        return self._switch_power(names, "dut", Power.ON)
 
-    def power_off_dut(self, name):
-        pass
+    @_remote_keyword
+    def power_off_dut(self, *names):
+        return self._switch_power(names, "dut", Power.OFF)
 
-    def reset_dut(self, name):
-        pass
+    @_remote_keyword
+    def reset_dut(self, *names):
+        """Power off the DUTs, wait the off delay of their APC, then power
+           them on again
+
+        Returns:
+            0 if all the DUTs are reset, the first error otherwise
+        """
+        return self._reset_power(names, "dut")
+
+    @_remote_keyword
+    def reset_platforms(self, *names, stagger = 2, pduLimit = 2, **rumiIds):
+        """Reset many test platforms in parallel: power off, off delay, power
+           on, JTAG reset of their RUMI and trace32 reattach. At most
+           pduLimit outlets of a PDU are powered on together and a RUMI host
+           runs one command at a time, the critical path is logged
+
+        Args:
+            names: Names of the test platforms
+            stagger (float): Seconds between two power on of the same PDU
+            pduLimit (int): Outlets of a PDU powered on at the same time
+            rumiIds: platform name=RUMI id, e.g. tp1=7558, the JTAG of the
+                     RUMI is reset after the power on
+
+        Returns:
+            0 if all the platforms are reset, the first error otherwise
+        """
+        sequencer = PowerSequencer({"pdu": int(pduLimit)})
+        for name in names:
+            tp = self.get_test_platform_by_name(name)
+            if tp is None:
+                logger.error(f"Failed to find DUT with name {name}!", html = False)
+                return -errno.EINVAL
+            rumi = None
+            if name in rumiIds:
+                rumi = (self._rumis or {}).get(str(rumiIds[name]))
+                if rumi is None:
+                    logger.error(f"Unknown RUMI {rumiIds[name]} of {name}!", html = False)
+                    return -errno.EINVAL
+            add_platform_reset(sequencer, tp, rumi, float(stagger))
+
+        ret = sequencer.run()
+        logger.info(sequencer.report(), html = False)
+        return ret
+
+    @_remote_keyword
+    def get_dut_power_status(self, name):
+        """Read the power status of the DUT outlet from the PDU
+
+        Returns:
+            "ON", "OFF" or "UNKNOWN" if the PDU could not be read
+        """
+        apcs = self._get_apcs([name], "dut")
+        if apcs is None:
+            return "UNKNOWN"
+        status = apcs[0].read_status()
+        return "UNKNOWN" if status is None else status.name
+
+    def _get_apcs(self, names, owner):
+        apcs = []
+        for name in names:
+            tp = self.get_test_platform_by_name(name)
+            if tp is None:
+                logger.error(f"Failed to find DUT with name {name}!", html = False)
+                return None
+            apc = tp.dut.apc if owner == "dut" else tp.trace32.apc
+            if apc is None:
+                logger.error(f"No APC for the {owner} of {name}!", html = False)
+                return None
+            apcs.append(apc)
+        return apcs
+
+    def _switch_power(self, names, owner, status):
+        apcs = self._get_apcs(names, owner)
+        if apcs is None:
+            return -errno.EINVAL
+        results = APC.switch_all(apcs, status)
+        return next((ret for ret in results.values() if ret != 0), 0)
+
+    def _reset_power(self, names, owner):
+        apcs = self._get_apcs(names, owner)
+        if apcs is None:
+            return -errno.EINVAL
+        ret = self._switch_power(names, owner, Power.OFF)
+        if ret != 0:
+            return ret
+        time.sleep(max(apc.offDelay for apc in apcs))
+        return self._switch_power(names, owner, Power.ON)
 
     def sleep_for_seconds(self, seconds: int):
         ret = 0
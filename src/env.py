@@ -19,4 +19,20 @@ settingsFile = "settings.json"
 settingsFile = os.path.join(configPath, settingsFile)
 
 # Constants and enum variables
-CORE = Enum('CORE', ('APSS', 'RISCV', 'Q6'))
\ No newline at end of file
+CORE = Enum('CORE', ('APSS', 'RISCV', 'Q6'))
+
+# Chip configure file, holds the trace32 tool paths
+chipConfigFile = "chip_config.json"
+chipConfigFile = os.path.join(configPath, chipConfigFile)
+
+# Trace32 config file suffix and trace32 app key of each core
+coreConfigSuffix = {
+    CORE.APSS:  "arm",
+    CORE.RISCV: "riscv",
+    CORE.Q6:    "riscv_q6",
+}
+coreT32AppKey = {
+    CORE.APSS:  "apss_app",
+    CORE.RISCV: "riscv_app",
+    CORE.Q6:    "q6_app",
+}
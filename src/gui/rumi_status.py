@@ -0,0 +1,123 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   rumi_status.py
+@Time        :   2024/04/15 11:03:26
+@Author      :   Shiqi Duan
+@Description :   Live status of the RUMI farm shown by the GUI. The RUMIs
+                 are probed concurrently with a TCP connect and their state
+                 (idle, leased, reloading, down) is kept in a board.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import time
+import threading
+
+from utils.health import get_health_monitor, probe_tcp
+
+# Seconds a RUMI is considered reloading after a reload request, the test
+# suites wait the same amount of time
+reloadPeriod = 300
+
+class RumiState:
+    IDLE      = "idle"
+    LEASED    = "leased"
+    RELOADING = "reloading"
+    DOWN      = "down"
+    UNKNOWN   = "unknown"
+
+def probe_rumi(ip, port, timeout = 2):
+    """Check whether the RUMI server accepts connections, the result also
+       feeds the circuit breaker of the RUMI
+
+    Returns:
+        Latency of the connection in milliseconds, None if unreachable
+    """
+    latency = probe_tcp(ip, port, timeout)
+    get_health_monitor().record(ip, port, latency)
+    return latency
+
+#----------------------------------------------------------------
+# RUMI status board
+#----------------------------------------------------------------
+class RumiStatus:
+    """
+    Status of a single RUMI.
+
+    Attributes:
+        name      (str)   : RUMI id, e.g. 7558
+        rumi      (RUMI)  : The RUMI object
+        reachable (bool)  : Result of the last probe, None before probing
+        latency   (float) : Last probe latency in milliseconds
+        leased    (bool)  : The RUMI is selected for the current session
+        reloadAt  (float) : time.time() of the last reload request
+    """
+    def __init__(self, name, rumi):
+        self.name      = name
+        self.rumi      = rumi
+        self.reachable = None
+        self.latency   = None
+        self.leased    = False
+        self.reloadAt  = None
+
+    @property
+    def state(self):
+        if self.reloadAt is not None and time.time() - self.reloadAt < reloadPeriod:
+            return RumiState.RELOADING
+        if self.reachable is None:
+            return RumiState.UNKNOWN
+        if not self.reachable:
+            return RumiState.DOWN
+        return RumiState.LEASED if self.leased else RumiState.IDLE
+
+class RumiStatusBoard:
+    """
+    A class holding the status of every RUMI of the farm.
+
+    Methods:
+        probe(self, name: str):
+            Probe a RUMI, blocking, the board is safe to probe concurrently
+        lease(self, name: str):
+            Mark a RUMI as the one used by the session
+        mark_reloading(self, name: str):
+            Record a reload request
+
+    Usage:
+        board = RumiStatusBoard(rumis)
+        for name in board.status:
+            executor.submit(board.probe, name)
+    """
+    def __init__(self, rumis):
+        self._lock = threading.Lock()
+        self.status = {}
+        for name, rumi in (rumis or {}).items():
+            if rumi is not None:
+                self.status[name] = RumiStatus(name, rumi)
+
+    def probe(self, name):
+        """Probe a RUMI and update its status, blocking, run it in a worker"""
+        rumiStatus = self.status[name]
+        latency = probe_rumi(rumiStatus.rumi.ip, rumiStatus.rumi.port)
+        with self._lock:
+            rumiStatus.reachable = latency is not None
+            if latency is not None:
+                rumiStatus.latency = latency
+        return name
+
+    def lease(self, name):
+        with self._lock:
+            for rumiStatus in self.status.values():
+                rumiStatus.leased = rumiStatus.name == name
+
+    def mark_reloading(self, name):
+        with self._lock:
+            if name in self.status:
+                self.status[name].reloadAt = time.time()
+
+    def rows(self):
+        """[name, state, latency text] of all RUMIs for display"""
+        with self._lock:
+            return [[s.name, s.state, \
+                     "-" if s.latency is None else f"{s.latency:.1f} ms"] \
+                    for s in self.status.values()]
@@ -0,0 +1,89 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   worker.py
+@Time        :   2024/04/15 10:12:48
+@Author      :   Shiqi Duan
+@Description :   Background executor for the GUI. Slow jobs (network, file
+                 system, process start) run in a thread pool and their
+                 results are handed back to the Tk thread through a queue
+                 drained with root.after(), Tk widgets are never touched
+                 from a worker thread.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+class BackgroundWorker:
+    """
+    A class running jobs off the Tk thread.
+
+    Attributes:
+        root         (tk.Tk) : The Tk root window
+        pollInterval (int)   : Milliseconds between two drains of the queue
+        onError      (callable) : Called in the Tk thread with the exception
+                                  of a job submitted without onError
+
+    Methods:
+        submit(self, fn, *args, onDone = None, onError = None):
+            Run fn(*args) in the pool, onDone(result) or onError(exception)
+            is called later in the Tk thread
+        every(self, interval: int, fn):
+            Call fn in the Tk thread every interval milliseconds
+        shutdown(self):
+            Stop the pool, pending jobs are dropped
+
+    Usage:
+        worker = BackgroundWorker(root)
+        worker.submit(rumi.probe, onDone = update_status)
+    """
+    def __init__(self, root, maxWorkers = 8, pollInterval = 100, onError = None):
+        self.root = root
+        self.pollInterval = pollInterval
+        self.onError = onError
+        self._results  = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers = maxWorkers, \
+                                            thread_name_prefix = "gui-worker")
+        self._running  = True
+        self.root.after(self.pollInterval, self._drain)
+
+    def submit(self, fn, *args, onDone = None, onError = None):
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(lambda f: self._results.put([f, onDone, onError]))
+        return future
+
+    def every(self, interval, fn):
+        def tick():
+            if not self._running:
+                return
+            fn()
+            self.root.after(interval, tick)
+        self.root.after(0, tick)
+
+    def _drain(self):
+        while True:
+            try:
+                [future, onDone, onError] = self._results.get_nowait()
+            except queue.Empty:
+                break
+
+            exception = future.exception()
+            if exception is not None:
+                onError = onError or self.onError
+                if onError is not None:
+                    onError(exception)
+                else:
+                    # Reported like an exception raised by a Tk callback
+                    self.root.report_callback_exception(type(exception), exception, \
+                                                        exception.__traceback__)
+            elif onDone is not None:
+                onDone(future.result())
+
+        if self._running:
+            self.root.after(self.pollInterval, self._drain)
+
+    def shutdown(self):
+        self._running = False
+        self._executor.shutdown(wait = False, cancel_futures = True)
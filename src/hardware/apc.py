@@ -9,8 +9,14 @@
 @Contact     :   shiqduan@qti.qualcomm.com
 '''
 
+import time
+import errno
 from enum import Enum
 
+from hardware.apc_client import get_apc_session, batch_switch, batch_status, \
+                                OutletAction, APCError
+from robot.api import logger
+
 class Power(Enum):
     """
     A Enum to indicate power status
@@ -23,15 +29,19 @@ class Power(Enum):
 #----------------------------------------------------------------
 class APC:
     """
-    A class representing the APC UPS.
+    A class representing an outlet of the APC switched PDU.
 
     Attributes:
         ip (str): IP address of APC.
-        port (int): The port of the APC.
+        port (int): The outlet of the APC.
+        protocol (str): "telnet" or "snmp"
+        status (Power): Power status read back the last time
 
     Methods:
         __init__(self, ip: str, port: int):
             Initializes a new APC object with the specified ip and pprt.
+        read_status(self):
+            Read the power status from the PDU
         power_on(self):
             Turn on the APC
         power_off(self):
@@ -42,40 +52,109 @@ class APC:
     Usage:
         apc = APC('10.21.10.81', 5)
     """
-    def __init__(self, ip = "0.0.0.0", port = 5, timeout = 300):
+    def __init__(self, ip = "0.0.0.0", port = 5, timeout = 300, protocol = "telnet", \
+                 user = "apc", password = "apc", community = "private", \
+                 pduPort = None, offDelay = 5):
         self.ip = ip
         self.port = port
         self.timeout = timeout
         self.status = Power.ON
 
+        self.protocol  = protocol
+        self.user      = user
+        self.password  = password
+        self.community = community
+        self.pduPort   = pduPort
+        self.offDelay  = offDelay
+
     def __str__(self) -> str:
         apcInfo = f"APC:\n"\
                       f"  ip: {self.ip}\n"\
                       f"  port: {self.port}\n"
         return apcInfo
 
-    def is_power_on(self) -> bool:
-        """
-        Currently we simply check the power status by a variable, it's better
-        to get status through the APC command
+    @property
+    def session(self):
+        """The session shared by all the outlets of the PDU"""
+        if self.protocol == "snmp":
+            options = {"community": self.community}
+        else:
+            options = {"user": self.user, "password": self.password}
+        if self.pduPort is not None:
+            options["port"] = self.pduPort
+        return get_apc_session(self.ip, self.protocol, timeout = min(self.timeout, 30), \
+                               **options)
+
+    def read_status(self):
+        """Read the power status of the outlet from the PDU
+
+        Returns:
+            Power, None if the PDU could not be read
         """
-        return self.status == Power.ON
+        try:
+            states = self.session.status([self.port])
+        except (OSError, APCError) as e:
+            logger.error(f"Read outlet {self.port} of PDU {self.ip} failed, {e}", \
+                         html = False)
+            return None
+        self.status = Power.ON if states[self.port] else Power.OFF
+        return self.status
+
+    def is_power_on(self) -> bool:
+        return self.read_status() == Power.ON
+
+    def _switch(self, action, status):
+        try:
+            self.session.switch([self.port], action)
+        except (OSError, APCError) as e:
+            logger.error(f"Switch {action} outlet {self.port} of PDU {self.ip} "\
+                         f"failed, {e}", html = False)
+            return -errno.EIO
+        self.status = status
+        return 0
 
     def power_on(self):
-        if self.is_power_on():
-            return 0
-        else:
-            pass
+        return self._switch(OutletAction.ON, Power.ON)
 
     def power_off(self):
-        if not self.is_power_on():
-            return 0
-        else:
-            pass
+        return self._switch(OutletAction.OFF, Power.OFF)
 
     def reset(self):
-        self.power_off()
-        self.power_on()
+        ret = self.power_off()
+        if ret != 0:
+            return ret
+        time.sleep(self.offDelay)
+        return self.power_on()
+
+    @staticmethod
+    def switch_all(apcs, status):
+        """Switch the outlets of many APCs, one request per PDU
+
+        Returns:
+            Dict: APC -> 0 or -errno
+        """
+        action = OutletAction.ON if status == Power.ON else OutletAction.OFF
+        results = batch_switch(apcs, action)
+        for apc, ret in results.items():
+            if ret == 0:
+                apc.status = status
+        return results
+
+    @staticmethod
+    def read_status_all(apcs):
+        """Read the power status of many APCs, one request per PDU
+
+        Returns:
+            Dict: APC -> Power, None if the PDU could not be read
+        """
+        results = {}
+        for apc, on in batch_status(apcs).items():
+            if on is None:
+                results[apc] = None
+            else:
+                apc.status = Power.ON if on else Power.OFF
+                results[apc] = apc.status
+        return results
 
     @classmethod
     def create_object_from_json(cls, config):
@@ -0,0 +1,399 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   apc_client.py
+@Time        :   2024/04/22 10:14:40
+@Author      :   Shiqi Duan
+@Description :   Transports and sessions to control the outlets of the APC
+                 switched PDUs. A session stays logged in and is shared by
+                 all the outlets of a PDU, outlets of many DUTs are switched
+                 in a single request and the state is read back from the
+                 PDU. Telnet is built in, SNMP needs pysnmp.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import re
+import errno
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from pysnmp import hlapi as snmp
+except ImportError:
+    snmp = None
+
+from robot.api import logger
+
+dataLength = 1024
+
+class APCError(Exception):
+    pass
+
+class OutletAction:
+    ON     = "on"
+    OFF    = "off"
+    REBOOT = "reboot"
+
+#----------------------------------------------------------------
+# Telnet transport
+#----------------------------------------------------------------
+IAC  = 255
+DONT = 254
+DO   = 253
+WONT = 252
+WILL = 251
+SB   = 250
+SE   = 240
+
+# AOS command line of the switched rack PDUs
+telnetCommands = {
+    OutletAction.ON:     "olOn",
+    OutletAction.OFF:    "olOff",
+    OutletAction.REBOOT: "olReboot",
+}
+telnetResultPattern = re.compile(r"^E(\d{3}):\s*(.*)$", re.MULTILINE)
+telnetStatusPattern = re.compile(r"^\s*(\d+):\s*.*?:\s*(On|Off)\s*\**\s*$", \
+                                 re.MULTILINE | re.IGNORECASE)
+
+class TelnetTransport:
+    """
+    A class driving the telnet command line of an APC PDU.
+
+    Attributes:
+        ip       (str)   : ip of the PDU
+        port     (int)   : Telnet port, 23 by default
+        user     (str)   : Login user
+        password (str)   : Login password
+        timeout  (float) : Seconds to wait for the PDU to answer
+
+    Methods:
+        switch(self, outlets: list, action: str):
+            Switch the outlets on, off or reboot them with one command
+        status(self, outlets: list):
+            Read the state of the outlets, returns outlet -> True if on
+    """
+    prompt = b"apc>"
+
+    def __init__(self, ip, port = 23, user = "apc", password = "apc", timeout = 10):
+        self.ip       = ip
+        self.port     = port
+        self.user     = user
+        self.password = password
+        self.timeout  = timeout
+        self._sock    = None
+        self._buffer  = b""
+        self._pending = b""
+
+    def _negotiate(self, data):
+        """Strip the telnet option negotiation, every option is refused"""
+        out = bytearray()
+        i = 0
+        while i < len(data):
+            byte = data[i]
+            if byte != IAC:
+                out.append(byte)
+                i = i + 1
+                continue
+            if i + 1 >= len(data):
+                break
+            command = data[i + 1]
+            if command in (DO, DONT, WILL, WONT):
+                if i + 2 >= len(data):
+                    break
+                option = data[i + 2]
+                if command in (DO, DONT):
+                    self._sock.sendall(bytes([IAC, WONT, option]))
+                else:
+                    self._sock.sendall(bytes([IAC, DONT, option]))
+                i = i + 3
+            elif command == SB:
+                end = data.find(bytes([IAC, SE]), i)
+                if end < 0:
+                    break
+                i = end + 2
+            elif command == IAC:
+                out.append(IAC)
+                i = i + 2
+            else:
+                i = i + 2
+        # An incomplete sequence is kept for the next read
+        return [bytes(out), data[i:]]
+
+    def _read_until(self, tokens):
+        while True:
+            for token in tokens:
+                index = self._buffer.find(token)
+                if index >= 0:
+                    text = self._buffer[:index]
+                    self._buffer = self._buffer[index + len(token):]
+                    return text.decode(errors = 'replace')
+            data = self._sock.recv(dataLength)
+            if not data:
+                raise ConnectionError(f"PDU {self.ip} closed the connection")
+            [data, self._pending] = self._negotiate(self._pending + data)
+            self._buffer = self._buffer + data
+
+    def connect(self):
+        if self._sock is not None:
+            return
+        self._sock = socket.create_connection((self.ip, self.port), timeout = self.timeout)
+        self._buffer  = b""
+        self._pending = b""
+        try:
+            self._read_until([b"User Name :", b"User Name:"])
+            self._sock.sendall(f"{self.user}\r\n".encode())
+            self._read_until([b"Password  :", b"Password :", b"Password:"])
+            self._sock.sendall(f"{self.password}\r\n".encode())
+            self._read_until([self.prompt])
+        except OSError:
+            self.close()
+            raise
+
+    def close(self):
+        sock = self._sock
+        self._sock = None
+        if sock is not None:
+            try:
+                sock.sendall(b"exit\r\n")
+            except OSError:
+                pass
+            sock.close()
+
+    def execute(self, command):
+        """Run a command and return its output, an E000 result is expected"""
+        self.connect()
+        self._sock.sendall(f"{command}\r\n".encode())
+        output = self._read_until([self.prompt])
+        m = telnetResultPattern.search(output)
+        if m is None:
+            raise APCError(f"PDU {self.ip}: no result for {command}")
+        if m.group(1) != "000":
+            raise APCError(f"PDU {self.ip}: {command} failed, E{m.group(1)}: {m.group(2)}")
+        return output
+
+    def switch(self, outlets, action):
+        self.execute(f"{telnetCommands[action]} {','.join(map(str, outlets))}")
+
+    def status(self, outlets):
+        output = self.execute(f"olStatus {','.join(map(str, outlets))}")
+        states = {int(outlet): state.lower() == "on" \
+                  for [outlet, state] in telnetStatusPattern.findall(output)}
+        missing = set(outlets) - set(states)
+        if missing:
+            raise APCError(f"PDU {self.ip}: no status of outlets {sorted(missing)}")
+        return {outlet: states[outlet] for outlet in outlets}
+
+#----------------------------------------------------------------
+# SNMP transport
+#----------------------------------------------------------------
+# PowerNet-MIB rPDUOutletControlOutletCommand and rPDUOutletStatusOutletState
+snmpControlOid = "1.3.6.1.4.1.318.1.1.12.3.3.1.1.4"
+snmpStatusOid  = "1.3.6.1.4.1.318.1.1.12.3.5.1.1.4"
+snmpCommands = {
+    OutletAction.ON:     1,     # immediateOn
+    OutletAction.OFF:    2,     # immediateOff
+    OutletAction.REBOOT: 3,     # immediateReboot
+}
+snmpStateOn = 1
+
+class SNMPTransport:
+    """
+    A class controlling an APC PDU through SNMP v2c, all the outlets of a
+    batch are set or read in a single PDU.
+
+    Attributes:
+        ip        (str)   : ip of the PDU
+        port      (int)   : SNMP port, 161 by default
+        community (str)   : Write community
+        timeout   (float) : Seconds to wait for the PDU to answer
+    """
+    def __init__(self, ip, port = 161, community = "private", timeout = 10):
+        if snmp is None:
+            raise APCError("pysnmp is needed to control the PDU through SNMP")
+        self.ip        = ip
+        self.port      = port
+        self.community = community
+        self.timeout   = timeout
+        self._engine   = None
+
+    def connect(self):
+        if self._engine is None:
+            self._engine = snmp.SnmpEngine()
+
+    def close(self):
+        self._engine = None
+
+    def _run(self, command, varBinds):
+        self.connect()
+        [errorIndication, errorStatus, errorIndex, results] = next(command(
+            self._engine, snmp.CommunityData(self.community, mpModel = 1), \
+            snmp.UdpTransportTarget((self.ip, self.port), timeout = self.timeout), \
+            snmp.ContextData(), *varBinds))
+        if errorIndication:
+            raise APCError(f"PDU {self.ip}: {errorIndication}")
+        if errorStatus:
+            raise APCError(f"PDU {self.ip}: {errorStatus.prettyPrint()} at {errorIndex}")
+        return results
+
+    def switch(self, outlets, action):
+        value = snmpCommands[action]
+        self._run(snmp.setCmd, [snmp.ObjectType(snmp.ObjectIdentity( \
+            f"{snmpControlOid}.{outlet}"), snmp.Integer(value)) for outlet in outlets])
+
+    def status(self, outlets):
+        results = self._run(snmp.getCmd, [snmp.ObjectType(snmp.ObjectIdentity( \
+            f"{snmpStatusOid}.{outlet}")) for outlet in outlets])
+        return {outlet: int(value) == snmpStateOn \
+                for outlet, [oid, value] in zip(outlets, results)}
+
+transports = {
+    "telnet": TelnetTransport,
+    "snmp":   SNMPTransport,
+}
+
+#----------------------------------------------------------------
+# PDU session
+#----------------------------------------------------------------
+class APCSession:
+    """
+    A class holding the persistent connection to a PDU. The PDU runs one
+    command at a time, so the requests of all the outlets are serialized
+    by the session. A request failing on a stale connection is retried
+    once on a new one.
+
+    Methods:
+        switch(self, outlets: list, action: str):
+            Switch the outlets, returns 0 or -errno
+        status(self, outlets: list):
+            [rc, states], states is outlet -> True if on
+
+    Usage:
+        session = get_apc_session("10.21.10.81")
+        session.switch([5, 6], OutletAction.OFF)
+    """
+    def __init__(self, transport):
+        self.transport = transport
+        self._lock = threading.Lock()
+
+    def _request(self, method, *args):
+        with self._lock:
+            try:
+                return method(*args)
+            except OSError:
+                # The PDU drops idle sessions, log in again once
+                self.transport.close()
+            try:
+                return method(*args)
+            except OSError:
+                self.transport.close()
+                raise
+
+    def switch(self, outlets, action):
+        self._request(self.transport.switch, sorted(set(outlets)), action)
+
+    def status(self, outlets):
+        return self._request(self.transport.status, sorted(set(outlets)))
+
+    def close(self):
+        with self._lock:
+            self.transport.close()
+
+_sessions = {}
+_sessionsLock = threading.Lock()
+
+def get_apc_session(ip, protocol = "telnet", **options):
+    """Get the session of a PDU, sessions are shared by all the outlets
+
+    Args:
+        ip (str): ip of the PDU
+        protocol (str): "telnet" or "snmp"
+        options: port, user, password, community and timeout of the transport
+
+    Returns:
+        APCSession
+    """
+    key = (ip, protocol, options.get('port'))
+    with _sessionsLock:
+        session = _sessions.get(key)
+        if session is None:
+            options = {name: value for name, value in options.items() if value is not None}
+            session = APCSession(transports[protocol](ip, **options))
+            _sessions[key] = session
+        return session
+
+def close_apc_sessions():
+    with _sessionsLock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+#----------------------------------------------------------------
+# Batched outlet operations
+#----------------------------------------------------------------
+_executor = ThreadPoolExecutor(max_workers = 8, thread_name_prefix = "apc")
+
+def batch_switch(apcs, action):
+    """Switch the outlets of many APCs, the outlets of the same PDU are
+       switched by a single request and the PDUs are requested concurrently
+
+    Args:
+        apcs (list): APC objects
+        action (str): OutletAction
+
+    Returns:
+        Dict: APC -> 0 or -errno
+    """
+    groups = {}
+    for apc in apcs:
+        groups.setdefault(apc.session, []).append(apc)
+
+    # The workers do not log, robot drops the messages of other threads, the
+    # error text is returned and logged here once the requests are finished
+    def run(session, group):
+        try:
+            session.switch([apc.port for apc in group], action)
+            return [0, None]
+        except (OSError, APCError) as e:
+            return [-errno.EIO, f"Switch {action} outlets {[apc.port for apc in group]} "\
+                                f"of PDU {group[0].ip} failed, {e}"]
+
+    futures = {_executor.submit(run, session, group): group \
+               for session, group in groups.items()}
+    results = {}
+    for future, group in futures.items():
+        rc, error = future.result()
+        if error is not None:
+            logger.error(error, html = False)
+        for apc in group:
+            results[apc] = rc
+    return results
+
+def batch_status(apcs):
+    """Read the state of the outlets of many APCs, one request per PDU
+
+    Returns:
+        Dict: APC -> True if on, None if the PDU could not be read
+    """
+    groups = {}
+    for apc in apcs:
+        groups.setdefault(apc.session, []).append(apc)
+
+    def run(session, group):
+        try:
+            return [session.status([apc.port for apc in group]), None]
+        except (OSError, APCError) as e:
+            return [{}, f"Read outlets of PDU {group[0].ip} failed, {e}"]
+
+    futures = {_executor.submit(run, session, group): group \
+               for session, group in groups.items()}
+    results = {}
+    for future, group in futures.items():
+        states, error = future.result()
+        if error is not None:
+            logger.error(error, html = False)
+        for apc in group:
+            results[apc] = states.get(apc.port)
+    return results
@@ -9,9 +9,9 @@
 @Contact     :   shiqduan@qti.qualcomm.com
 '''
 
-from apc  import APC
-from ddr  import DDR
-from core import Core
+from hardware.apc  import APC
+from hardware.ddr  import DDR
+from hardware.core import Core
 
 #----------------------------------------------------------------
 # DUT class
@@ -0,0 +1,325 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   event_bus.py
+@Time        :   2024/04/29 09:42:18
+@Author      :   Shiqi Duan
+@Description :   Per platform event bus. A single poller per trace32 channel
+                 reads the run state, the PRACTICE state and the new TERM
+                 contents in one connection and publishes the changes to
+                 the subscribers, so the keywords, the watchdog and the log
+                 capture share the same debugger traffic.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import time
+import errno
+import enum
+import queue
+import threading
+import collections
+
+from hardware.trace32 import PracticeInterpreterState
+
+from robot.api import logger
+
+# Events kept for the diagnostics of an expired test
+recentEventCount = 200
+
+# Characters of TERM kept for the consumers subscribing late
+termTailLength = 1024 * 1024
+
+# Run state of T32_GetState once the core stopped
+stateStopped = 2
+
+class EventType(enum.Enum):
+    STATE         = "state"           # Run state changed, data is the state
+    PRACTICE      = "practice"        # PRACTICE state changed, data is the state
+    PRACTICE_DONE = "practice_done"   # A PRACTICE script finished
+    TERM          = "term"            # New TERM contents, data is the text
+    ERROR         = "error"           # The poll failed, data is the return code
+
+class Event:
+    def __init__(self, type, platform, data):
+        self.type      = type
+        self.platform  = platform
+        self.data      = data
+        self.timestamp = time.time()
+
+    def to_dict(self):
+        return {'type': self.type.value, 'platform': self.platform, \
+                'data': self.data, 'timestamp': self.timestamp}
+
+#----------------------------------------------------------------
+# Subscription
+#----------------------------------------------------------------
+class Subscription:
+    """
+    Events of a bus delivered to one consumer, either queued until get()
+    or passed to a callback in the poller thread.
+
+    Attributes:
+        types    (set)      : Event types delivered, None for all
+        callback (callable) : Called with every event instead of queueing
+
+    Usage:
+        with bus.subscribe({EventType.TERM}) as sub:
+            event = sub.get(timeout = 1)
+    """
+    def __init__(self, bus, types = None, callback = None):
+        self.bus      = bus
+        self.types    = None if types is None else set(types)
+        self.callback = callback
+        self._queue   = queue.Queue()
+
+    def _deliver(self, event):
+        if self.types is not None and event.type not in self.types:
+            return
+        if self.callback is not None:
+            self.callback(event)
+        else:
+            self._queue.put(event)
+
+    def get(self, timeout = None):
+        """Next event, None if no event came within the timeout"""
+        try:
+            return self._queue.get(timeout = timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+#----------------------------------------------------------------
+# Event bus
+#----------------------------------------------------------------
+class EventBus:
+    """
+    A class polling a trace32 channel in one background thread and
+    publishing what changed to the subscribers.
+
+    Attributes:
+        trace32  (Trace32) : The trace32 to poll
+        name     (str)     : Name of the test platform, set on the events
+        interval (float)   : Seconds between two polls
+        state    (int)     : Run state of the last poll
+        practiceState (int): PRACTICE state of the last poll
+        polls    (int)     : Number of polls done, a wait uses it to only
+                             trust the polls after a command was sent
+        practiceDone (int) : Number of PRACTICE_DONE events published
+
+    Methods:
+        subscribe(self, types = None, callback = None):
+            Add a consumer, returns its Subscription
+        wait_status(self, predicate, timeout, cancelToken = None, after = None):
+            Wait until a poll satisfies predicate(bus)
+        subscribe_term(self, callback):
+            Pass the TERM seen so far, then every new TERM content
+        recent(self):
+            The last events, for diagnostics
+
+    Usage:
+        bus = get_event_bus(tp.trace32, tp.name)
+        bus.start()
+        ret = bus.wait_status(lambda bus: bus.state == stateStopped, 300)
+    """
+    def __init__(self, trace32, name = None, interval = 0.5):
+        self.trace32  = trace32
+        self.name     = name
+        self.interval = interval
+
+        self.state         = None
+        self.practiceState = None
+        self.termOffset    = 0
+        self.termTail      = ""
+        self.polls         = 0
+        self.practiceDone  = 0
+        self.rc            = 0
+        self.error         = None
+
+        self._subscribers = []
+        self._recent      = collections.deque(maxlen = recentEventCount)
+        self._condition   = threading.Condition(threading.RLock())
+        self._stop        = threading.Event()
+        self._thread      = None
+
+    def subscribe(self, types = None, callback = None):
+        subscription = Subscription(self, types, callback)
+        with self._condition:
+            self._subscribers = self._subscribers + [subscription]
+        return subscription
+
+    def subscribe_term(self, callback):
+        """Subscribe to the TERM contents, the tail already read is passed
+           first so a late consumer sees the same as a read from offset 0"""
+        with self._condition:
+            tail = self.termTail
+            subscription = Subscription(self, {EventType.TERM}, callback)
+            if tail:
+                subscription._deliver(Event(EventType.TERM, self.name, tail))
+            self._subscribers = self._subscribers + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._condition:
+            self._subscribers = [sub for sub in self._subscribers if sub is not subscription]
+
+    def publish(self, type, data = None):
+        event = Event(type, self.name, data)
+        self._recent.append(event)
+        for subscription in self._subscribers:
+            try:
+                subscription._deliver(event)
+            except Exception as e:
+                logger.warn(f"{self.name}: event consumer failed, {e}", html = False)
+
+    def recent(self):
+        return [event.to_dict() for event in list(self._recent)]
+
+    def poll(self):
+        """Read the channel once and publish the changes
+
+        Returns:
+            0: success
+            !0: Failed to read the trace32
+        """
+        [rc, state, practiceState, content, self.termOffset] = \
+            self.trace32.read_status("TERM.HARDCOPY", self.termOffset)
+        done = False
+        if rc != 0:
+            if self.rc == 0:
+                self.publish(EventType.ERROR, rc)
+        else:
+            if state != self.state:
+                self.publish(EventType.STATE, state)
+            if practiceState != self.practiceState:
+                self.publish(EventType.PRACTICE, practiceState)
+                done = self.practiceState == PracticeInterpreterState.RUNNING \
+                    and practiceState == PracticeInterpreterState.NOT_RUNNING
+            if content:
+                with self._condition:
+                    self.termTail = (self.termTail + content)[-termTailLength:]
+                    self.publish(EventType.TERM, content)
+
+        with self._condition:
+            self.rc = rc
+            if rc == 0:
+                self.state = state
+                self.practiceState = practiceState
+            if done:
+                self.practiceDone = self.practiceDone + 1
+                self.publish(EventType.PRACTICE_DONE)
+            self.polls = self.polls + 1
+            self._condition.notify_all()
+        return rc
+
+    def wait_status(self, predicate, timeout, cancelToken = None, after = None):
+        """Wait until the state of a poll satisfies the predicate
+
+        Args:
+            predicate (callable): Called with the bus after every poll
+            timeout (float): Seconds to wait
+            cancelToken (CancelToken): Stop waiting once it is cancelled
+            after (int): Only check the polls after this one, e.g. the
+                         value of polls before a command was sent
+
+        Returns:
+            0: The predicate is true
+            -ETIMEDOUT: Not true before the timeout
+            -ECANCELED: The wait is cancelled
+            -EIO: The poller stopped on an error
+        """
+        deadline = time.monotonic() + float(timeout)
+        with self._condition:
+            while True:
+                if (after is None or self.polls > after) and self.rc == 0 and predicate(self):
+                    return 0
+                if self.error is not None:
+                    logger.error(f"{self.name}: event bus stopped, {self.error}", html = False)
+                    return -errno.EIO
+                if cancelToken is not None and cancelToken.cancelled():
+                    return -errno.ECANCELED
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return -errno.ETIMEDOUT
+                # Wake up for the cancel token even if no poll comes
+                self._condition.wait(min(remaining, self.interval * 2))
+
+    def _run(self):
+        # The poller stops on an unexpected error, the waiters fail with it
+        # instead of timing out and the keywords fall back to polling
+        try:
+            while not self._stop.is_set():
+                self.poll()
+                self._stop.wait(self.interval)
+        except Exception as e:
+            with self._condition:
+                self.error = e
+                self.publish(EventType.ERROR, str(e))
+                self._condition.notify_all()
+
+    def running(self):
+        return self._thread is not None and self.error is None
+
+    def start(self):
+        if self._thread is not None and self.error is not None:
+            self.stop()
+        if self._thread is None:
+            self.error = None
+            self._stop.clear()
+            self._thread = threading.Thread(target = self._run, daemon = True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+#----------------------------------------------------------------
+# Buses of the process, one per trace32 channel
+#----------------------------------------------------------------
+_buses = {}
+_busesLock = threading.Lock()
+
+def get_event_bus(trace32, name = None, create = True):
+    """Get the event bus of a trace32 channel
+
+    Args:
+        trace32 (Trace32): The trace32 of the platform
+        name (str): Name of the test platform
+        create (bool): Create the bus if the channel has none yet
+
+    Returns:
+        The EventBus, None if there is none and create is False
+    """
+    key = (trace32.ip, trace32.port)
+    with _busesLock:
+        bus = _buses.get(key)
+        if bus is None and create:
+            bus = EventBus(trace32, name)
+            _buses[key] = bus
+        return bus
+
+class BusCapture:
+    """A capture of the TERM contents published by a bus, with the stop()
+       of WindowCapture"""
+    def __init__(self, bus, writer):
+        self.writer = writer
+        self._subscription = bus.subscribe_term(lambda event: writer.write(event.data))
+
+    def stop(self):
+        self._subscription.close()
+        self.writer.close()
+
+def running_event_bus(trace32):
+    """The bus of the channel if its poller is running, otherwise None"""
+    bus = get_event_bus(trace32, create = False)
+    return bus if bus is not None and bus.running() else None
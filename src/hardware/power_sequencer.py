@@ -0,0 +1,326 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   power_sequencer.py
+@Time        :   2024/04/23 14:05:27
+@Author      :   Shiqi Duan
+@Description :   Sequencing engine for the power and reset operations of
+                 many test platforms. The APC, RUMI and trace32 operations
+                 form a dependency graph which is run with bounded
+                 concurrency per PDU and per RUMI host, so a rack is reset
+                 in parallel without browning out a shared PDU. The timing
+                 of every step and the critical path are reported.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import time
+import errno
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from hardware.trace32 import t32apiLock as _t32apiLock
+
+from robot.api import logger
+
+# Operations running at the same time on a single resource
+defaultLimits = {
+    "pdu":    2,        # Outlets switched on together, limits the inrush
+    "rumi":   1,        # The RUMI server runs one command at a time
+}
+
+
+class StepState:
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE    = "done"
+    FAILED  = "failed"
+    SKIPPED = "skipped"
+
+#----------------------------------------------------------------
+# Step
+#----------------------------------------------------------------
+class Step:
+    """
+    A single operation of the sequence.
+
+    Attributes:
+        name      (str)      : Unique name, e.g. "tp1 apc on"
+        action    (callable) : Run with no argument, returns 0 or -errno
+        deps      (list)     : Names of the steps to finish first
+        resources (list)     : (kind, key) pairs held while running, e.g.
+                               ("pdu", "10.21.10.81")
+        estimate  (float)    : Expected seconds, used to run the longest
+                               chains first
+        ret       (int)      : Return code of the action
+        ready, start, end (float) : time.monotonic() when the dependencies
+                               were done, when the step started and ended
+    """
+    def __init__(self, name, action, deps = (), resources = (), estimate = 1):
+        self.name      = name
+        self.action    = action
+        self.deps      = list(deps)
+        self.resources = list(resources)
+        self.estimate  = estimate
+
+        self.state = StepState.PENDING
+        self.ret   = None
+        self.ready = None
+        self.start = None
+        self.end   = None
+        self.rank  = 0
+
+    @property
+    def duration(self):
+        if self.start is None or self.end is None:
+            return 0
+        return self.end - self.start
+
+    @property
+    def waited(self):
+        """Seconds spent waiting for a resource once the deps were done"""
+        if self.ready is None or self.start is None:
+            return 0
+        return self.start - self.ready
+
+#----------------------------------------------------------------
+# Sequencer
+#----------------------------------------------------------------
+class PowerSequencer:
+    """
+    A class running a graph of steps with bounded concurrency per resource.
+
+    A step starts once all its dependencies are done and a slot is free on
+    every resource it holds, the ready steps heading the longest remaining
+    chains start first. When a step fails, the steps depending on it are
+    skipped while the independent ones go on.
+
+    Methods:
+        add(self, name: str, action, deps = (), resources = (), estimate = 1):
+            Add a step, returns the Step
+        run(self):
+            Run all the steps, returns 0 or the first error
+        critical_path(self):
+            The chain of steps which decided the total time
+        report(self):
+            Text report of the timing
+
+    Usage:
+        sequencer = PowerSequencer()
+        sequencer.add("tp1 off", apc.power_off, resources = [("pdu", apc.ip)])
+        sequencer.add("tp1 on", apc.power_on, deps = ["tp1 off"], ...)
+        ret = sequencer.run()
+        logger.info(sequencer.report())
+    """
+    def __init__(self, limits = None, maxWorkers = 16):
+        self.limits = dict(defaultLimits)
+        self.limits.update(limits or {})
+        self.maxWorkers = maxWorkers
+        self.steps = {}
+        self.start = None
+        self.end   = None
+
+    def add(self, name, action, deps = (), resources = (), estimate = 1):
+        if name in self.steps:
+            raise ValueError(f"Step {name} already added")
+        step = Step(name, action, deps, resources, estimate)
+        self.steps[name] = step
+        return step
+
+    def _rank(self):
+        """Rank every step with the estimated time of the longest chain
+           starting from it, and check the graph has no cycle
+        """
+        children = {name: [] for name in self.steps}
+        for step in self.steps.values():
+            for dep in step.deps:
+                if dep not in self.steps:
+                    raise ValueError(f"Step {step.name} depends on unknown {dep}")
+                children[dep].append(step.name)
+
+        visiting = set()
+        ranked = {}
+        def rank(name):
+            if name in ranked:
+                return ranked[name]
+            if name in visiting:
+                raise ValueError(f"Dependency cycle through {name}")
+            visiting.add(name)
+            step = self.steps[name]
+            step.rank = step.estimate + max((rank(child) for child in children[name]), \
+                                            default = 0)
+            visiting.discard(name)
+            ranked[name] = step.rank
+            return step.rank
+
+        for name in self.steps:
+            rank(name)
+
+    def _acquire(self, step, used):
+        for resource in step.resources:
+            limit = self.limits.get(resource[0])
+            if limit is not None and used.get(resource, 0) >= limit:
+                return False
+        for resource in step.resources:
+            used[resource] = used.get(resource, 0) + 1
+        return True
+
+    def _release(self, step, used):
+        for resource in step.resources:
+            used[resource] = used[resource] - 1
+
+    def _run_step(self, step):
+        step.start = time.monotonic()
+        try:
+            ret = step.action()
+        except Exception as e:
+            logger.error(f"Step {step.name} failed, {e}", html = False)
+            ret = -errno.EIO
+        step.end = time.monotonic()
+        return 0 if ret is None else ret
+
+    def run(self):
+        self._rank()
+        used = {}
+        running = {}
+        self.start = time.monotonic()
+        with ThreadPoolExecutor(max_workers = self.maxWorkers, \
+                                thread_name_prefix = "power-seq") as executor:
+            while True:
+                # Skip what can never run, mark what became ready
+                ready = []
+                for step in self.steps.values():
+                    if step.state != StepState.PENDING:
+                        continue
+                    states = [self.steps[dep].state for dep in step.deps]
+                    if any(state in (StepState.FAILED, StepState.SKIPPED) for state in states):
+                        step.state = StepState.SKIPPED
+                    elif all(state == StepState.DONE for state in states):
+                        if step.ready is None:
+                            step.ready = time.monotonic()
+                        ready.append(step)
+
+                for step in sorted(ready, key = lambda step: -step.rank):
+                    if self._acquire(step, used):
+                        step.state = StepState.RUNNING
+                        running[executor.submit(self._run_step, step)] = step
+
+                if not running:
+                    break
+                [finished, notFinished] = wait(list(running), return_when = FIRST_COMPLETED)
+                for future in finished:
+                    step = running.pop(future)
+                    self._release(step, used)
+                    step.ret = future.result()
+                    step.state = StepState.DONE if step.ret == 0 else StepState.FAILED
+        self.end = time.monotonic()
+
+        # Steps behind a skipped one are left pending, skip them too
+        for step in self.steps.values():
+            if step.state == StepState.PENDING:
+                step.state = StepState.SKIPPED
+
+        # A skipped step depends on a failed one, report the failed one
+        for step in self.steps.values():
+            if step.state == StepState.FAILED:
+                return step.ret
+        return 0
+
+    def critical_path(self):
+        """Walk back from the last step to end, through the dependency
+           which ended the latest each time
+
+        Returns:
+            List of the Steps from the first to the last
+        """
+        finished = [step for step in self.steps.values() if step.end is not None]
+        if not finished:
+            return []
+        step = max(finished, key = lambda step: step.end)
+        path = [step]
+        while step.deps:
+            deps = [self.steps[dep] for dep in step.deps if self.steps[dep].end is not None]
+            if not deps:
+                break
+            step = max(deps, key = lambda step: step.end)
+            path.append(step)
+        return path[::-1]
+
+    def report(self):
+        total = 0 if self.end is None else self.end - self.start
+        lines = [f"Sequence of {len(self.steps)} steps took {total:.1f}s"]
+        counts = {}
+        for step in self.steps.values():
+            counts[step.state] = counts.get(step.state, 0) + 1
+        lines.append(", ".join(f"{state} {count}" for state, count in sorted(counts.items())))
+        lines.append("Critical path:")
+        for step in self.critical_path():
+            lines.append(f"  {step.start - self.start:7.1f}s  {step.duration:6.1f}s  "\
+                         f"waited {step.waited:5.1f}s  {step.name}")
+        for step in self.steps.values():
+            if step.state in (StepState.FAILED, StepState.SKIPPED):
+                lines.append(f"  {step.state}: {step.name} ({step.ret})")
+        return "\n".join(lines)
+
+#----------------------------------------------------------------
+# Reset plan of test platforms
+#----------------------------------------------------------------
+def reattach_trace32(trace32, timeout = 120, interval = 2):
+    """Connect to the trace32 until it answers a ping again after a reset"""
+    deadline = time.monotonic() + timeout
+    while True:
+        with _t32apiLock:
+            ret = trace32.connect()
+            if ret == 0:
+                ret = trace32.ping()
+                trace32.disconnect()
+        if ret == 0:
+            return 0
+        if time.monotonic() >= deadline:
+            return -errno.ETIMEDOUT
+        time.sleep(interval)
+
+def add_platform_reset(sequencer, tp, rumi = None, stagger = 2, \
+                       reattachTimeout = 120):
+    """Add the reset of a test platform to the sequence:
+
+           apc off -> off delay -> apc on -> RUMI reset_jtag -> trace32 reattach
+
+    The power on holds a slot of the PDU for stagger seconds more, so the
+    outlets of a PDU come up a few at a time.
+
+    Args:
+        sequencer (PowerSequencer): The sequence to add the steps to
+        tp (TestPlatform): The test platform to reset
+        rumi (RUMI): The RUMI of the platform, no JTAG reset if None
+        stagger (float): Seconds between two power on of the same PDU
+        reattachTimeout (float): Seconds to wait for the trace32
+
+    Returns:
+        Name of the last step of the platform
+    """
+    apc = tp.dut.apc
+    pdu = ("pdu", apc.ip)
+
+    def power_on():
+        ret = apc.power_on()
+        time.sleep(stagger)
+        return ret
+
+    sequencer.add(f"{tp.name} apc off", apc.power_off, resources = [pdu])
+    sequencer.add(f"{tp.name} off delay", lambda: time.sleep(apc.offDelay), \
+                  deps = [f"{tp.name} apc off"], estimate = apc.offDelay)
+    last = f"{tp.name} apc on"
+    sequencer.add(last, power_on, deps = [f"{tp.name} off delay"], resources = [pdu], \
+                  estimate = stagger)
+
+    if rumi is not None:
+        def reset_jtag():
+            return rumi.execute("RESET_JTAG")[0]
+        sequencer.add(f"{tp.name} reset jtag", reset_jtag, deps = [last], \
+                      resources = [("rumi", rumi.ip)], estimate = 5)
+        last = f"{tp.name} reset jtag"
+
+    sequencer.add(f"{tp.name} trace32 reattach", \
+                  lambda: reattach_trace32(tp.trace32, reattachTimeout), \
+                  deps = [last], estimate = 10)
+    return f"{tp.name} trace32 reattach"
@@ -0,0 +1,277 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   reload_tracker.py
+@Time        :   2024/04/20 09:37:12
+@Author      :   Shiqi Duan
+@Description :   Track a RUMI image reload until the target is really ready
+                 instead of sleeping a fixed time. A framed RUMI server
+                 reports the progress of the reload, for a legacy server
+                 the readiness is polled on the trace32 API port and in the
+                 TERM view. The duration of every reload is recorded per
+                 RUMI and image so the next one can be predicted.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import os
+import json
+import time
+import errno
+import statistics
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from robot.api import logger
+
+from utils.watchdog import CancelToken
+
+projectDir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+historyFile = os.path.join(projectDir, 'results', 'reload_history.json')
+
+# Durations kept per RUMI and image
+historySize = 20
+defaultImage = "default"
+
+class ReloadState:
+    IDLE      = "idle"
+    RELOADING = "reloading"
+    READY     = "ready"
+    FAILED    = "failed"
+
+#----------------------------------------------------------------
+# Reload history
+#----------------------------------------------------------------
+class ReloadHistory:
+    """
+    A class storing the durations of the reloads in a json file:
+
+        {"<ip>:<port>": {"<image>": [seconds, ...]}}
+
+    Methods:
+        record(self, rumi: str, image: str, duration: float):
+            Add the duration of a finished reload
+        predict(self, rumi: str, image: str):
+            Median of the recorded durations, None if never reloaded
+    """
+    def __init__(self, path = historyFile):
+        self.path  = path
+        self._lock = threading.Lock()
+        self._history = None
+
+    def _load(self):
+        if self._history is None:
+            try:
+                with open(self.path) as hf:
+                    self._history = json.load(hf)
+            except (FileNotFoundError, ValueError):
+                self._history = {}
+        return self._history
+
+    def _save(self):
+        tmpFile = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok = True)
+            with open(tmpFile, 'w') as hf:
+                json.dump(self._history, hf, indent = 1)
+            os.replace(tmpFile, self.path)
+        except OSError as e:
+            logger.warn(f"Save reload history failed, {e}", html = False)
+
+    def record(self, rumi, image, duration):
+        with self._lock:
+            durations = self._load().setdefault(rumi, {}).setdefault(image, [])
+            durations.append(round(duration, 1))
+            del durations[:-historySize]
+            self._save()
+
+    def durations(self, rumi, image = defaultImage):
+        with self._lock:
+            return list(self._load().get(rumi, {}).get(image, []))
+
+    def predict(self, rumi, image = defaultImage):
+        durations = self.durations(rumi, image)
+        if not durations:
+            return None
+        return statistics.median(durations)
+
+_history = None
+_historyLock = threading.Lock()
+
+def get_reload_history():
+    """Get the reload history shared by the process"""
+    global _history
+    with _historyLock:
+        if _history is None:
+            _history = ReloadHistory()
+        return _history
+
+# Reloads of the whole farm run concurrently, the workers mostly sleep
+_executor = ThreadPoolExecutor(max_workers = 16, thread_name_prefix = "rumi-reload")
+
+#----------------------------------------------------------------
+# Reload tracker
+#----------------------------------------------------------------
+class ReloadTracker:
+    """
+    A class following a single reload of a RUMI until the target is ready.
+
+    The reload is finished when the framed server answers the reload
+    request, or when the legacy server answers or closes the connection,
+    a server silent for the whole timeout fails the reload. Then, if a
+    trace32 is given, the target is ready once its API port answers a
+    ping and the banner, if any, shows up in the TERM view.
+
+    Attributes:
+        rumi      (RUMI)    : The RUMI being reloaded
+        image     (str)     : Image reloaded, also the key of the history
+        trace32   (Trace32) : Trace32 connected to the RUMI, optional
+        banner    (str)     : TERM text printed once the image booted
+        state     (str)     : ReloadState of the reload
+        progress  (list)    : Progress messages sent by the server
+        duration  (float)   : Seconds from the request to ready
+
+    Methods:
+        start(self, timeout: float, send = True):
+            Send the reload and track it in background, returns a Future
+            of the return code, send = False only waits for readiness
+        wait(self, timeout = None):
+            Block until the target is ready, returns the return code
+        cancel(self):
+            Stop tracking, the wait returns -ECANCELED
+
+    Usage:
+        tracker = ReloadTracker(RUMI(ip, port, 600), trace32 = tp.trace32)
+        tracker.start(600)
+        ...
+        ret = tracker.wait()
+    """
+    def __init__(self, rumi, image = None, trace32 = None, banner = None, \
+                 pollInterval = 5, history = None):
+        self.rumi     = rumi
+        self.image    = image
+        self.trace32  = trace32
+        self.banner   = banner
+        self.pollInterval = pollInterval
+        self.history  = history if history is not None else get_reload_history()
+
+        self.state    = ReloadState.IDLE
+        self.progress = []
+        self.duration = None
+        self.future   = None
+        self._token   = CancelToken(f"{rumi.ip} reload")
+
+    @property
+    def key(self):
+        return f"{self.rumi.ip}:{self.rumi.port}"
+
+    def predict(self):
+        return self.history.predict(self.key, self.image or defaultImage)
+
+    def _on_progress(self, message):
+        self.progress.append(message)
+
+    def start(self, timeout, send = True):
+        self.state = ReloadState.RELOADING
+        self.future = _executor.submit(self._run, float(timeout), send)
+        return self.future
+
+    def wait(self, timeout = None):
+        if self.future is None:
+            return -errno.EINVAL
+        try:
+            return self.future.result(timeout)
+        except FutureTimeoutError:
+            return -errno.ETIMEDOUT
+
+    def cancel(self):
+        self._token.cancel()
+        self.rumi.cancel()
+
+    def _run(self, timeout, send):
+        start = time.monotonic()
+        self._token.deadline = start + timeout
+        try:
+            ret = self._send() if send else 0
+            if ret == 0:
+                ret = self._wait_ready()
+        except Exception as e:
+            logger.error(f"Track reload of RUMI {self.key} failed, {e}", html = False)
+            ret = -errno.EIO
+
+        if ret != 0:
+            self.state = ReloadState.FAILED
+            return ret
+
+        self.state = ReloadState.READY
+        self.duration = time.monotonic() - start
+        if send:
+            self.history.record(self.key, self.image or defaultImage, self.duration)
+        return 0
+
+    def _send(self):
+        if self.rumi.protocol == "framed":
+            # The framed server answers once the reload is done
+            [ret, response] = self.rumi.execute("RELOAD_IMAGE", self.image, \
+                                                onProgress = self._on_progress)
+            return ret
+
+        ret = self.rumi.send_command("RELOAD_IMAGE", self.image)
+        if ret != 0:
+            return ret
+        # The legacy server answers, or closes the connection, when the
+        # reload is done, the readiness of a trace32 is polled at the same
+        # time. The old image may still answer at first, so the target only
+        # counts as ready after it has been seen down
+        seenDown = False
+        while self.rumi.thread_running:
+            if self.trace32 is not None:
+                if not self._ready():
+                    seenDown = True
+                elif seenDown:
+                    return 0
+            if self._sleep():
+                return self._expired()
+        if self.rumi.ret != 0:
+            self._on_progress(f"reload request failed, {self.rumi.ret}")
+            return self.rumi.ret
+        if self.rumi.response:
+            self._on_progress(self.rumi.response.strip())
+        return 0
+
+    def _sleep(self):
+        remaining = self._token.remaining()
+        return self._token.wait(min(self.pollInterval, remaining)) \
+            or self._token.remaining() <= 0
+
+    def _expired(self):
+        if self._token.cancelled():
+            return -errno.ECANCELED
+        logger.error(f"RUMI {self.key} not ready after the timeout!", html = False)
+        return -errno.ETIMEDOUT
+
+    def _wait_ready(self):
+        if self.trace32 is None:
+            return 0
+        while not self._ready():
+            if self._sleep():
+                return self._expired()
+        return 0
+
+    def _ready(self):
+        """Whether the debugger answers and the banner is printed, the
+           connection holds the t32api lock against the other threads
+        """
+        if self.trace32.connect() != 0:
+            return False
+        try:
+            if self.trace32.ping() != 0:
+                return False
+        finally:
+            self.trace32.disconnect()
+        if self.banner is None:
+            return True
+
+        [rc, content, offset] = self.trace32.read_window("TERM.HARDCOPY")
+        return rc == 0 and self.banner in content
@@ -12,9 +12,16 @@
 import os
 import socket
 import json
+import time
+import errno
 import threading
 from robot.api import logger
 
+from utils.health import get_health_monitor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from hardware.rumi_client import get_framed_client, legacy_request, read_legacy_response, \
+                                 format_legacy_command, RUMIUnframedResponse
+
 dataLength = 1024
 
 RUMICommand = {
@@ -55,13 +62,22 @@ def create_rumi_list_json_file(jsonFile):
     return rumiList
 
 class RUMI:
-    def __init__(self, ip = 'blr-s4b-q07558', port = 9999, timeout = 10) -> None:
+    def __init__(self, ip = 'blr-s4b-q07558', port = 9999, timeout = 10, \
+                 protocol = "legacy") -> None:
         self.ip   = ip
         self.port = port
         self.addr = (self.ip, self.port)
 
         self.timeout = timeout
         self.thread_running = False
+        self._client = None
+
+        # "framed" servers keep the connection and pipeline requests,
+        # "legacy" servers take one command per connection
+        self.protocol = protocol
+        self.response = ""
+        # Result of the last request of send_command, 0 or -errno
+        self.ret = 0
         
     def set_ip(self, ip):
         self.ip = ip
@@ -72,34 +88,136 @@ class RUMI:
         self.addr = (self.ip, self.port)
         
     def send_command(self, command, param = None):
+        # Fail at once if the server is known to be down, instead of
+        # waiting for the socket timeout again
+        if not get_health_monitor().allow(self.ip, self.port):
+            logger.error(f"RUMI {self.ip}:{self.port} is down, "\
+                         f"{command} not sent!", html = False)
+            return -errno.EHOSTUNREACH
+
         if not self.thread_running:
             self.thread_running = True
+            self.response = ""
+            self.ret = 0
             actualCommand = RUMICommand[command]
             threading.Thread(target = self._send_command_thread,
                              args = (actualCommand, param)).start()
         else:
             logger.warn(f"A client thread is already running!", html = False)
+        return 0
+
+    def cancel(self):
+        """Abort the request in flight, the blocking socket call in the
+           client thread returns at once instead of waiting the timeout
+        """
+        client = self._client
+        if client is not None:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            client.close()
 
     def _send_command_thread(self, command, param):
+        health = get_health_monitor().register("rumi", self.ip, self.port)
         try:
             with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
+                self._client = client
                 client.settimeout(self.timeout)
+                start = time.perf_counter()
                 client.connect(self.addr)
+                health.record_success((time.perf_counter() - start) * 1000)
                 
                 # Send the command
-                full_command = command.encode()
-                if param is not None:
-                    full_command += b' ' + param.encode()  # Assuming param is a string
-                client.sendall(full_command)
+                client.sendall(format_legacy_command(command, param))
 
-                response = client.recv(dataLength).decode()
+                self.response = read_legacy_response(client)
         except socket.timeout:
+            self.ret = -errno.ETIMEDOUT
+            health.record_failure()
             logger.error(f"Client request to RUMI server timeout!", html = False)
+        except OSError as e:
+            self.ret = -(e.errno or errno.EIO)
+            health.record_failure()
+            logger.error(f"Client request to RUMI server {self.ip}:{self.port} "\
+                         f"failed, {e}!", html = False)
         except Exception as e:
-            print("Error:", e)
+            self.ret = -errno.EIO
+            logger.error(f"Client request to RUMI server {self.ip}:{self.port} "\
+                         f"failed, {e}!", html = False)
         finally:
+            self._client = None
             self.thread_running = False
        
+    def execute(self, command, param = None, onProgress = None):
+        """Send a command and wait for the response of the server
+
+        Args:
+            command (str): Key of RUMICommand, e.g. "RESET_JTAG"
+            param (str): Optional parameter of the command
+            onProgress (callable): Called with the progress messages of a
+                                   framed server, e.g. during a reload
+
+        Returns:
+            [rc, response]
+        """
+        [rc, responses] = self.pipeline([[command, param]], onProgress)
+        return [rc, responses[0] if responses else ""]
+
+    def pipeline(self, commands, onProgress = None):
+        """Send several commands and wait for all the responses. A framed
+           server gets all of them on one connection before the first
+           response is read, a legacy server gets them one by one
+
+        Args:
+            commands (list): Keys of RUMICommand, or [key, param] pairs
+            onProgress (callable): Called with the progress messages
+
+        Returns:
+            [rc, responses]
+        """
+        requests = []
+        for command in commands:
+            [command, param] = command if isinstance(command, (list, tuple)) \
+                               else [command, None]
+            if command not in RUMICommand:
+                logger.error(f"Unknown RUMI command {command}!", html = False)
+                return [-errno.EINVAL, []]
+            requests.append([RUMICommand[command], param])
+
+        # Every path after allow() records an outcome, a trial request of a
+        # half open breaker would otherwise keep the RUMI down
+        health = get_health_monitor().register("rumi", self.ip, self.port)
+        if not health.allow():
+            logger.error(f"RUMI {self.ip}:{self.port} is down!", html = False)
+            return [-errno.EHOSTUNREACH, []]
+
+        responses = []
+        start = time.perf_counter()
+        try:
+            if self.protocol == "framed":
+                try:
+                    client = get_framed_client(self.addr, self.timeout)
+                    responses = client.pipeline(requests, onProgress)
+                except RUMIUnframedResponse:
+                    # Configured as framed but it is an old server
+                    logger.warn(f"RUMI {self.ip}:{self.port} is a legacy server, "\
+                                f"fall back to one-shot requests", html = False)
+                    self.protocol = "legacy"
+            if self.protocol != "framed":
+                for [command, param] in requests:
+                    responses.append(legacy_request(self.addr, command, self.timeout, param))
+        except (OSError, FutureTimeoutError) as e:
+            health.record_failure()
+            logger.error(f"Request to RUMI {self.ip}:{self.port} failed, {e}", html = False)
+            return [-errno.EIO, responses]
+        except Exception as e:
+            health.record_failure()
+            logger.error(f"RUMI {self.ip}:{self.port} returned error, {e}", html = False)
+            return [-errno.EPROTO, responses]
+        health.record_success((time.perf_counter() - start) * 1000 / max(len(requests), 1))
+        return [0, responses]
+
     @classmethod     
     def create_object_from_json(cls, config):
         try:
@@ -109,8 +227,11 @@ class RUMI:
             # Get port of the RUMI server
             port = config['port']
 
+            # Protocol of the RUMI server, legacy if not given
+            protocol = config.get('protocol', "legacy")
+
             # Update the RUMI
-            return cls(ip, port)
+            return cls(ip, port, protocol = protocol)
         except KeyError as ke:
             print(f"Wrong json config object,"\
                   f"no such key when create {cls.__name__}\n")
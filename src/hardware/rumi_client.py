@@ -0,0 +1,289 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   rumi_client.py
+@Time        :   2024/04/19 10:08:33
+@Author      :   Shiqi Duan
+@Description :   Clients of the RUMI server protocol. The framed client
+                 keeps a connection alive and pipelines requests tagged
+                 with request ids, the legacy client sends one command per
+                 connection like the original RUMI server expects.
+
+                 Framed protocol, every line ends with '\n':
+                     request  : <id> <command> [param]
+                     response : <id>-<text>          (continuation line)
+                                <id> OK|ERR <text>   (last line)
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import time
+import socket
+import itertools
+import threading
+from concurrent.futures import Future
+
+from robot.api import logger
+
+dataLength = 1024
+
+class RUMIProtocolError(Exception):
+    pass
+
+class RUMIUnframedResponse(RUMIProtocolError):
+    """The server answered without a request id, it is a legacy server"""
+    pass
+
+def legacy_request(addr, command, timeout, param = None):
+    """Send a single command on a new connection and read the response
+       until the server closes the connection or a line is complete
+
+    Args:
+        addr (tuple): (ip, port) of the RUMI server
+        command (str): Raw command, e.g. "reload\\n"
+        timeout (float): Socket timeout in seconds
+
+    Returns:
+        Response text of the server
+    """
+    with socket.create_connection(addr, timeout = timeout) as client:
+        client.sendall(format_legacy_command(command, param))
+        return read_legacy_response(client)
+
+def format_legacy_command(command, param = None):
+    """The line sent to a legacy server, the parameter goes before the
+       newline, e.g. "reload <image>\\n"
+    """
+    if param is None:
+        return command.encode()
+    return f"{command.rstrip()} {param}\n".encode()
+
+def read_legacy_response(client):
+    """Read a legacy response, which may arrive in several pieces, until
+       the line is complete or the server closes the connection. A server
+       silent for the socket timeout raises socket.timeout
+    """
+    chunks = []
+    while True:
+        data = client.recv(dataLength)
+        if not data:
+            break
+        chunks.append(data)
+        if data.endswith(b"\n"):
+            break
+    return b"".join(chunks).decode(errors = 'replace')
+
+#----------------------------------------------------------------
+# Framed RUMI client
+#----------------------------------------------------------------
+class FramedRUMIClient:
+    """
+    A class keeping a connection to a framed RUMI server, requests are
+    pipelined and matched to their responses by request id.
+
+    Attributes:
+        addr    (tuple) : (ip, port) of the RUMI server
+        timeout (float) : Seconds to wait for a connection or a response
+
+    Methods:
+        request(self, command: str, param: str, onProgress = None):
+            Send a request, returns a Future of the response text, the
+            continuation lines are passed to onProgress as they arrive
+        pipeline(self, commands: list, onProgress = None):
+            Send all the commands before waiting, returns the responses
+
+    Usage:
+        client = FramedRUMIClient(('blr-s4b-q07558', 9999), 600)
+        [jtag, reload] = client.pipeline(["reset_jtag", "reload"])
+    """
+    def __init__(self, addr, timeout = 10):
+        self.addr    = addr
+        self.timeout = timeout
+
+        self._ids     = itertools.count(1)
+        self._lock    = threading.Lock()
+        self._pending = {}
+        self._lines   = {}
+        self._progress = {}
+        self._sockets = {}
+        self._sock    = None
+        self._reader  = None
+
+    def _connect(self):
+        if self._sock is not None:
+            return
+        sock = socket.create_connection(self.addr, timeout = self.timeout)
+        # The reader blocks on recv, the deadline is enforced per request
+        sock.settimeout(None)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self._sock = sock
+        self._reader = threading.Thread(target = self._read_loop, args = (sock,), \
+                                        daemon = True)
+        self._reader.start()
+
+    def _fail_all(self, exception, sock):
+        """Fail the requests sent on a connection, the requests of a newer
+           connection are kept
+        """
+        with self._lock:
+            requestIds = [requestId for requestId, requestSock in self._sockets.items() \
+                          if requestSock is sock]
+            futures = self._forget(requestIds)
+            if self._sock is sock:
+                self._sock = None
+        for future in futures:
+            if not future.done():
+                future.set_exception(exception)
+
+    def _forget(self, requestIds):
+        """Drop the state of requests, a late reply to them is ignored.
+           Called with _lock held
+
+        Returns:
+            The futures of the requests
+        """
+        futures = []
+        for requestId in requestIds:
+            future = self._pending.pop(requestId, None)
+            if future is not None:
+                futures.append(future)
+            self._lines.pop(requestId, None)
+            self._progress.pop(requestId, None)
+            self._sockets.pop(requestId, None)
+        return futures
+
+    def _read_loop(self, sock):
+        buffer = b""
+        try:
+            while True:
+                data = sock.recv(dataLength)
+                if not data:
+                    raise ConnectionError("RUMI server closed the connection")
+                buffer = buffer + data
+                # A read can hold several responses or part of one
+                while b"\n" in buffer:
+                    [line, buffer] = buffer.split(b"\n", 1)
+                    self._handle_line(line.decode(errors = 'replace').rstrip("\r"))
+        except OSError as e:
+            self._fail_all(e, sock)
+        except RUMIProtocolError as e:
+            self._fail_all(e, sock)
+            sock.close()
+
+    def _handle_line(self, line):
+        head = line.split(" ", 1)[0]
+        if "-" in head:
+            [requestId, text] = line.split("-", 1)
+            final = False
+        else:
+            [requestId, text] = (line.split(" ", 1) + [""])[:2]
+            final = True
+
+        if not requestId.isdigit():
+            raise RUMIUnframedResponse(f"Unframed response: {line}")
+        requestId = int(requestId)
+
+        with self._lock:
+            future = self._pending.get(requestId)
+            if future is None:
+                logger.warn(f"Response to unknown request {requestId}", html = False)
+                return
+            lines = self._lines.setdefault(requestId, [])
+            onProgress = self._progress.get(requestId)
+            if final:
+                self._forget([requestId])
+            else:
+                lines.append(text)
+
+        if not final:
+            # Continuation lines are the progress messages of the request
+            if onProgress is not None:
+                onProgress(text)
+            return
+
+        [status, message] = (text.split(" ", 1) + [""])[:2]
+        lines.append(message)
+        response = "\n".join(lines)
+        if status == "OK":
+            future.set_result(response)
+        else:
+            future.set_exception(RUMIProtocolError(f"{status} {response}"))
+
+    def request(self, command, param = None, onProgress = None):
+        command = command.strip()
+        if param is not None:
+            command = f"{command} {param}"
+
+        future = Future()
+        with self._lock:
+            self._connect()
+            requestId = next(self._ids)
+            future.requestId = requestId
+            self._pending[requestId] = future
+            if onProgress is not None:
+                self._progress[requestId] = onProgress
+            sock = self._sock
+            self._sockets[requestId] = sock
+        try:
+            sock.sendall(f"{requestId} {command}\n".encode())
+        except OSError as e:
+            # Another thread may have connected again meanwhile, only the
+            # connection that failed is closed
+            self._fail_all(e, sock)
+            _close_socket(sock)
+        return future
+
+    def pipeline(self, commands, onProgress = None):
+        """Send the commands one after another without waiting, then wait
+           for all the responses
+
+        Args:
+            commands (list): Commands, or [command, param] pairs
+            onProgress (callable): Called with every continuation line
+
+        Returns:
+            List of the response texts in the order of the commands
+        """
+        futures = []
+        for command in commands:
+            if isinstance(command, (list, tuple)):
+                futures.append(self.request(*command, onProgress = onProgress))
+            else:
+                futures.append(self.request(command, onProgress = onProgress))
+
+        deadline = time.monotonic() + self.timeout
+        try:
+            return [future.result(max(deadline - time.monotonic(), 0)) for future in futures]
+        except BaseException:
+            # The requests still waited for are given up, a late reply
+            # must not reach onProgress
+            with self._lock:
+                self._forget([future.requestId for future in futures if not future.done()])
+            raise
+
+    def close(self):
+        with self._lock:
+            sock = self._sock
+            self._sock = None
+        if sock is not None:
+            _close_socket(sock)
+
+def _close_socket(sock):
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    sock.close()
+
+_clients = {}
+_clientsLock = threading.Lock()
+
+def get_framed_client(addr, timeout = 10):
+    """Get the framed client of a RUMI server, connections are shared"""
+    with _clientsLock:
+        client = _clients.get(addr)
+        if client is None:
+            client = FramedRUMIClient(addr, timeout)
+            _clients[addr] = client
+        client.timeout = timeout
+        return client
@@ -0,0 +1,172 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   run_control.py
+@Time        :   2024/05/09 14:21:37
+@Author      :   Shiqi Duan
+@Description :   Run control of the cores of a multi-core DUT, e.g. the APSS
+                 ARM, RISCV and Q6 cores each behind a trace32 of its own.
+                 The connection to every trace32 is opened on a channel of
+                 its own beforehand, Go and Break are then sent to all the
+                 cores back to back without any connection in between. The
+                 time every call was issued at is measured, the skew is the
+                 spread of the cores around the first one.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import time
+import errno
+
+from hardware.trace32 import Trace32, t32apiLock
+
+from robot.api import logger
+
+stateStopped = 2
+
+class RunControl:
+    """
+    A class starting and halting the cores of a DUT together.
+
+    Attributes:
+        cores    (dict) : core name -> Trace32, Go and Break are issued in
+                          this order
+        lastSkew (dict) : Skew report of the last Go or Break
+
+    Methods:
+        prepare(self):
+            Open a channel to the trace32 of every core
+        go(self):
+            Start all the cores, returns [rc, report]
+        halt(self, timeout = 10):
+            Stop all the cores and wait until they are all stopped
+        release(self):
+            Close the channels
+
+    Usage:
+        with RunControl({"apps": tp1.trace32, "q6": tp2.trace32}) as cores:
+            [rc, report] = cores.go()
+            [rc, report] = cores.halt()
+    """
+    def __init__(self, cores):
+        self.cores    = dict(cores)
+        self.lastSkew = None
+        self._channels = {}
+
+    def __enter__(self):
+        rc = self.prepare()
+        if rc != 0:
+            raise RuntimeError(f"Failed to prepare the cores, {rc}")
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    @property
+    def prepared(self):
+        return len(self._channels) == len(self.cores) and len(self.cores) > 0
+
+    def prepare(self):
+        """Open a channel to every trace32, nothing is left open on failure
+
+        Returns:
+            0: All the channels are open
+            !0: rc of the connection which failed
+        """
+        self.release()
+        rc = 0
+        with t32apiLock:
+            for name, trace32 in self.cores.items():
+                [rc, channel] = trace32.open_channel()
+                if rc != 0:
+                    logger.error(f"Failed to open a channel to {name}, "\
+                                 f"trace32 port {trace32.port}!", html = False)
+                    break
+                self._channels[name] = channel
+        if rc != 0:
+            self.release()
+        return rc
+
+    def release(self):
+        with t32apiLock:
+            for name, channel in self._channels.items():
+                self.cores[name].close_channel(channel)
+        self._channels = {}
+
+    @staticmethod
+    def skew_report(names, results):
+        """Skew of the calls, a core is taken as started or stopped in the
+           middle of its call
+
+        Returns:
+            Dict: skew and bound in milliseconds, the bound covers the
+                  whole calls, offsets is core name -> milliseconds after
+                  the first core
+        """
+        middles = [(start + end) / 2 for [rc, start, end] in results]
+        first = min(middles)
+        return {
+            'skew':    (max(middles) - first) * 1000,
+            'bound':   (max(end for [rc, start, end] in results) - \
+                        min(start for [rc, start, end] in results)) * 1000,
+            'offsets': {name: (middle - first) * 1000 for name, middle in zip(names, middles)},
+        }
+
+    def _issue(self, function):
+        if not self.prepared:
+            logger.error(f"The cores are not prepared!", html = False)
+            return [-errno.ENOTCONN, None]
+
+        names = list(self._channels)
+        with t32apiLock:
+            results = Trace32.issue_on_channels(list(self._channels.values()), function)
+        self.lastSkew = RunControl.skew_report(names, results)
+
+        rc = 0
+        for name, [callRc, start, end] in zip(names, results):
+            if callRc != 0:
+                logger.error(f"{function} on {name} failed, {callRc}!", html = False)
+                rc = callRc
+        logger.info(f"{function} on {len(names)} cores, skew {self.lastSkew['skew']:.3f}ms "\
+                    f"(bound {self.lastSkew['bound']:.3f}ms)", html = False)
+        return [rc, self.lastSkew]
+
+    def go(self):
+        """Start all the cores
+
+        Returns:
+            [rc, report]: see skew_report
+        """
+        return self._issue("T32_Go")
+
+    def halt(self, timeout = 10):
+        """Stop all the cores, then wait until every one reports stopped
+
+        Returns:
+            [rc, report]: rc is -ETIMEDOUT if a core is still running
+        """
+        [rc, report] = self._issue("T32_Break")
+        if rc != 0:
+            return [rc, report]
+
+        deadline = time.monotonic() + timeout
+        running = list(self._channels)
+        while running:
+            with t32apiLock:
+                states = {name: Trace32.get_channel_state(self._channels[name]) \
+                          for name in running}
+            running = [name for name, [stateRc, state] in states.items() \
+                       if stateRc != 0 or state != stateStopped]
+            if not running:
+                break
+            if time.monotonic() >= deadline:
+                logger.error(f"Cores {', '.join(running)} not stopped after Break!", html = False)
+                return [-errno.ETIMEDOUT, report]
+            time.sleep(0.05)
+        return [0, report]
+
+    def states(self):
+        """core name -> [rc, state] of the target"""
+        with t32apiLock:
+            return {name: Trace32.get_channel_state(channel) \
+                    for name, channel in self._channels.items()}
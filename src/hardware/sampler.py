@@ -0,0 +1,185 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   sampler.py
+@Time        :   2024/05/10 16:40:12
+@Author      :   Shiqi Duan
+@Description :   Fixed rate sampling of target variables, counters and
+                 registers. The sampler keeps a trace32 channel of its own
+                 open for the whole run, the sampled addresses are grouped
+                 into a few memory blocks read in one go at every tick and
+                 the values go to a SampleStore.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import time
+import threading
+
+from robot.api import logger
+
+# Bytes of unused memory read between two variables rather than starting
+# another block
+defaultBlockGap = 64
+
+# Failed reads in a row stopping the sampler
+maxReadErrors = 10
+
+class SampleChannel:
+    """
+    A sampled value.
+
+    Attributes:
+        name      (str)  : Column name of the samples
+        address   (int)  : Address of the value
+        size      (int)  : Bytes of the value, 1 to 8
+        byteOrder (str)  : 'little' or 'big'
+        signed    (bool) : Decode as a signed value
+        shift     (int)  : Shift of a field within the value
+        mask      (int)  : Mask of a field, None for the whole value
+    """
+    def __init__(self, name, address, size = 4, byteOrder = 'little', signed = False, \
+                 shift = 0, mask = None):
+        self.name      = name
+        self.address   = address
+        self.size      = size
+        self.byteOrder = byteOrder
+        # Values are stored as int64, a 64 bits counter wraps to negative
+        self.signed    = signed or size >= 8
+        self.shift     = shift
+        self.mask      = mask
+
+    def decode(self, content):
+        value = int.from_bytes(content, self.byteOrder, signed = self.signed)
+        return value if self.mask is None else (value & self.mask) >> self.shift
+
+def plan_blocks(channels, gap = defaultBlockGap):
+    """Group the channels into memory blocks, channels closer than gap
+       bytes share a block
+
+    Returns:
+        List of [address, size, [[channel index, offset]]]
+    """
+    blocks = []
+    order = sorted(range(len(channels)), key = lambda index: channels[index].address)
+    for index in order:
+        channel = channels[index]
+        if blocks and channel.address <= blocks[-1][0] + blocks[-1][1] + gap:
+            block = blocks[-1]
+            block[1] = max(block[1], channel.address + channel.size - block[0])
+        else:
+            block = [channel.address, channel.size, []]
+            blocks.append(block)
+        block[2].append([index, channel.address - block[0]])
+    return blocks
+
+#----------------------------------------------------------------
+# Sampler
+#----------------------------------------------------------------
+class Sampler:
+    """
+    A class reading channels of a trace32 at a fixed rate in a thread.
+
+    Attributes:
+        trace32  (Trace32)     : The trace32 of the platform
+        channels (list)        : The SampleChannel sampled
+        rate     (float)       : Samples per second
+        store    (SampleStore) : Where the samples go
+        missed   (int)         : Ticks skipped as a read was late
+        errors   (int)         : Failed reads
+
+    Methods:
+        start(self):
+            Open the channel and start sampling
+        stop(self):
+            Stop sampling, close the channel and spill the samples
+
+    Usage:
+        sampler = Sampler(tp.trace32, channels, 100, SampleStore(directory, names))
+        sampler.start()
+        ...
+        sampler.stop()
+        sampler.store.stats()
+    """
+    def __init__(self, trace32, channels, rate, store, gap = defaultBlockGap):
+        self.trace32  = trace32
+        self.channels = channels
+        self.rate     = float(rate)
+        self.store    = store
+        self.missed   = 0
+        self.errors   = 0
+
+        self._blocks  = plan_blocks(channels, gap)
+        self._stop    = threading.Event()
+        self._thread  = None
+        self._channel = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        [rc, self._channel] = self.trace32.open_channel()
+        if rc != 0:
+            return rc
+        self._stop.clear()
+        self._thread = threading.Thread(target = self._run, daemon = True, \
+                                        name = f"sampler-{self.trace32.port}")
+        self._thread.start()
+        return 0
+
+    def stop(self, timeout = 10):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.store.close()
+
+    def sample(self):
+        """Read all the channels once
+
+        Returns:
+            [rc, timestamp, values]
+        """
+        ranges = [[address, size] for [address, size, members] in self._blocks]
+        [rc, contents, start, end] = self.trace32.read_channel_blocks(self._channel, ranges)
+        if rc != 0:
+            return [rc, end, None]
+
+        values = [0] * len(self.channels)
+        for [address, size, members], content in zip(self._blocks, contents):
+            for [index, offset] in members:
+                channel = self.channels[index]
+                values[index] = channel.decode(content[offset:offset + channel.size])
+        return [0, (start + end) / 2, values]
+
+    def _run(self):
+        period = 1 / self.rate
+        deadline = time.perf_counter()
+        errorsInRow = 0
+        try:
+            while not self._stop.is_set():
+                [rc, timestamp, values] = self.sample()
+                if rc == 0:
+                    self.store.append(timestamp, values)
+                    errorsInRow = 0
+                else:
+                    self.errors = self.errors + 1
+                    errorsInRow = errorsInRow + 1
+                    if errorsInRow >= maxReadErrors:
+                        logger.error(f"Sampler of trace32 port {self.trace32.port} "\
+                                     f"stopped after {errorsInRow} failed reads!", html = False)
+                        break
+
+                # Fixed rate, the ticks a slow read ran over are skipped
+                deadline = deadline + period
+                delay = deadline - time.perf_counter()
+                if delay < 0:
+                    skipped = int(-delay / period) + 1
+                    self.missed = self.missed + skipped
+                    deadline = deadline + skipped * period
+                    delay = deadline - time.perf_counter()
+                self._stop.wait(max(delay, 0))
+        finally:
+            self.trace32.close_channel(self._channel)
+            self._channel = None
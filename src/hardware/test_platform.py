@@ -17,8 +17,8 @@ import os
 import errno
 from os import path
 
-from dut     import DUT
-from trace32 import Trace32
+from hardware.dut     import DUT
+from hardware.trace32 import Trace32
 from utils.subprocess_control import subprocess_start
 
 from robot.api import logger
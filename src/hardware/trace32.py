@@ -10,12 +10,15 @@
 @Contact     :   shiqduan@qti.qualcomm.com
 '''
 
+import os
 import ctypes
 import enum
 import errno
 import time
+import threading
 
-from apc import APC
+from hardware.apc import APC
+from utils.health import get_health_monitor, probeSkipped
 
 from robot.api import logger
 from robot.api.logger import info, debug, trace, console
@@ -29,7 +32,47 @@ class MessageLineState(enum.IntEnum):
     ERROR = 2
     ERROR_INFO = 16
 
-t32api = ctypes.cdll.LoadLibrary("src/hardware/t32api64.dll")
+try:
+    t32api = ctypes.cdll.LoadLibrary("src/hardware/t32api64.dll")
+    t32api.T32_GetChannel0.restype = ctypes.c_void_p
+except OSError:
+    # No trace32 API on this machine, the offline benchmarks set a
+    # stand-in with the same functions instead
+    t32api = None
+
+# The current channel of the trace32 API is global, the users switching
+# channels or connecting from several threads hold this lock
+t32apiLock = threading.RLock()
+
+def probe_api(host, port, timeout = 2):
+    """Health probe of a trace32 API port, a T32_Init and T32_Ping round
+       trip on a channel of its own since the API talks UDP. Skipped while
+       another thread uses the API, its own connection records the health
+
+    Returns:
+        Latency in milliseconds, None if the API does not answer
+    """
+    if not t32apiLock.acquire(blocking = False):
+        return probeSkipped
+    try:
+        channel = ctypes.create_string_buffer(t32api.T32_GetChannelSize())
+        t32api.T32_GetChannelDefaults(channel)
+        t32api.T32_SetChannel(channel)
+        t32api.T32_Config(b"NODE=", host.encode())
+        t32api.T32_Config(b"PORT=", f"{port}".encode())
+        t32api.T32_Config(b"PACKLEN=", b"1024")
+        t32api.T32_Config(b"TIMEOUT=", f"{max(int(timeout), 1)}".encode())
+        start = time.perf_counter()
+        rc = t32api.T32_Init()
+        if rc == 0:
+            rc = t32api.T32_Ping()
+            t32api.T32_Exit()
+        Trace32.select_channel(None)
+        return (time.perf_counter() - start) * 1000 if rc == 0 else None
+    finally:
+        t32apiLock.release()
+
+get_health_monitor().set_prober("trace32", probe_api)
 
 #----------------------------------------------------------------
 # Trace32 class
@@ -58,6 +101,9 @@ class Trace32:
         self.config = config
         self.initCmm = initCmm
 
+        # Capture archive (CaptureWriter) which stores the TERM contents
+        self.capture = None
+
     def __str__(self) -> str:
         trace32Info = f"Trace32:\n"\
                       f"  ip: {self.ip}\n"\
@@ -67,9 +113,44 @@ class Trace32:
         return trace32Info
 
     def connect(self):
+        """Connect to the trace32, the t32api lock is held by the calling
+           thread until disconnect() so no other thread switches the
+           channel or exits the API in between
+
+        Returns:
+            0: Connected
+            !0: Failed to connect, the lock is not held
+        """
+        t32apiLock.acquire()
+        try:
+            rc = self._connect()
+        except BaseException:
+            t32apiLock.release()
+            raise
+        if rc != 0:
+            t32apiLock.release()
+        return rc
+
+    def disconnect(self):
+        t32api.T32_Exit()
+        try:
+            t32apiLock.release()
+        except RuntimeError:
+            # Not connected by this thread, nothing to release
+            pass
+
+    def _connect(self):
         T32_DEV = 1
         ret = 0
         port = "%d" % (self.port)
+
+        # The API port of a dead trace32 would block T32_Init for its
+        # whole timeout, fail at once while the breaker is open
+        health = get_health_monitor().register("trace32", "localhost", self.port)
+        if not health.allow():
+            logger.error(f"Trace32 API port {self.port} is down!", html = False)
+            return -errno.EHOSTUNREACH
+        start = time.perf_counter()
         t32api.T32_Config(b"NODE=", b"localhost")
         t32api.T32_Config(b"PORT=", port.encode())
         t32api.T32_Config(b"PACKLEN=", b"1024")
@@ -77,6 +158,7 @@ class Trace32:
         # Establish a connection to TRACE32
         rc = t32api.T32_Init()
         if rc != 0:
+            health.record_failure()
             logger.error(f"Init t32 failed!", html = False)
             return rc
 
@@ -88,13 +170,13 @@ class Trace32:
             if rc == 0:
                 break
         if rc != 0:
+            health.record_failure()
             logger.error(f"Attach t32 failed!", html = False)
             t32api.T32_Exit()
+        else:
+            health.record_success((time.perf_counter() - start) * 1000)
         return rc
 
-    def disconnect(self):
-        t32api.T32_Exit()
-
     def ping(self):
         rc = t32api.T32_Ping()
         if rc != 0:
@@ -145,6 +227,9 @@ class Trace32:
             currentContent = lastContent + content
             lastContent = content
 
+            if self.capture is not None:
+                self.capture.write(content)
+
             # Do compare work, remove the keyword in set if found
             for keyword in keywordsSet.copy():
                 if keyword in currentContent:
@@ -160,35 +245,127 @@ class Trace32:
         self.disconnect()
         return [rc, matchAll]
 
-    def wait_until_not_running(self, timeout = 300):
+    def read_window(self, command = "TERM.HARDCOPY", offset = 0, chunkSize = 1024):
+        """Read the contents of a trace32 window starting from an offset
+
+        Args:
+            command (str): Window command, e.g. "TERM.HARDCOPY" or "AREA"
+            offset (int): Byte offset to start reading from
+            chunkSize (int): Bytes read by each T32_GetWindowContent call
+
+        Returns:
+            [rc, content, offset]: content read and the offset following it
+        """
+        content = ""
+
+        rc = self.connect()
+        if rc != 0:
+            return [rc, content, offset]
+
+        [content, offset] = self._read_window_content(command, offset, chunkSize)
+
+        self.disconnect()
+        return [rc, content, offset]
+
+    def _read_window_content(self, command, offset, chunkSize = 1024):
+        content = ""
+        buffer = (ctypes.c_char * chunkSize)()
+        code = "T32_PRINT_CODE_ASCII"
+        mess_len = ctypes.c_uint(0)
+
+        mess_len.value = t32api.T32_GetWindowContent(command.encode(), \
+            ctypes.byref(buffer), chunkSize, offset, code)
+        while mess_len.value > 0:
+            content = content + buffer.raw[:mess_len.value].decode("utf-8", "replace")
+            offset = offset + mess_len.value
+            mess_len.value = t32api.T32_GetWindowContent(command.encode(), \
+                ctypes.byref(buffer), chunkSize, offset, code)
+        return [content, offset]
+
+    def iter_window(self, command = "TERM.HARDCOPY", offset = 0, chunkSize = 4096):
+        """Generator of the contents of a trace32 window read chunk by chunk
+           in a single connection, nothing is kept once consumed
+
+        Yields:
+            str: the next chunk of the contents
+        """
+        rc = self.connect()
+        if rc != 0:
+            raise ConnectionError(f"Failed to connect trace32 port {self.port}, {rc}")
+        try:
+            buffer = (ctypes.c_char * chunkSize)()
+            code = "T32_PRINT_CODE_ASCII"
+            while True:
+                length = t32api.T32_GetWindowContent(command.encode(), \
+                    ctypes.byref(buffer), chunkSize, offset, code)
+                if length <= 0:
+                    return
+                offset = offset + length
+                yield buffer.raw[:length].decode("utf-8", "replace")
+        finally:
+            self.disconnect()
+
+    def read_status(self, command = "TERM.HARDCOPY", offset = 0):
+        """Read the run state, the PRACTICE state and the new contents of a
+           window in a single connection
+
+        Args:
+            command (str): Window command, None to skip the window
+            offset (int): Byte offset to start reading the window from
+
+        Returns:
+            [rc, state, practiceState, content, offset]
+        """
+        state = ctypes.c_uint16(-1)
+        practiceState = ctypes.c_int(PracticeInterpreterState.UNKNOWN)
+        content = ""
+
+        rc = self.connect()
+        if rc != 0:
+            return [rc, None, None, content, offset]
+
+        rc = t32api.T32_GetState(ctypes.byref(state))
+        if rc == 0:
+            rc = t32api.T32_GetPracticeState(ctypes.byref(practiceState))
+        if rc == 0 and command is not None:
+            [content, offset] = self._read_window_content(command, offset)
+
+        self.disconnect()
+        return [rc, state.value, practiceState.value, content, offset]
+
+    def wait_until_not_running(self, timeout = 300, cancelToken = None):
         """Wait until the trace32 is not running
 
         Args:
             timeout (int): Timeout for waiting trace32 break
+            cancelToken (CancelToken): Stop waiting once it is cancelled
         Returns:
             0:  Successful
             <0: Timeout 
         """
-        rc = self.connect()
-        if rc != 0:
-            return rc
-
         start = time.time()
 
-        # Wait until the break point hit
+        # Wait until the break point hit, connected only while polling so
+        # the other users of the t32api are not held up by the wait
         pstate = ctypes.c_uint16(-1)
-        while rc == 0 and not pstate.value == 2:
+        while True:
+            rc = self.connect()
+            if rc != 0:
+                return rc
             rc = t32api.T32_GetState(ctypes.byref(pstate))
+            self.disconnect()
+            if rc != 0 or pstate.value == 2:
+                return 0
+
             if time.time() - start >= timeout:
                 logger.error(f"Wait timeout!", html = False)
-                self.disconnect()
                 return -errno.ETIMEDOUT
-            
-            time.sleep(300/1000)
-            rc = t32api.T32_GetState(ctypes.byref(pstate))
 
-        self.disconnect()
-        return 0
+            if cancelToken is not None and cancelToken.wait(300/1000):
+                logger.error(f"Wait cancelled, {cancelToken.reason}!", html = False)
+                return -errno.ECANCELED
+            elif cancelToken is None:
+                time.sleep(300/1000)
 
     #----------------------------------------------------------------
     # Below are some key functions for executing trace32 command & cmm
@@ -202,15 +379,14 @@ class Trace32:
             bufferSize (int): The size of response buffer
 
         Returns:
-            0:  Command executed successfully
-            <0: Failed to execut command
+            [rc, response]: response is None if the connection failed
         """
 
         # To execute a command, we need to first connect to a trace32, then
         # execute specific command, after command finish, we need to disconnect
         rc = self.connect()
         if rc != 0:
-            return rc
+            return [rc, None]
 
         # Organize the command
         for arg in args:
@@ -227,30 +403,30 @@ class Trace32:
 
         return [rc, responseBuffer]
 
-    def execute_cmm_script(self, scriptPath, delayTime = 500):
-        """Execute cmm script and wait it to finish
-
-        Args:
-            scriptPath (str): Path to the cmm script
-            delayTime  (int): Miliseconds to delay while executing cmm
+    def start_cmm_script(self, scriptPath):
+        """Start a PRACTICE script without waiting for it
 
         Returns:
-            0: cmm script runs successfully 
+            0: The script is started
+            !0: Failed to connect the trace32
         """
         rc = self.connect()
         if rc != 0:
             return rc
-
-        # Start PRACTICE script
         t32api.T32_Cmd(b"CD.DO " + scriptPath.encode('utf-8'))
+        self.disconnect()
+        return 0
 
-        # Wait until PRACTICE script is done
-        state = ctypes.c_int(PracticeInterpreterState.UNKNOWN) 
-        rc = 0
-        while rc==0 and not state.value==PracticeInterpreterState.NOT_RUNNING: 
-            rc = t32api.T32_GetPracticeState(ctypes.byref(state))
-            time.sleep(delayTime/1000)
+    def stop_cmm_script(self):
+        """Stop the running PRACTICE script so the debugger is usable again"""
+        rc = self.connect()
+        if rc != 0:
+            return rc
+        t32api.T32_Cmd(b"END")
+        self.disconnect()
+        return 0
 
+    def _cmm_result(self, scriptPath):
         # Get confirmation that everything worked 
         status = ctypes.c_uint16(-1)
         message = ctypes.create_string_buffer(256)
@@ -260,11 +436,390 @@ class Trace32:
             or status.value == MessageLineState.ERROR_INFO:
             rc = -errno.EAGAIN
             logger.error(f"Execute {scriptPath} error!", html = False)
+        return rc
+
+    def get_cmm_result(self, scriptPath):
+        """Result of the PRACTICE script which just finished
+
+        Returns:
+            0: cmm script runs successfully 
+            -EAGAIN: The script failed
+        """
+        rc = self.connect()
+        if rc != 0:
+            return rc
+        rc = self._cmm_result(scriptPath)
+        self.disconnect()
+        return rc
+
+    def execute_cmm_script(self, scriptPath, delayTime = 500, cancelToken = None, \
+                           onPoll = None):
+        """Execute cmm script and wait it to finish
+
+        Args:
+            scriptPath (str): Path to the cmm script
+            delayTime  (int): Miliseconds to delay while executing cmm
+            cancelToken (CancelToken): Stop the script once it is cancelled
+            onPoll (callable): Called while connected at every state poll,
+                               e.g. to read a window during the script
+
+        Returns:
+            0: cmm script runs successfully 
+            -ECANCELED: The script is stopped by the cancel token
+        """
+        # Start PRACTICE script
+        rc = self.start_cmm_script(scriptPath)
+        if rc != 0:
+            return rc
+
+        # Wait until PRACTICE script is done, connected only while polling
+        # so the other users of the t32api are not held up by the script
+        state = ctypes.c_int(PracticeInterpreterState.UNKNOWN) 
+        while True:
+            rc = self.connect()
+            if rc != 0:
+                return rc
+            rc = t32api.T32_GetPracticeState(ctypes.byref(state))
+            if onPoll is not None:
+                onPoll()
+            if rc != 0 or state.value == PracticeInterpreterState.NOT_RUNNING:
+                break
+            self.disconnect()
+
+            if cancelToken is not None and cancelToken.wait(delayTime/1000):
+                self.stop_cmm_script()
+                logger.error(f"Execute {scriptPath} cancelled, "\
+                             f"{cancelToken.reason}!", html = False)
+                return -errno.ECANCELED
+            elif cancelToken is None:
+                time.sleep(delayTime/1000)
+
+        rc = self._cmm_result(scriptPath)
 
         # Disconnect the trace32
         self.disconnect()
         return rc
 
+    def get_diagnostic_snapshot(self, termTail = 4096, registers = ("PC", "SP", "LR")):
+        """Collect the debugger state for post-mortem analysis
+
+        Args:
+            termTail (int): Number of characters kept from the end of TERM
+            registers (tuple): Names of the registers to dump
+
+        Returns:
+            Dict: state, practice state, registers and the TERM tail
+        """
+        snapshot = {'state': None, 'practiceState': None, \
+                    'registers': {}, 'term': ""}
+
+        [rc, content, offset] = self.read_window("TERM.HARDCOPY")
+        if rc == 0:
+            snapshot['term'] = content[-termTail:]
+
+        rc = self.connect()
+        if rc != 0:
+            return snapshot
+
+        try:
+            pstate = ctypes.c_uint16(-1)
+            if t32api.T32_GetState(ctypes.byref(pstate)) == 0:
+                snapshot['state'] = pstate.value
+
+            state = ctypes.c_int(PracticeInterpreterState.UNKNOWN)
+            if t32api.T32_GetPracticeState(ctypes.byref(state)) == 0:
+                snapshot['practiceState'] = state.value
+
+            # Registers can only be read while the core is stopped
+            if snapshot['state'] == 2:
+                for name in registers:
+                    value  = ctypes.c_uint32(0)
+                    hvalue = ctypes.c_uint32(0)
+                    if t32api.T32_ReadRegisterByName(name.encode(), \
+                        ctypes.byref(value), ctypes.byref(hvalue)) == 0:
+                        snapshot['registers'][name] = (hvalue.value << 32) | value.value
+        finally:
+            self.disconnect()
+        return snapshot
+
+    #----------------------------------------------------------------
+    # Memory transactions, several blocks in a single connection
+    #----------------------------------------------------------------
+    def read_memory_blocks(self, blocks, access = 0):
+        """Read memory blocks in one connection
+
+        Args:
+            blocks (list): [address, size] of the blocks
+            access (int): Memory access class of T32_ReadMemory, 0 for data
+
+        Returns:
+            [rc, contents]: bytes of every block
+        """
+        rc = self.connect()
+        if rc != 0:
+            return [rc, []]
+
+        [rc, contents] = Trace32.read_blocks(blocks, access)
+
+        self.disconnect()
+        return [rc, contents]
+
+    @staticmethod
+    def read_blocks(blocks, access = 0):
+        """Read memory blocks on the current connection, e.g. a channel
+           selected by the caller
+
+        Returns:
+            [rc, contents]: bytes of the blocks read before a failure
+        """
+        contents = []
+        rc = 0
+        for [address, size] in blocks:
+            buffer = ctypes.create_string_buffer(size)
+            rc = t32api.T32_ReadMemory(address, access, buffer, size)
+            if rc != 0:
+                logger.error(f"Read memory {address:#x}++{size - 1:#x} failed!", html = False)
+                break
+            contents.append(buffer.raw[:size])
+        return [rc, contents]
+
+    def write_memory_blocks(self, blocks, access = 0):
+        """Write memory blocks in one connection
+
+        Args:
+            blocks (list): [address, content] of the blocks, content is bytes
+            access (int): Memory access class of T32_WriteMemory, 0 for data
+
+        Returns:
+            0: success
+            !0: Failed to write a block, the blocks after it are not written
+        """
+        rc = self.connect()
+        if rc != 0:
+            return rc
+
+        for [address, content] in blocks:
+            buffer = ctypes.create_string_buffer(bytes(content), len(content))
+            rc = t32api.T32_WriteMemory(address, access, buffer, len(content))
+            if rc != 0:
+                logger.error(f"Write memory {address:#x} failed!", html = False)
+                break
+
+        self.disconnect()
+        return rc
+
+    #----------------------------------------------------------------
+    # Trace buffer, read record by record through the remote API
+    #----------------------------------------------------------------
+    @staticmethod
+    def trace_record_size(mask):
+        """Bytes of a record of T32_ReadTrace, 4 per item of the mask"""
+        return 4 * bin(mask).count("1")
+
+    def export_trace(self, writer, traceType = 0, mask = 0x3, chunkRecords = 16384, \
+                     start = None, stop = None, cancelToken = None):
+        """Stream the records of the trace buffer into a TraceWriter, one
+           T32_ReadTrace call per chunk in a single connection
+
+        Args:
+            writer (TraceWriter): Where the chunks go
+            traceType (int): tracetype of T32_ReadTrace, 0 for the trace
+            mask (int): Items of a record
+            chunkRecords (int): Records read at once
+            start, stop (int): Records in [start, stop), the whole buffer
+                               by default
+            cancelToken (CancelToken): Stop reading once it is cancelled
+
+        Returns:
+            [rc, records]: records written
+        """
+        rc = self.connect()
+        if rc != 0:
+            return [rc, 0]
+
+        [state, size, first, last] = [ctypes.c_int(0), ctypes.c_long(0), \
+                                      ctypes.c_long(0), ctypes.c_long(0)]
+        rc = t32api.T32_GetTraceState(traceType, ctypes.byref(state), ctypes.byref(size), \
+                                      ctypes.byref(first), ctypes.byref(last))
+        if rc != 0:
+            logger.error(f"Get trace state failed!", html = False)
+            self.disconnect()
+            return [rc, 0]
+
+        recordSize = Trace32.trace_record_size(mask)
+        begin = first.value if start is None else max(int(start), first.value)
+        end = last.value + 1 if stop is None else min(int(stop), last.value + 1)
+        buffer = ctypes.create_string_buffer(chunkRecords * recordSize)
+        written = 0
+        record = begin
+        while record < end:
+            if cancelToken is not None and cancelToken.cancelled():
+                logger.error(f"Trace export cancelled, {cancelToken.reason}!", html = False)
+                rc = -errno.ECANCELED
+                break
+            count = min(chunkRecords, end - record)
+            rc = t32api.T32_ReadTrace(traceType, record, count, mask, buffer)
+            if rc != 0:
+                logger.error(f"Read trace records {record}..{record + count - 1} failed!", \
+                             html = False)
+                break
+            writer.write(record, buffer.raw[:count * recordSize])
+            written = written + count
+            record = record + count
+
+        self.disconnect()
+        return [rc, written]
+
+    #----------------------------------------------------------------
+    # Channels, a connection per trace32 kept open while other trace32
+    # are used. The current channel is global to the t32api, the default
+    # one is selected back after every use so connect() is not affected
+    #----------------------------------------------------------------
+    def open_channel(self):
+        """Connect to the trace32 on a channel of its own
+
+        Returns:
+            [rc, channel]: channel is None if the connection failed
+        """
+        with t32apiLock:
+            channel = ctypes.create_string_buffer(t32api.T32_GetChannelSize())
+            t32api.T32_GetChannelDefaults(channel)
+            t32api.T32_SetChannel(channel)
+            rc = self._connect()
+            Trace32.select_channel(None)
+        return [rc, channel if rc == 0 else None]
+
+    def close_channel(self, channel):
+        with t32apiLock:
+            Trace32.select_channel(channel)
+            t32api.T32_Exit()
+            Trace32.select_channel(None)
+
+    @staticmethod
+    def select_channel(channel):
+        """Make a channel current, None for the default channel. The caller
+           holds the t32api lock until it selects the default one back
+        """
+        if channel is None:
+            channel = ctypes.c_void_p(t32api.T32_GetChannel0())
+        t32api.T32_SetChannel(channel)
+
+    @staticmethod
+    def issue_on_channels(channels, function):
+        """Call a t32api function without arguments, e.g. T32_Go, on every
+           channel back to back
+
+        Returns:
+            List of [rc, start, end], time.perf_counter() around every call
+        """
+        setChannel = t32api.T32_SetChannel
+        call = getattr(t32api, function)
+        clock = time.perf_counter
+        results = []
+        with t32apiLock:
+            for channel in channels:
+                setChannel(channel)
+                start = clock()
+                rc = call()
+                results.append([rc, start, clock()])
+            Trace32.select_channel(None)
+        return results
+
+    @staticmethod
+    def get_channel_state(channel):
+        """[rc, state] of the target on a channel, 2 is stopped, 3 running"""
+        state = ctypes.c_uint16(-1)
+        with t32apiLock:
+            Trace32.select_channel(channel)
+            rc = t32api.T32_GetState(ctypes.byref(state))
+            Trace32.select_channel(None)
+        return [rc, state.value]
+
+    @staticmethod
+    def read_channel_blocks(channel, blocks, access = 0):
+        """Read memory blocks on a channel opened by open_channel()
+
+        Returns:
+            [rc, contents, start, end]: time.time() around the reads
+        """
+        with t32apiLock:
+            Trace32.select_channel(channel)
+            start = time.time()
+            [rc, contents] = Trace32.read_blocks(blocks, access)
+            end = time.time()
+            Trace32.select_channel(None)
+        return [rc, contents, start, end]
+
+    #----------------------------------------------------------------
+    # Snapshot of the target state, saved after a known good boot and
+    # restored instead of booting again
+    #----------------------------------------------------------------
+    @staticmethod
+    def _format_range(address, size):
+        address = f"{address:#x}" if isinstance(address, int) else str(address)
+        return f"{address}++{int(size) - 1:#x}"
+
+    def _run_commands(self, commands):
+        for command in commands:
+            rc = t32api.T32_Cmd(command.encode())
+            if rc != 0:
+                logger.error(f"Command {command} execute error!", html = False)
+                return rc
+        return 0
+
+    def save_state(self, directory, ranges):
+        """Stop the target and save its registers and memory ranges
+
+        Args:
+            directory (str): Directory the files are written to, it must be
+                             reachable by the trace32 process
+            ranges (list): [address, size] of the memory ranges to dump,
+                           address is an int or a trace32 address string
+
+        Returns:
+            0: success
+            <0: Failed to save the state
+        """
+        rc = self.connect()
+        if rc != 0:
+            return rc
+
+        registerFile = os.path.join(directory, "registers.cmm")
+        commands = ["Break", f'STORE "{registerFile}" Register']
+        for index, [address, size] in enumerate(ranges):
+            dumpFile = os.path.join(directory, f"memory{index}.bin")
+            commands.append(f'Data.SAVE.Binary "{dumpFile}" '\
+                            f'{self._format_range(address, size)}')
+        rc = self._run_commands(commands)
+
+        self.disconnect()
+        return rc
+
+    def restore_state(self, directory, ranges, cancelToken = None):
+        """Stop the target, load the saved memory ranges back, then run the
+           register restore script written by save_state
+
+        Returns:
+            0: success
+            <0: Failed to restore the state
+        """
+        rc = self.connect()
+        if rc != 0:
+            return rc
+
+        commands = ["Break"]
+        for index, [address, size] in enumerate(ranges):
+            dumpFile = os.path.join(directory, f"memory{index}.bin")
+            address = f"{address:#x}" if isinstance(address, int) else str(address)
+            commands.append(f'Data.LOAD.Binary "{dumpFile}" {address} /NoClear')
+        rc = self._run_commands(commands)
+        self.disconnect()
+        if rc != 0:
+            return rc
+
+        return self.execute_cmm_script(os.path.join(directory, "registers.cmm"), \
+                                       cancelToken = cancelToken)
+
     @classmethod
     def create_object_from_json(cls, config):
         # Create the Trace32 object
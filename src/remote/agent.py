@@ -0,0 +1,268 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   agent.py
+@Time        :   2024/04/26 10:37:02
+@Author      :   Shiqi Duan
+@Description :   Remote agent running on the host of the debugger. It holds
+                 the test platforms and their trace32 in a local
+                 VerificationLibrary and runs the keywords sent by a remote
+                 VerificationLibrary, several keywords per round trip. The
+                 TERM view is streamed back while a capture is running.
+
+                     python src/remote/agent.py --platforms test_platforms.json
+                                                [--host 127.0.0.1] [--port 9400]
+                                                [--token secret] [--fake-t32]
+
+                 The agent drives the debuggers, it only listens on other
+                 addresses than the loopback one with a token.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import os
+import sys
+import hmac
+import socket
+import argparse
+import ipaddress
+import threading
+import socketserver
+
+srcDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if srcDir not in sys.path:
+    sys.path.insert(0, srcDir)
+
+from remote.protocol import encode, decode, keyword_method, defaultPort
+from utils.capture_archive import WindowCapture
+
+from robot.api import logger
+
+#----------------------------------------------------------------
+# Streams
+#----------------------------------------------------------------
+class _AgentCapture(WindowCapture):
+    """WindowCapture of a stream, the reads are serialized with the
+       keywords by the agent lock, the contents are sent outside of it
+    """
+    def __init__(self, lock, *args):
+        super().__init__(*args)
+        self.lock = lock
+
+    def poll(self):
+        with self.lock:
+            [rc, content, self.offset] = \
+                self.trace32.read_window(self.command, self.offset)
+        if rc == 0 and content:
+            self.writer.write(content)
+        return rc
+
+class _StreamWriter:
+    """Writer of a WindowCapture sending the contents to the client"""
+    def __init__(self, connection, streamId):
+        self.connection = connection
+        self.streamId   = streamId
+
+    def write(self, content):
+        self.connection.send({"id": self.streamId, "event": "data", "data": content})
+
+    def close(self):
+        self.connection.send({"id": self.streamId, "event": "end"})
+
+#----------------------------------------------------------------
+# Connection handler
+#----------------------------------------------------------------
+class _AgentHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.agent = self.server.agent
+        self.writeLock = threading.Lock()
+        self.streams = {}
+
+    def send(self, message):
+        with self.writeLock:
+            try:
+                self.wfile.write(encode(message))
+                self.wfile.flush()
+            except OSError:
+                pass
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                message = decode(line)
+                if not isinstance(message, dict):
+                    raise ValueError("not an object")
+            except ValueError:
+                logger.warn(f"Agent: bad message {line[:80]}", html = False)
+                continue
+
+            requestId = message.get("id")
+            if not self.agent.check_token(message.get("token")):
+                self.send({"id": requestId, "results": [], \
+                           "error": {"index": 0, "message": "Wrong agent token"}})
+            elif "calls" in message:
+                self.send(self.agent.run_calls(requestId, message["calls"], \
+                                               message.get("stopOnError", True), \
+                                               message.get("context")))
+            elif "stream" in message:
+                self.start_stream(requestId, message["stream"])
+            elif "cancel" in message:
+                self.stop_stream(message["cancel"])
+                self.send({"id": requestId, "results": [0], "error": None})
+
+    def start_stream(self, streamId, stream):
+        tp = self.agent.library.get_test_platform_by_name(stream.get("name"))
+        if tp is None:
+            self.send({"id": streamId, "event": "end", \
+                       "error": f"No test platform {stream.get('name')}"})
+            return
+        # Polled between the keywords like a local capture
+        capture = _AgentCapture(self.agent.lock, tp.trace32, _StreamWriter(self, streamId), \
+                                stream.get("command", "TERM.HARDCOPY"), \
+                                float(stream.get("interval", 1)))
+        self.streams[streamId] = capture
+        capture.start()
+
+    def stop_stream(self, streamId):
+        capture = self.streams.pop(streamId, None)
+        if capture is not None:
+            capture.stop()
+
+    def finish(self):
+        # The client went away, stop its streams
+        for streamId in list(self.streams):
+            self.stop_stream(streamId)
+        super().finish()
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+#----------------------------------------------------------------
+# Agent
+#----------------------------------------------------------------
+class RemoteAgent:
+    """
+    A class serving a VerificationLibrary to remote controllers.
+
+    The keywords run one at a time even with several controllers connected,
+    as they would in a single robot run. TERM streams are polled in the
+    background between the keywords. Without a token only the loopback
+    address may be listened on.
+
+    Attributes:
+        library (VerificationLibrary) : The library holding the platforms
+        address (tuple) : (host, port) the agent listens on
+        token   (str)   : Shared secret of the requests, None for no check
+
+    Methods:
+        run_calls(self, requestId, calls: list, stopOnError = True, context = None):
+            Run a batch of keywords, returns the response message
+        start(self):
+            Serve in a background thread
+        serve_forever(self):
+            Serve in the current thread
+
+    Usage:
+        agent = RemoteAgent(library, ("10.21.10.5", 9400), token = "secret")
+        agent.serve_forever()
+    """
+    def __init__(self, library, address = ("127.0.0.1", defaultPort), token = None):
+        if token is None and not is_loopback(address[0]):
+            raise ValueError(f"Listening on {address[0]} needs a token")
+        self.library = library
+        self.token   = token
+        self.lock    = threading.Lock()
+        self._server = _Server(address, _AgentHandler)
+        self._server.agent = self
+        self.address = self._server.server_address
+        self._thread = None
+
+    def check_token(self, token):
+        if self.token is None:
+            return True
+        return hmac.compare_digest(str(token or "").encode(), self.token.encode())
+
+    def run_calls(self, requestId, calls, stopOnError = True, context = None):
+        """Run the calls, context is [output dir, test name] of the test
+           running on the controller, None outside of a test
+        """
+        results = []
+        error = None
+        if not isinstance(calls, list):
+            calls = [calls]
+        for index, call in enumerate(calls):
+            try:
+                [keyword, args, kwargs] = call
+                method = keyword_method(keyword)
+                function = getattr(self.library, method, None)
+                if method.startswith('_') or not callable(function):
+                    error = {"index": index, "message": f"No keyword {keyword}"}
+                    results.append(None)
+                else:
+                    with self.lock:
+                        self.library._testContext = list(context) if context else None
+                        results.append(function(*args, **kwargs))
+            except Exception as e:
+                error = {"index": index, "message": f"{type(e).__name__}: {e}"}
+                results.append(None)
+            if error is not None and stopOnError:
+                break
+        return {"id": requestId, "results": results, "error": error}
+
+    def start(self):
+        self._thread = threading.Thread(target = self._server.serve_forever, daemon = True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+def is_loopback(host):
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "QVerify remote agent")
+    parser.add_argument("--platforms", help = "Test platform json file")
+    parser.add_argument("--host", default = "127.0.0.1", \
+                        help = "Address to listen on, other than the loopback one needs --token")
+    parser.add_argument("--port", type = int, default = defaultPort)
+    parser.add_argument("--token", help = "Shared secret the controllers must send")
+    parser.add_argument("--fake-t32", action = "store_true", \
+                        help = "Use the trace32 API stand-in of the benchmarks")
+    args = parser.parse_args(argv)
+    if args.token is None and not is_loopback(args.host):
+        parser.error(f"listening on {args.host} needs --token")
+
+    if args.fake_t32:
+        sys.path.insert(0, os.path.dirname(srcDir))
+        from hardware import trace32
+        from benchmarks.standins import T32ApiStandIn
+        trace32.t32api = T32ApiStandIn(term = b"Boot done\r\n")
+
+    from VerificationLibrary import VerificationLibrary
+    library = VerificationLibrary()
+    if args.platforms is not None and library.load_test_platforms(args.platforms) != 0:
+        return 1
+
+    agent = RemoteAgent(library, (args.host, args.port), args.token)
+    print(f"Agent serving {len(library._testPlatforms)} test platforms on "\
+          f"{agent.address[0]}:{agent.address[1]}")
+    try:
+        agent.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,214 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   client.py
+@Time        :   2024/04/26 11:24:48
+@Author      :   Shiqi Duan
+@Description :   Client of the remote agent. Requests are tagged with ids so
+                 a keyword batch and the TERM streams share one connection,
+                 a reader thread routes the responses and the stream events.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import socket
+import itertools
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from remote.protocol import encode, decode, parse_address, RemoteError
+
+dataLength = 65536
+
+class RemoteStream:
+    """
+    A window of a remote trace32 streamed to a callback, stop() has the
+    same meaning as WindowCapture.stop()
+
+    Attributes:
+        streamId (int)      : Request id of the stream
+        onData   (callable) : Called with every piece of new contents
+        onEnd    (callable) : Called once the stream ended
+    """
+    def __init__(self, client, streamId, onData, onEnd = None):
+        self.client   = client
+        self.streamId = streamId
+        self.onData   = onData
+        self.onEnd    = onEnd
+        self.error    = None
+        self.ended    = threading.Event()
+
+    def _end(self, error = None):
+        self.error = error
+        if self.onEnd is not None:
+            self.onEnd()
+        self.ended.set()
+
+    def stop(self, timeout = 30):
+        """Cancel the stream and wait until the last contents arrived"""
+        if not self.ended.is_set():
+            self.client._request({"cancel": self.streamId}).result(timeout)
+            self.ended.wait(timeout)
+
+class RemoteClient:
+    """
+    A class calling the keywords of a remote agent.
+
+    Attributes:
+        address     (tuple) : (host, port) of the agent
+        token       (str)   : Shared secret of the agent
+        timeout     (float) : Seconds to connect to the agent
+        callTimeout (float) : Seconds a batch may take before the agent is
+                              taken as dead
+
+    Methods:
+        call(self, keyword: str, *args, **kwargs):
+            Run a keyword on the agent and return its result
+        batch(self, calls: list):
+            Run [keyword, args, kwargs] calls in one round trip
+        stream(self, name: str, onData, command = "TERM.HARDCOPY", interval = 1):
+            Stream a trace32 window of a platform, returns a RemoteStream
+
+    Usage:
+        client = RemoteClient("t32host:9400")
+        [ret1, ret2] = client.batch([["connect_trace32", ["tp1"], {}],
+                                     ["execute_trace32_command", ["tp1", "Go"], {}]])
+    """
+    def __init__(self, address, token = None, timeout = 10, callTimeout = 3600):
+        self.address     = parse_address(address) if isinstance(address, str) else address
+        self.token       = token
+        self.timeout     = timeout
+        self.callTimeout = callTimeout
+
+        self._ids     = itertools.count(1)
+        self._lock    = threading.Lock()
+        self._pending = {}
+        self._streams = {}
+        self._sock    = None
+
+    def _connect(self):
+        if self._sock is not None:
+            return
+        sock = socket.create_connection(self.address, timeout = self.timeout)
+        # Keywords may run for minutes, the reader waits without timeout
+        sock.settimeout(None)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self._sock = sock
+        threading.Thread(target = self._read_loop, args = (sock,), daemon = True).start()
+
+    def _fail_all(self, exception):
+        with self._lock:
+            pending = self._pending
+            streams = self._streams
+            self._pending = {}
+            self._streams = {}
+            self._sock = None
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(exception)
+        for stream in streams.values():
+            stream._end(str(exception))
+
+    def _read_loop(self, sock):
+        buffer = b""
+        try:
+            while True:
+                data = sock.recv(dataLength)
+                if not data:
+                    raise ConnectionError(f"Agent {self.address} closed the connection")
+                buffer = buffer + data
+                while b"\n" in buffer:
+                    [line, buffer] = buffer.split(b"\n", 1)
+                    self._handle(decode(line))
+        except (OSError, ValueError) as e:
+            self._fail_all(e)
+
+    def _handle(self, message):
+        requestId = message.get("id")
+        if "event" in message:
+            with self._lock:
+                stream = self._streams.get(requestId)
+                if message["event"] == "end":
+                    self._streams.pop(requestId, None)
+            if stream is None:
+                return
+            if message["event"] == "data":
+                stream.onData(message["data"])
+            else:
+                stream._end(message.get("error"))
+            return
+
+        with self._lock:
+            future = self._pending.pop(requestId, None)
+        if future is not None:
+            future.set_result(message)
+
+    def _request(self, message, stream = None):
+        future = Future()
+        with self._lock:
+            self._connect()
+            requestId = next(self._ids)
+            future.requestId = requestId
+            message = dict(message, id = requestId, token = self.token)
+            if stream is None:
+                self._pending[requestId] = future
+            else:
+                stream.streamId = requestId
+                self._streams[requestId] = stream
+            sock = self._sock
+        try:
+            sock.sendall(encode(message))
+        except OSError as e:
+            self.close()
+            self._fail_all(e)
+        return future
+
+    def batch(self, calls, stopOnError = True, context = None):
+        """Run the keywords on the agent in one round trip
+
+        Args:
+            calls (list): [keyword, args, kwargs] of every keyword
+            stopOnError (bool): Skip the rest of the batch after an exception
+            context (list): [output dir, test name] of the running test
+
+        Returns:
+            List of the keyword results
+
+        Raises:
+            RemoteError: A keyword raised on the agent or it did not answer
+                         within callTimeout
+        """
+        calls = [[keyword, list(args), dict(kwargs)] for [keyword, args, kwargs] in calls]
+        future = self._request({"calls": calls, "stopOnError": stopOnError, "context": context})
+        try:
+            response = future.result(self.callTimeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self._pending.pop(future.requestId, None)
+            raise RemoteError(f"Agent {self.address[0]} did not answer "\
+                              f"{calls[0][0]} within {self.callTimeout}s")
+        error = response.get("error")
+        if error is not None:
+            raise RemoteError(f"{calls[error['index']][0]} failed on agent "\
+                              f"{self.address[0]}: {error['message']}")
+        return response["results"]
+
+    def call(self, keyword, *args, **kwargs):
+        return self.batch([[keyword, args, kwargs]])[0]
+
+    def stream(self, name, onData, command = "TERM.HARDCOPY", interval = 1, onEnd = None):
+        stream = RemoteStream(self, None, onData, onEnd)
+        self._request({"stream": {"name": name, "command": command, \
+                                  "interval": interval}}, stream)
+        return stream
+
+    def close(self):
+        with self._lock:
+            sock = self._sock
+            self._sock = None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
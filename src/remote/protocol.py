@@ -0,0 +1,42 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   protocol.py
+@Time        :   2024/04/26 09:51:30
+@Author      :   Shiqi Duan
+@Description :   Protocol between the VerificationLibrary and the remote
+                 agent running next to the debugger. Every message is a json
+                 object on a single line:
+
+                 request  : {"id", "token", "calls": [[keyword, args, kwargs]],
+                             "context": [output dir, test name]}
+                            {"id", "token", "stream": {"name", "command", "interval"}}
+                            {"id", "token", "cancel": <stream id>}
+                 response : {"id", "results": [...], "error": null | {"index", "message"}}
+                 stream   : {"id", "event": "data", "data": text}
+                            {"id", "event": "end"}
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import json
+
+defaultPort = 9400
+
+class RemoteError(Exception):
+    pass
+
+def encode(message):
+    return (json.dumps(message, default = str) + "\n").encode()
+
+def decode(line):
+    return json.loads(line)
+
+def keyword_method(keyword):
+    """Method name of a keyword, "Execute Trace32 Command" -> execute_trace32_command"""
+    return keyword.strip().lower().replace(' ', '_')
+
+def parse_address(address):
+    """host:port of the agent, the default port if not given"""
+    [host, _, port] = str(address).partition(':')
+    return (host, int(port) if port else defaultPort)
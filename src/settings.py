@@ -16,7 +16,7 @@ sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
 
 import json
 
-from .variables import *
+from variables import *
 
 from robot.api import logger
 
@@ -25,11 +25,18 @@ class Settings():
         self.module                 = ""
         self.compile                = False
         self.testPlatformConfigFile = ""
-        self.rumiListFile           = ""
+        self.rumiListFile           = os.path.join(config_dir, 'rumi_config', 'rumi.json')
         self.suite                  = ""
         self.logdir                 = ""
         self.t32_timeout            = 300
         self.case_timeout           = 1200
+        self.reload_timeout         = 600
+        self.snapshot_dir           = None
+        self.snapshot_budget        = 20480
+        self.artifact_dir           = None
+        self.artifact_budget        = 51200
+        self.cmm_bundle_dir         = None
+        self.sample_capacity        = 65536
 
         if arguments is not None:
             self.settingFile = os.path.join(config_dir, arguments.setting)
@@ -48,12 +55,21 @@ class Settings():
             self.testPlatformConfigFile = os.path.join(config_dir, setting['test_platform_config'])
             self.suite = os.path.join(tests_dir, setting['module'], setting['suite'])
             self.logdir = setting['logdir']
+            self.rumiListFile = os.path.join(config_dir, \
+                setting.get('rumi_list', os.path.relpath(self.rumiListFile, config_dir)))
             self.t32_timeout = setting['t32_timeout']
             self.case_timeout = setting['case_timeout']
+            self.reload_timeout = setting.get('reload_timeout', self.reload_timeout)
+            self.snapshot_dir = setting.get('snapshot_dir', self.snapshot_dir)
+            self.snapshot_budget = setting.get('snapshot_budget', self.snapshot_budget)
+            self.artifact_dir = setting.get('artifact_dir', self.artifact_dir)
+            self.artifact_budget = setting.get('artifact_budget', self.artifact_budget)
+            self.cmm_bundle_dir = setting.get('cmm_bundle_dir', self.cmm_bundle_dir)
+            self.sample_capacity = setting.get('sample_capacity', self.sample_capacity)
         except FileNotFoundError:
             ret = errno.ENOENT
             logger.error(f'Oppps, Setting file {settingsFile} not exits!', html = False)
-        except (ValueError, TypeError):
+        except (ValueError, TypeError, KeyError):
             ret = errno.EINVAL
             logger.error("Decode json in setting file failed!", html = False)
         return ret
\ No newline at end of file
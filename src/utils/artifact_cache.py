@@ -0,0 +1,328 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   artifact_cache.py
+@Time        :   2024/05/07 10:12:55
+@Author      :   Shiqi Duan
+@Description :   Local content addressed cache of the images fetched from the
+                 network shares. An image is stored once per content hash
+                 whatever the number of platforms and paths using it, the
+                 hash of a source is remembered with its size and mtime so
+                 an unchanged source is not read again. Images needed later
+                 are fetched in background, the least recently used ones are
+                 evicted once the cache is over its disk budget.
+
+                 <cacheDir>/objects/<hash[:2]>/<hash>/<file name>
+                 <cacheDir>/sources.json : source -> [size, mtime, hash]
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from robot.api import logger
+from robot.errors import DataError
+from robot.libraries.BuiltIn import BuiltIn
+
+defaultCacheDir = os.path.join(tempfile.gettempdir(), 'qverify_artifacts')
+defaultBudget = 50 * 1024 * 1024 * 1024
+
+sourcesName = "sources.json"
+copyBlockSize = 1024 * 1024
+
+# Fetches running in background at the same time
+prefetchWorkers = 2
+
+class ArtifactCache:
+    """
+    A class mapping image sources to cached copies on the local disk.
+
+    Attributes:
+        cacheDir (str) : Directory of the cache
+        budget   (int) : Bytes the images may use on the disk
+
+    Methods:
+        fetch(self, source: str):
+            Local path of the cached copy, fetched first if needed
+        prefetch(self, sources: list):
+            Fetch the sources in background, returns the futures
+        evict(self, keep = None):
+            Remove least recently used images until under the budget
+
+    Usage:
+        cache = get_artifact_cache()
+        cache.prefetch([nextImage])
+        localPath = cache.fetch(image)
+    """
+    def __init__(self, cacheDir = defaultCacheDir, budget = defaultBudget):
+        self.cacheDir = cacheDir
+        self.budget   = budget
+
+        self._lock     = threading.Lock()
+        self._inFlight = {}
+        self._executor = ThreadPoolExecutor(max_workers = prefetchWorkers)
+        self._sources  = None
+
+    #----------------------------------------------------------------
+    # Source index
+    #----------------------------------------------------------------
+    def _load_sources(self):
+        if self._sources is None:
+            try:
+                with open(os.path.join(self.cacheDir, sourcesName)) as sf:
+                    self._sources = json.load(sf)
+            except (FileNotFoundError, ValueError):
+                self._sources = {}
+        return self._sources
+
+    def _save_sources(self):
+        os.makedirs(self.cacheDir, exist_ok = True)
+        tmpFile = os.path.join(self.cacheDir, sourcesName + f".{os.getpid()}.tmp")
+        with open(tmpFile, 'w') as sf:
+            json.dump(self._sources, sf, indent = 1)
+        os.replace(tmpFile, os.path.join(self.cacheDir, sourcesName))
+
+    def _object_dir(self, digest):
+        return os.path.join(self.cacheDir, 'objects', digest[:2], digest)
+
+    def _cached_path(self, digest):
+        directory = self._object_dir(digest)
+        try:
+            names = [name for name in os.listdir(directory) if not name.startswith('.')]
+        except FileNotFoundError:
+            return None
+        return os.path.join(directory, names[0]) if names else None
+
+    #----------------------------------------------------------------
+    # Fetch
+    #----------------------------------------------------------------
+    def lookup(self, source):
+        """Cached copy of an unchanged source, None if it must be fetched"""
+        source = os.path.abspath(source)
+        stat = os.stat(source)
+        with self._lock:
+            entry = self._load_sources().get(source)
+        if entry is None or entry[0] != stat.st_size or entry[1] != stat.st_mtime:
+            return None
+        cachedPath = self._cached_path(entry[2])
+        if cachedPath is not None:
+            # The mtime of the object directory is its last use
+            os.utime(os.path.dirname(cachedPath))
+        return cachedPath
+
+    def _copy(self, source):
+        """Copy a source into the cache while hashing it
+
+        Returns:
+            [digest, cachedPath]
+        """
+        os.makedirs(self.cacheDir, exist_ok = True)
+        stat = os.stat(source)
+        [fd, tmpPath] = tempfile.mkstemp(prefix = ".fetch.", dir = self.cacheDir)
+        sha = hashlib.sha256()
+        try:
+            with open(source, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+                for block in iter(lambda: src.read(copyBlockSize), b""):
+                    sha.update(block)
+                    dst.write(block)
+            digest = sha.hexdigest()
+
+            cachedPath = self._cached_path(digest)
+            if cachedPath is None:
+                directory = self._object_dir(digest)
+                os.makedirs(directory, exist_ok = True)
+                cachedPath = os.path.join(directory, os.path.basename(source))
+                os.replace(tmpPath, cachedPath)
+            else:
+                # Same content under another path, keep the single copy
+                os.remove(tmpPath)
+                os.utime(os.path.dirname(cachedPath))
+        except BaseException:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+            raise
+
+        with self._lock:
+            self._load_sources()[source] = [stat.st_size, stat.st_mtime, digest]
+            self._save_sources()
+        return [digest, cachedPath]
+
+    def fetch(self, source):
+        """Local copy of a source image, fetched if not cached or changed.
+           A fetch of the same source in progress is waited for
+
+        Returns:
+            Path of the cached copy
+        """
+        source = os.path.abspath(source)
+        cachedPath = self.lookup(source)
+        if cachedPath is not None:
+            return cachedPath
+
+        with self._lock:
+            future = self._inFlight.get(source)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inFlight[source] = future
+        if not owner:
+            return future.result()
+
+        # Fetch in the calling thread, the workers may be busy prefetching
+        try:
+            future.set_result(self._fetch(source))
+        except BaseException as e:
+            future.set_exception(e)
+        return future.result()
+
+    def _fetch(self, source):
+        try:
+            start = time.time()
+            [digest, cachedPath] = self._copy(source)
+            logger.info(f"Cached {source} as {digest[:12]} in {time.time() - start:.1f}s", \
+                        html = False)
+            self.evict(keep = digest)
+            return cachedPath
+        finally:
+            with self._lock:
+                self._inFlight.pop(source, None)
+
+    def prefetch(self, sources):
+        """Fetch the sources in background in the given order
+
+        Returns:
+            List of the futures, a future holds the cached path
+        """
+        futures = []
+        for source in sources:
+            source = os.path.abspath(source)
+            with self._lock:
+                future = self._inFlight.get(source)
+                if future is None:
+                    future = self._executor.submit(self._prefetch, source)
+                    self._inFlight[source] = future
+            futures.append(future)
+        return futures
+
+    def _prefetch(self, source):
+        # A failed lookup is raised to the fetches joining this prefetch,
+        # nobody else waits on it
+        try:
+            cachedPath = self.lookup(source)
+        except BaseException:
+            with self._lock:
+                self._inFlight.pop(source, None)
+            raise
+        if cachedPath is not None:
+            with self._lock:
+                self._inFlight.pop(source, None)
+            return cachedPath
+        return self._fetch(source)
+
+    #----------------------------------------------------------------
+    # Eviction
+    #----------------------------------------------------------------
+    def entries(self):
+        """[digest, size, lastUse] of the cached images, least recently used first"""
+        objectsDir = os.path.join(self.cacheDir, 'objects')
+        entries = []
+        if not os.path.isdir(objectsDir):
+            return entries
+        for prefix in os.listdir(objectsDir):
+            for digest in os.listdir(os.path.join(objectsDir, prefix)):
+                directory = os.path.join(objectsDir, prefix, digest)
+                size = sum(os.path.getsize(os.path.join(directory, name)) \
+                           for name in os.listdir(directory))
+                entries.append([digest, size, os.path.getmtime(directory)])
+        return sorted(entries, key = lambda entry: entry[2])
+
+    def evict(self, keep = None):
+        """Remove the least recently used images until the cache fits in the
+           budget, the image just fetched is kept even if it is larger
+
+        Returns:
+            Digests of the removed images
+        """
+        removed = []
+        with self._lock:
+            entries = self.entries()
+            total = sum(size for [digest, size, lastUse] in entries)
+            for [digest, size, lastUse] in entries:
+                if total <= self.budget:
+                    break
+                if digest == keep:
+                    continue
+                shutil.rmtree(self._object_dir(digest), ignore_errors = True)
+                total = total - size
+                removed.append(digest)
+            if removed:
+                sources = self._load_sources()
+                for source in [source for source, entry in sources.items() if entry[2] in removed]:
+                    del sources[source]
+                self._save_sources()
+        return removed
+
+#----------------------------------------------------------------
+# Prefetch of the images of the next tests
+#----------------------------------------------------------------
+imageTagPrefix = "image:"
+
+class PrefetchListener:
+    """
+    A robot listener prefetching the images of the current and the next
+    tests when a test starts, the images of a test are given by its tags:
+
+        [Tags]    image:${IMAGE_DIR}/apps.elf    image:${IMAGE_DIR}/rumi.bin
+
+    Attributes:
+        getCache  (callable) : Returns the ArtifactCache to fetch into
+        lookahead (int)      : Number of next tests prefetched
+    """
+    ROBOT_LISTENER_API_VERSION = 3
+
+    def __init__(self, getCache, lookahead = 2):
+        self.getCache  = getCache
+        self.lookahead = lookahead
+
+    def start_test(self, data, result):
+        tests = list(data.parent.tests)
+        position = next((i for i, test in enumerate(tests) if test is data), 0)
+        images = []
+        for test in tests[position:position + 1 + self.lookahead]:
+            for tag in test.tags:
+                if not tag.lower().startswith(imageTagPrefix):
+                    continue
+                try:
+                    image = BuiltIn().replace_variables(tag[len(imageTagPrefix):].strip())
+                except DataError as e:
+                    logger.warn(f"Image of {test.name} not prefetched, {e}", html = False)
+                    continue
+                if image not in images:
+                    images.append(image)
+        if images:
+            self.getCache().prefetch(images)
+
+_cache = None
+_cacheLock = threading.Lock()
+
+def get_artifact_cache(cacheDir = None, budget = None):
+    """Get the artifact cache of the process, created at the first call and
+       again when another cacheDir is given, e.g. once the settings are read
+    """
+    global _cache
+    with _cacheLock:
+        if _cache is None or (cacheDir and cacheDir != _cache.cacheDir):
+            if _cache is not None:
+                # The prefetches in flight still complete into the old cache
+                _cache._executor.shutdown(wait = False)
+            _cache = ArtifactCache(cacheDir or defaultCacheDir, budget or defaultBudget)
+        elif budget:
+            _cache.budget = budget
+        return _cache
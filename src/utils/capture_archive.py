@@ -0,0 +1,352 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   capture_archive.py
+@Time        :   2024/04/09 10:31:05
+@Author      :   Shiqi Duan
+@Description :   Compressed, rotated archive for the TERM/AREA contents
+                 captured from trace32. Contents are stored as independently
+                 compressed chunks in segment files, an index records the
+                 offset and the time range of every chunk so a time window
+                 can be read or searched without decompressing everything.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import os
+import re
+import json
+import time
+import gzip
+import bisect
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+indexFileName   = "index.jsonl"
+metaFileName    = "capture.json"
+segmentPrefix   = "segment"
+
+# Default chunk and segment limits
+chunkSizeLimit    = 64 * 1024           # Raw bytes in a chunk
+chunkTimeLimit    = 5                   # Seconds covered by a chunk
+segmentSizeLimit  = 64 * 1024 * 1024    # Compressed bytes in a segment
+
+def _default_codec():
+    return "zstd" if zstandard is not None else "gzip"
+
+def _compress(codec, data):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    return gzip.compress(data)
+
+def _decompress(codec, data):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is needed to read this capture")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+#----------------------------------------------------------------
+# Capture writer
+#----------------------------------------------------------------
+class CaptureWriter:
+    """
+    A class writing captured text to a chunked, compressed archive.
+
+    Attributes:
+        path  (str) : Directory of the archive
+        codec (str) : "zstd" or "gzip", zstd is used when available
+        meta  (dict): Optional description stored in capture.json
+
+    Methods:
+        write(self, text: str):
+            Append text to the archive, only complete lines are put into a
+            chunk so no line is split across chunks
+        flush(self, force: bool):
+            Compress the pending lines into a chunk
+        close(self):
+            Flush everything and close the segment file
+
+    Usage:
+        with CaptureWriter('results/TMEL/xxx/captures/TestPlatform1') as cw:
+            cw.write(termContent)
+    """
+    def __init__(self, path, codec = None, \
+                 chunkSize = chunkSizeLimit, chunkTime = chunkTimeLimit, \
+                 segmentSize = segmentSizeLimit, meta = None):
+        self.path        = path
+        self.codec       = codec if codec is not None else _default_codec()
+        self.chunkSize   = chunkSize
+        self.chunkTime   = chunkTime
+        self.segmentSize = segmentSize
+
+        self._lock       = threading.Lock()
+        self._pending    = b""
+        self._pendingStart = None
+        self._pendingEnd   = None
+        self._segmentNo  = -1
+        self._segment    = None
+        self._chunkNo    = 0
+        self._rawOffset  = 0
+        self._lineNo     = 0
+
+        os.makedirs(path, exist_ok = True)
+
+        # Describe what is captured (platform, RUMI, test) for the log index
+        if meta is not None:
+            with open(os.path.join(path, metaFileName), 'w') as mf:
+                json.dump(meta, mf)
+
+        # Continue an existing archive
+        for entry in read_capture_index(path):
+            self._segmentNo = entry['segment']
+            self._chunkNo   = entry['chunk'] + 1
+            self._rawOffset = entry['rawOffset'] + entry['rawLength']
+            self._lineNo    = entry['line'] + entry['lines']
+        self._index = open(os.path.join(path, indexFileName), 'a')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _open_segment(self):
+        if self._segment is not None:
+            self._segment.close()
+        self._segmentNo = self._segmentNo + 1
+        segmentFile = os.path.join(self.path, \
+            f"{segmentPrefix}{self._segmentNo:04d}.{self.codec}")
+        self._segment = open(segmentFile, 'ab')
+
+    def write(self, text, timestamp = None):
+        if not text:
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        data = text.encode('utf-8') if isinstance(text, str) else text
+
+        with self._lock:
+            if self._pendingStart is None:
+                self._pendingStart = timestamp
+            self._pending = self._pending + data
+            self._pendingEnd = timestamp
+
+            if len(self._pending) >= self.chunkSize or \
+                timestamp - self._pendingStart >= self.chunkTime:
+                self._flush(False)
+
+    def flush(self, force = True):
+        with self._lock:
+            self._flush(force)
+
+    def _flush(self, force):
+        if not self._pending:
+            return
+
+        # Keep the trailing partial line for the next chunk
+        if force:
+            data = self._pending
+            self._pending = b""
+        else:
+            cut = self._pending.rfind(b"\n") + 1
+            if cut == 0:
+                return
+            data = self._pending[:cut]
+            self._pending = self._pending[cut:]
+
+        if self._segment is None or self._segment.tell() >= self.segmentSize:
+            self._open_segment()
+
+        compressed = _compress(self.codec, data)
+        offset = self._segment.tell()
+        self._segment.write(compressed)
+        self._segment.flush()
+
+        lines = data.count(b"\n")
+        entry = {
+            'chunk':     self._chunkNo,
+            'segment':   self._segmentNo,
+            'codec':     self.codec,
+            'offset':    offset,
+            'length':    len(compressed),
+            'rawOffset': self._rawOffset,
+            'rawLength': len(data),
+            'line':      self._lineNo,
+            'lines':     lines,
+            'start':     self._pendingStart,
+            'end':       self._pendingEnd,
+        }
+        self._index.write(json.dumps(entry) + "\n")
+        self._index.flush()
+
+        self._chunkNo   = self._chunkNo + 1
+        self._rawOffset = self._rawOffset + len(data)
+        self._lineNo    = self._lineNo + lines
+        self._pendingStart = self._pendingEnd if self._pending else None
+
+    def close(self):
+        with self._lock:
+            self._flush(True)
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+            if not self._index.closed:
+                self._index.close()
+
+#----------------------------------------------------------------
+# Capture reader
+#----------------------------------------------------------------
+def read_capture_meta(path):
+    """Read the description of a capture archive, empty if not stored"""
+    try:
+        with open(os.path.join(path, metaFileName)) as mf:
+            return json.load(mf)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def read_capture_index(path):
+    """Read the chunk index of a capture archive
+
+    Args:
+        path (str): Directory of the archive
+
+    Returns:
+        List: Index entries ordered by chunk number
+    """
+    entries = []
+    indexFile = os.path.join(path, indexFileName)
+    if not os.path.exists(indexFile):
+        return entries
+
+    with open(indexFile) as inf:
+        for line in inf:
+            # The last line may be partial if the writer was killed
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break
+    return entries
+
+class CaptureReader:
+    """
+    A class giving random access to a capture archive.
+
+    Methods:
+        chunks(self, start: float, end: float):
+            Entries of the chunks overlapping the time window
+        read(self, start: float, end: float):
+            Text captured in the time window
+        grep(self, pattern: str, start: float, end: float):
+            [timestamp, line number, line] of the matching lines
+
+    Usage:
+        reader = CaptureReader('results/TMEL/xxx/captures/TestPlatform1')
+        for [ts, lineNo, line] in reader.grep("DDR training failed"):
+            print(ts, line)
+    """
+    def __init__(self, path):
+        self.path  = path
+        self.index = read_capture_index(path)
+        self._starts = [entry['start'] for entry in self.index]
+
+    def _segment_file(self, entry):
+        return os.path.join(self.path, \
+            f"{segmentPrefix}{entry['segment']:04d}.{entry['codec']}")
+
+    def chunks(self, start = None, end = None):
+        # Chunks are written in time order, so bisect to the first one
+        first = 0
+        if start is not None:
+            first = max(bisect.bisect_right(self._starts, start) - 1, 0)
+
+        for entry in self.index[first:]:
+            if start is not None and entry['end'] < start:
+                continue
+            if end is not None and entry['start'] > end:
+                break
+            yield entry
+
+    def read_chunk(self, entry):
+        with open(self._segment_file(entry), 'rb') as sf:
+            sf.seek(entry['offset'])
+            data = sf.read(entry['length'])
+        return _decompress(entry['codec'], data).decode('utf-8', 'replace')
+
+    def read(self, start = None, end = None):
+        return "".join(self.read_chunk(entry) for entry in self.chunks(start, end))
+
+    def grep(self, pattern, start = None, end = None, ignoreCase = False):
+        regex = re.compile(pattern, re.IGNORECASE if ignoreCase else 0)
+        for entry in self.chunks(start, end):
+            lineNo = entry['line']
+            for line in self.read_chunk(entry).splitlines():
+                if regex.search(line):
+                    yield [entry['start'], lineNo, line]
+                lineNo = lineNo + 1
+
+#----------------------------------------------------------------
+# Window poller
+#----------------------------------------------------------------
+class WindowCapture:
+    """
+    A class which continuously pulls a trace32 window (TERM or AREA) into
+    a capture archive in a background thread.
+
+    Attributes:
+        trace32  (Trace32) : The trace32 to read the window from
+        writer   (CaptureWriter) : The archive to write into
+        command  (str)   : Window command, e.g. "TERM.HARDCOPY" or "AREA"
+        interval (float) : Seconds between two reads
+
+    Usage:
+        capture = WindowCapture(tp.trace32, CaptureWriter(path))
+        capture.start()
+        ...
+        capture.stop()
+    """
+    def __init__(self, trace32, writer, command = "TERM.HARDCOPY", interval = 1.0):
+        self.trace32  = trace32
+        self.writer   = writer
+        self.command  = command
+        self.interval = interval
+        self.offset   = 0
+
+        self._stop   = threading.Event()
+        self._thread = None
+
+    def poll(self):
+        """Read the new contents of the window once
+
+        Returns:
+            0: success
+            !0: Failed to read the window
+        """
+        [rc, content, self.offset] = \
+            self.trace32.read_window(self.command, self.offset)
+        if rc == 0 and content:
+            self.writer.write(content)
+        return rc
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target = self._run, daemon = True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        # Get whatever is left in the window
+        self.poll()
+        self.writer.close()
@@ -0,0 +1,386 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   cmm_bundle.py
+@Time        :   2024/05/08 09:35:40
+@Author      :   Shiqi Duan
+@Description :   Preprocessor of the PRACTICE scripts. The DO graph of an
+                 init script is resolved once and the scripts are copied to
+                 a local bundle keyed by their content hash, with the nested
+                 DO calls pointed at the bundled copies, so trace32 does not
+                 read them from the shares again. The files loaded with
+                 Data.LOAD go to the image artifact cache. A bundle is
+                 reused as long as the size and mtime of its sources are
+                 unchanged.
+
+                 With profiling the nested DO calls are wrapped by markers
+                 printed to the AREA window, the time between the markers
+                 tells which scripts dominate the init time.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+
+defaultCacheDir = os.path.join(tempfile.gettempdir(), 'qverify_cmm')
+
+manifestName = "bundle.json"
+bundleVersion = 2
+
+# Markers printed around the nested scripts when profiling
+markerPrefix = "[qverify]"
+markerPattern = re.compile(re.escape(markerPrefix) + r" ([<>]) (\S+)")
+
+# DO, CD.DO and RUN with their abbreviations, an optional label before
+callPattern = re.compile(r'^(?P<head>\s*(?:[A-Za-z_]\w*:\s*)?)'\
+                         r'(?P<command>(?:CD\.)?DO|RUN)\s+(?P<file>"[^"]*"|\S+)(?P<tail>.*)$', \
+                         re.IGNORECASE)
+# The same after IF/ELSE on one line, rewritten but not profiled
+inlineCallPattern = re.compile(r'^(?P<head>\s*(?:IF\s+.*?\s|ELSE\s+))(?P<command>(?:CD\.)?DO)\s+'\
+                               r'(?P<file>"[^"]*"|\S+)(?P<tail>.*)$', re.IGNORECASE)
+loadPattern = re.compile(r'^(?P<head>\s*(?:[A-Za-z_]\w*:\s*)?)'\
+                         r'(?P<command>D(?:ata)?\.LOAD(?:\.\w+)?)\s+(?P<file>"[^"]*"|\S+)(?P<tail>.*)$', \
+                         re.IGNORECASE)
+cdPattern = re.compile(r'^\s*(?:ChDir|CD)\s+(?P<dir>"[^"]*"|\S+)\s*$', re.IGNORECASE)
+# Directory of the running script, the bundled copy runs from the bundle
+ppdPattern = re.compile(r'OS\.PPD\(\s*\)', re.IGNORECASE)
+stringPattern = re.compile(r'"[^"]*"')
+
+def _is_comment(line):
+    stripped = line.lstrip()
+    return stripped.startswith(';') or stripped.startswith('//')
+
+def _unquote(token):
+    return token[1:-1] if token.startswith('"') and token.endswith('"') else token
+
+def _uses_script_dir(line):
+    return '~~~~' in line or ppdPattern.search(stringPattern.sub('""', line)) is not None
+
+def _pin_script_dir(line, scriptDir):
+    """The line with ~~~~ and OS.PPD() replaced by the directory of the
+       original script, OS.PPD() is only evaluated outside the strings
+    """
+    parts = []
+    position = 0
+    for m in stringPattern.finditer(line):
+        parts.append(ppdPattern.sub(lambda p: f'"{scriptDir}"', line[position:m.start()]))
+        parts.append(m.group(0))
+        position = m.end()
+    parts.append(ppdPattern.sub(lambda p: f'"{scriptDir}"', line[position:]))
+    return "".join(parts).replace('~~~~', scriptDir)
+
+def _sha1_file(filePath):
+    sha = hashlib.sha1()
+    with open(filePath, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+class CmmScript:
+    """A script of the DO graph, with the references found in it"""
+    def __init__(self, path, workDir):
+        self.path    = path
+        self.workDir = workDir
+        self.lines   = []
+        self.calls   = {}     # line number -> [resolved path, workDir of the callee]
+        self.loads   = {}     # line number -> resolved path
+        self.unresolved = []
+
+#----------------------------------------------------------------
+# Bundler
+#----------------------------------------------------------------
+class CmmBundler:
+    """
+    A class resolving the DO graph of PRACTICE scripts into local bundles.
+
+    Scripts called with CD.DO run in their own directory, with DO in the
+    directory of the caller, "~~~~" and OS.PPD() are the directory of the
+    current script. They are pinned to the original directory in the
+    bundled copies. References using macros (&name) are left as they are
+    and reported in the manifest, like the other lines using the directory
+    of the script, e.g. &dir=OS.PPD(), as what they reach is not bundled.
+
+    Attributes:
+        cacheDir (str) : Directory of the bundles
+        loadFile (callable) : Maps the files of Data.LOAD to local copies,
+                              None to leave them
+
+    Methods:
+        bundle(self, entry: str, profile = False):
+            Manifest of the bundle of the entry script, built if needed
+
+    Usage:
+        bundler = CmmBundler(loadFile = get_artifact_cache().fetch)
+        manifest = bundler.bundle(tp.trace32.initCmm)
+        tp.trace32.execute_cmm_script(manifest['entry'])
+    """
+    def __init__(self, cacheDir = defaultCacheDir, loadFile = None):
+        self.cacheDir = cacheDir
+        self.loadFile = loadFile
+        self._lock    = threading.Lock()
+
+    #----------------------------------------------------------------
+    # Graph
+    #----------------------------------------------------------------
+    def _resolve(self, token, script, workDir):
+        name = _unquote(token)
+        if '&' in name or name.startswith('~~') and not name.startswith('~~~~'):
+            return None
+        name = _pin_script_dir(name, os.path.dirname(script))
+        name = name.replace('\\', os.sep) if os.sep != '\\' else name
+        candidates = [name] if os.path.isabs(name) else \
+                     [os.path.join(workDir, name), os.path.join(os.path.dirname(script), name)]
+        for candidate in candidates:
+            for filePath in (candidate, candidate + ".cmm"):
+                if os.path.isfile(filePath):
+                    return os.path.normpath(os.path.abspath(filePath))
+        return None
+
+    def resolve_graph(self, entry):
+        """Read the scripts reachable from the entry
+
+        Returns:
+            Dict: (path, workDir) -> CmmScript, the entry first. A script
+                  called from several directories is bundled once for each
+        """
+        entry = os.path.normpath(os.path.abspath(entry))
+        scripts = {}
+        pending = [[entry, os.path.dirname(entry)]]
+        while pending:
+            [scriptPath, workDir] = pending.pop()
+            if (scriptPath, workDir) in scripts:
+                continue
+            script = CmmScript(scriptPath, workDir)
+            with open(scriptPath, encoding = 'utf-8', errors = 'replace') as sf:
+                script.lines = sf.read().splitlines()
+            scripts[(scriptPath, workDir)] = script
+
+            for number, line in enumerate(script.lines):
+                if _is_comment(line):
+                    continue
+                cd = cdPattern.match(line)
+                if cd is not None:
+                    newDir = _unquote(_pin_script_dir(cd.group('dir'), os.path.dirname(scriptPath)))
+                    workDir = newDir if os.path.isabs(newDir) else os.path.join(workDir, newDir)
+                    continue
+                m = callPattern.match(line) or inlineCallPattern.match(line)
+                if m is not None:
+                    target = self._resolve(m.group('file'), scriptPath, workDir)
+                    if target is None:
+                        script.unresolved.append(line.strip())
+                        continue
+                    calleeDir = os.path.dirname(target) \
+                                if m.group('command').upper().startswith('CD.') else workDir
+                    script.calls[number] = [target, calleeDir]
+                    pending.append([target, calleeDir])
+                    continue
+                m = loadPattern.match(line)
+                if m is not None and self.loadFile is not None:
+                    target = self._resolve(m.group('file'), scriptPath, workDir)
+                    if target is None:
+                        script.unresolved.append(line.strip())
+                    else:
+                        script.loads[number] = target
+                    continue
+                if _uses_script_dir(line):
+                    script.unresolved.append(line.strip())
+        return scripts
+
+    #----------------------------------------------------------------
+    # Bundle
+    #----------------------------------------------------------------
+    @staticmethod
+    def _bundled_name(scriptPath, workDir):
+        digest = hashlib.sha1(f"{scriptPath}|{workDir}".encode()).hexdigest()[:8]
+        return f"{digest}_{os.path.basename(scriptPath)}"
+
+    def _rewrite(self, script, bundleDir, profile):
+        lines = []
+        scriptDir = os.path.dirname(script.path)
+        if os.path.normcase(script.workDir) == os.path.normcase(scriptDir):
+            # CD.DO moved into the bundle, go back to where the script ran
+            lines.append(f'CD "{scriptDir}"')
+        for number, line in enumerate(script.lines):
+            if number in script.calls:
+                name = self._bundled_name(*script.calls[number])
+                m = callPattern.match(line)
+                profiled = profile and m is not None and not m.group("head").strip()
+                if m is None:
+                    m = inlineCallPattern.match(line)
+                call = f'{m.group("head")}{m.group("command")} ' \
+                       f'"{os.path.join(bundleDir, name)}"{m.group("tail")}'
+                if profiled:
+                    # A block keeps the call a single command after an IF
+                    indent = re.match(r'\s*', line).group(0)
+                    lines += [f"{indent}(", f'{indent}  PRINT "{markerPrefix} > {name}"', \
+                              "  " + call, f'{indent}  PRINT "{markerPrefix} < {name}"', f"{indent})"]
+                else:
+                    lines.append(call)
+            elif number in script.loads:
+                m = loadPattern.match(line)
+                localPath = self.loadFile(script.loads[number])
+                lines.append(f'{m.group("head")}{m.group("command")} "{localPath}"{m.group("tail")}')
+            else:
+                lines.append(line)
+        return "\n".join(_pin_script_dir(line, scriptDir) if not _is_comment(line) else line \
+                         for line in lines) + "\n"
+
+    def _manifest_path(self, entry, profile):
+        digest = hashlib.sha1(f"{entry}|{profile}".encode()).hexdigest()[:16]
+        return os.path.join(self.cacheDir, 'entries', f"{digest}.json")
+
+    def _unchanged(self, manifest):
+        for source, [size, mtime, sha1] in manifest['sources'].items():
+            try:
+                stat = os.stat(source)
+            except OSError:
+                return False
+            if stat.st_size != size or stat.st_mtime != mtime:
+                return False
+        return os.path.isfile(manifest['entry'])
+
+    def bundle(self, entry, profile = False):
+        """Bundle of an entry script, reused if no source changed
+
+        Returns:
+            Dict: manifest with the bundled entry script, the sources and
+                  the references which could not be resolved
+        """
+        entry = os.path.normpath(os.path.abspath(entry))
+        manifestPath = self._manifest_path(entry, profile)
+        with self._lock:
+            try:
+                with open(manifestPath) as mf:
+                    manifest = json.load(mf)
+                if manifest.get('version') == bundleVersion and self._unchanged(manifest):
+                    manifest['reused'] = True
+                    return manifest
+            except (FileNotFoundError, ValueError):
+                pass
+
+            scripts = self.resolve_graph(entry)
+            sources = {}
+            sha = hashlib.sha1(f"{bundleVersion}|{profile}".encode())
+            for scriptPath in sorted(set(path for [path, workDir] in scripts)):
+                stat = os.stat(scriptPath)
+                fileHash = _sha1_file(scriptPath)
+                sources[scriptPath] = [stat.st_size, stat.st_mtime, fileHash]
+                sha.update(f"{scriptPath}|{fileHash}".encode())
+            # Loaded files are part of the key as the bundle points at their copies
+            for script in scripts.values():
+                for target in script.loads.values():
+                    if target not in sources:
+                        stat = os.stat(target)
+                        sources[target] = [stat.st_size, stat.st_mtime, None]
+                        sha.update(f"{target}|{stat.st_size}|{stat.st_mtime}".encode())
+            key = sha.hexdigest()[:16]
+
+            bundleDir = os.path.join(self.cacheDir, key)
+            if not os.path.isfile(os.path.join(bundleDir, manifestName)):
+                os.makedirs(self.cacheDir, exist_ok = True)
+                tmpDir = tempfile.mkdtemp(prefix = f".{key}.", dir = self.cacheDir)
+                for script in scripts.values():
+                    with open(os.path.join(tmpDir, self._bundled_name(script.path, script.workDir)), \
+                              'w') as bf:
+                        bf.write(self._rewrite(script, bundleDir, profile))
+                with open(os.path.join(tmpDir, manifestName), 'w') as mf:
+                    json.dump({'key': key, 'entry': entry}, mf)
+                try:
+                    os.replace(tmpDir, bundleDir)
+                except OSError:
+                    # Built by another run meanwhile
+                    shutil.rmtree(tmpDir, ignore_errors = True)
+
+            manifest = {
+                'version':    bundleVersion,
+                'key':        key,
+                'source':     entry,
+                'entry':      os.path.join(bundleDir, \
+                                           self._bundled_name(entry, os.path.dirname(entry))),
+                'profile':    profile,
+                'sources':    sources,
+                'unresolved': {script.path: script.unresolved for script in scripts.values() \
+                               if script.unresolved},
+            }
+            os.makedirs(os.path.dirname(manifestPath), exist_ok = True)
+            tmpFile = manifestPath + f".{os.getpid()}.tmp"
+            with open(tmpFile, 'w') as mf:
+                json.dump(manifest, mf, indent = 1)
+            os.replace(tmpFile, manifestPath)
+            manifest['reused'] = False
+            return manifest
+
+#----------------------------------------------------------------
+# Profile
+#----------------------------------------------------------------
+class CmmProfiler:
+    """
+    A writer of the AREA contents turning the markers of a profiled bundle
+    into the time spent in every script.
+
+    Attributes:
+        times (dict) : bundled script name -> [calls, total seconds,
+                       seconds in the script itself]
+
+    Usage:
+        profiler = CmmProfiler()
+        profiler.write(areaContent)   # While the script runs
+        profiler.report()
+    """
+    def __init__(self, clock = time.monotonic):
+        self.clock  = clock
+        self.times  = {}
+        self._stack = []
+        self._pending = ""
+
+    def write(self, content):
+        now = self.clock()
+        lines = (self._pending + content).split("\n")
+        self._pending = lines.pop()
+        for line in lines:
+            m = markerPattern.search(line)
+            if m is None:
+                continue
+            [direction, name] = m.groups()
+            if direction == ">":
+                self._stack.append([name, now, 0.0])
+            elif self._stack and self._stack[-1][0] == name:
+                [name, start, children] = self._stack.pop()
+                elapsed = now - start
+                entry = self.times.setdefault(name, [0, 0.0, 0.0])
+                entry[0] = entry[0] + 1
+                entry[1] = entry[1] + elapsed
+                entry[2] = entry[2] + elapsed - children
+                if self._stack:
+                    self._stack[-1][2] = self._stack[-1][2] + elapsed
+
+    def close(self):
+        pass
+
+    def report(self):
+        """[[script, calls, total, self]] sorted by the time in the script itself"""
+        rows = [[name.split('_', 1)[-1], calls, total, own] \
+                for name, [calls, total, own] in self.times.items()]
+        return sorted(rows, key = lambda row: row[3], reverse = True)
+
+_bundler = None
+_bundlerLock = threading.Lock()
+
+def get_cmm_bundler(cacheDir = None, loadFile = None):
+    """Get the bundler of the process, created at the first call and again
+       when another cacheDir is given, e.g. once the settings are read
+    """
+    global _bundler
+    with _bundlerLock:
+        if _bundler is None or (cacheDir and cacheDir != _bundler.cacheDir):
+            _bundler = CmmBundler(cacheDir or defaultCacheDir, loadFile)
+        elif loadFile is not None:
+            _bundler.loadFile = loadFile
+        return _bundler
@@ -0,0 +1,326 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   golden_diff.py
+@Time        :   2024/05/14 10:26:48
+@Author      :   Shiqi Duan
+@Description :   Streaming comparison of a boot log against a golden log. The
+                 lines of both sides come from generators and are normalized
+                 by the rules of config/log_normalization.json, compiled once
+                 into a single pattern, so the timestamps, addresses and
+                 cycle counts changing from run to run do not count. The
+                 sides are aligned within a window of lines, the memory used
+                 is bounded by the window whatever the size of the logs.
+
+                 {
+                     "<project>": {
+                         "replace": [{"pattern": "...", "replace": "..."}],
+                         "ignore":  ["<pattern of the lines skipped>"]
+                     }
+                 }
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import os
+import re
+import json
+import threading
+import collections
+
+normalizationFile = os.path.join(os.path.dirname(os.path.dirname( \
+    os.path.dirname(os.path.abspath(__file__)))), 'config', 'log_normalization.json')
+
+# Rules shared by all the projects
+commonProject = "common"
+
+# Lines looked ahead on each side to align them again after a difference
+defaultWindow = 256
+
+# Lines which must match in a row for the sides to be aligned again
+defaultAnchor = 2
+
+# Differences kept for the report, the later ones are only counted
+defaultMaxHunks = 20
+
+# Compiled normalizers, keyed by (normalization file, project)
+_normalizers = {}
+_normalizersLock = threading.Lock()
+
+#----------------------------------------------------------------
+# Normalizer
+#----------------------------------------------------------------
+class Normalizer:
+    """
+    A class normalizing log lines with the rules of a project.
+
+    Attributes:
+        project (str)        : Project of the DUT, e.g. miami or alder
+        matcher (re.Pattern) : All the replace rules in a single pattern
+        ignorer (re.Pattern) : All the ignore rules in a single pattern
+
+    Methods:
+        normalize(self, line: str):
+            The normalized line, None if the line is ignored
+
+    Usage:
+        normalizer = get_normalizer('miami')
+        normalizer.normalize("[ 1.234] Booting at 0x80000000")
+    """
+    def __init__(self, project, rules):
+        self.project = project
+        self._rules  = {}
+
+        alternatives = []
+        for rule in rules.get('replace', []):
+            # Every rule alone expands its own back references
+            group = f"g{len(self._rules)}"
+            self._rules[group] = [re.compile(rule['pattern']), rule.get('replace', '')]
+            alternatives.append(f"(?P<{group}>{rule['pattern']})")
+        self.matcher = re.compile('|'.join(alternatives)) if alternatives else None
+
+        ignores = rules.get('ignore', [])
+        for pattern in ignores:
+            re.compile(pattern)
+        self.ignorer = re.compile('|'.join(f"(?:{pattern})" for pattern in ignores)) \
+                       if ignores else None
+
+    def _replace(self, m):
+        [pattern, replace] = self._rules[m.lastgroup]
+        return pattern.sub(replace, m.group(0), count = 1)
+
+    def normalize(self, line):
+        line = line.rstrip("\r\n")
+        if self.ignorer is not None and self.ignorer.search(line):
+            return None
+        if self.matcher is None:
+            return line
+        return self.matcher.sub(self._replace, line)
+
+def load_normalization(project, jsonFile = normalizationFile):
+    """Read the common and the project rules, the project rules come last"""
+    with open(jsonFile) as jf:
+        config = json.load(jf)
+    rules = {'replace': [], 'ignore': []}
+    for name in (commonProject, project):
+        for kind in rules:
+            rules[kind] = rules[kind] + config.get(name, {}).get(kind, [])
+    return rules
+
+def get_normalizer(project, jsonFile = normalizationFile):
+    """Get the compiled normalizer of a project, compiled at the first call"""
+    key = (jsonFile, project)
+    with _normalizersLock:
+        if key not in _normalizers:
+            _normalizers[key] = Normalizer(project, load_normalization(project, jsonFile))
+        return _normalizers[key]
+
+#----------------------------------------------------------------
+# Line sources
+#----------------------------------------------------------------
+def iter_lines(chunks):
+    """Lines of a text arriving in chunks, e.g. the reads of a window"""
+    partial = ""
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode('utf-8', 'replace')
+        lines = (partial + chunk).split("\n")
+        partial = lines.pop()
+        yield from lines
+    if partial:
+        yield partial
+
+def file_lines(filePath):
+    with open(filePath, encoding = 'utf-8', errors = 'replace') as lf:
+        for line in lf:
+            yield line
+
+def normalized_lines(lines, normalizer):
+    """[line number, normalized line, line] of the lines not ignored"""
+    for number, line in enumerate(lines, 1):
+        normalized = normalizer.normalize(line)
+        if normalized is not None:
+            yield [number, normalized, line.rstrip("\r\n")]
+
+#----------------------------------------------------------------
+# Diff
+#----------------------------------------------------------------
+class GoldenDiff:
+    """
+    A class comparing two line streams within a bounded window.
+
+    Both sides are read line by line, equal lines are consumed at once.
+    After a difference up to window lines of each side are buffered and
+    the closest pair of equal lines followed by anchor more equal lines is
+    looked for. The lines skipped before it are reported as changed when
+    both sides skipped some, then as added to the log or missing from it.
+    Without such a pair the first line of each side is reported as changed.
+
+    Attributes:
+        normalizer (Normalizer) : Rules applied to both sides
+        window     (int)        : Lines buffered on each side at most
+        anchor     (int)        : Equal lines in a row to align again
+        maxHunks   (int)        : Differences kept for the report
+
+    Methods:
+        compare(self, actual, golden):
+            Dict of the result, see below
+
+    Usage:
+        diff = GoldenDiff(get_normalizer('miami'))
+        result = diff.compare(iter_lines(termChunks), file_lines("golden.log"))
+    """
+    def __init__(self, normalizer, window = defaultWindow, anchor = defaultAnchor, \
+                 maxHunks = defaultMaxHunks):
+        self.normalizer = normalizer
+        self.window     = max(int(window), 1)
+        self.anchor     = max(int(anchor), 1)
+        self.maxHunks   = int(maxHunks)
+
+    @staticmethod
+    def _fill(pending, source, count):
+        while len(pending) < count:
+            line = next(source, None)
+            if line is None:
+                return False
+            pending.append(line)
+        return True
+
+    def _anchored(self, actual, golden, i, j, actualMore, goldenMore):
+        """The lines after actual[i] and golden[j] match too, as far as
+           they are buffered, running out of lines only counts as matching
+           once both logs ended
+        """
+        for k in range(1, self.anchor):
+            if i + k >= len(actual) or j + k >= len(golden):
+                return not (actualMore or goldenMore)
+            if actual[i + k][1] != golden[j + k][1]:
+                return False
+        return True
+
+    def _align(self, actual, golden, actualMore, goldenMore):
+        """[i, j] of the closest aligned pair, None if there is none. The
+           golden positions are indexed by the anchor lines starting there,
+           a line repeated all over the window costs a lookup, not a scan
+        """
+        anchor = self.anchor
+        actualKeys = [line[1] for line in actual]
+        goldenKeys = [line[1] for line in golden]
+        actualGrams = list(zip(*(actualKeys[k:] for k in range(anchor))))
+        goldenGrams = list(zip(*(goldenKeys[k:] for k in range(anchor))))
+        # The first position of every gram wins
+        firsts = dict(zip(reversed(goldenGrams), range(len(goldenGrams) - 1, -1, -1)))
+        # Pairs without anchor lines after them, only at the end of the logs
+        ended = not (actualMore or goldenMore)
+        goldenTail = range(len(goldenGrams), len(golden)) if ended else ()
+
+        best = None
+        for i in range(len(actual)):
+            if best is not None and i >= best[0] + best[1]:
+                break
+            if i < len(actualGrams):
+                j = firsts.get(actualGrams[i])
+                if j is not None and (best is None or i + j < best[0] + best[1]):
+                    best = [i, j]
+                candidates = goldenTail
+            elif ended:
+                candidates = range(len(golden))
+            else:
+                break
+            for j in candidates:
+                if best is not None and i + j >= best[0] + best[1]:
+                    break
+                if goldenKeys[j] == actualKeys[i] and \
+                    self._anchored(actual, golden, i, j, actualMore, goldenMore):
+                    best = [i, j]
+        return best
+
+    def compare(self, actual, golden):
+        """Compare the actual lines with the golden lines
+
+        Args:
+            actual (iterable): Lines of the log
+            golden (iterable): Lines of the golden log
+
+        Returns:
+            Dict:
+                equal      : No difference
+                matched    : Lines equal on both sides
+                added      : Lines of the log not in the golden log
+                missing    : Lines of the golden log not in the log
+                changed    : Lines different on both sides
+                first      : First difference, None if equal
+                hunks      : The first differences, [kind, actual line
+                             number, golden line number, actual, expected]
+        """
+        actualSource = normalized_lines(actual, self.normalizer)
+        goldenSource = normalized_lines(golden, self.normalizer)
+        actualPending = collections.deque()
+        goldenPending = collections.deque()
+        counts = {'matched': 0, 'added': 0, 'missing': 0, 'changed': 0}
+        hunks = []
+
+        def record(kind, actualLine, goldenLine):
+            counts[kind] = counts[kind] + 1
+            if len(hunks) < self.maxHunks:
+                hunks.append([kind, actualLine[0] if actualLine else None, \
+                              goldenLine[0] if goldenLine else None, \
+                              actualLine[2] if actualLine else None, \
+                              goldenLine[2] if goldenLine else None])
+
+        while True:
+            actualMore = self._fill(actualPending, actualSource, 1)
+            goldenMore = self._fill(goldenPending, goldenSource, 1)
+            if not actualPending and not goldenPending:
+                break
+            if not goldenPending:
+                record('added', actualPending.popleft(), None)
+                continue
+            if not actualPending:
+                record('missing', None, goldenPending.popleft())
+                continue
+            if actualPending[0][1] == goldenPending[0][1]:
+                counts['matched'] = counts['matched'] + 1
+                actualPending.popleft()
+                goldenPending.popleft()
+                continue
+
+            # Difference, look ahead on both sides to align them again
+            actualMore = self._fill(actualPending, actualSource, self.window)
+            goldenMore = self._fill(goldenPending, goldenSource, self.window)
+            aligned = self._align(list(actualPending), list(goldenPending), \
+                                  actualMore, goldenMore)
+            if aligned is None:
+                record('changed', actualPending.popleft(), goldenPending.popleft())
+                continue
+            # Lines skipped on both sides pair up, as changed ones unless
+            # the pair happens to be equal
+            [i, j] = aligned
+            for _ in range(min(i, j)):
+                [actualLine, goldenLine] = [actualPending.popleft(), goldenPending.popleft()]
+                if actualLine[1] == goldenLine[1]:
+                    counts['matched'] = counts['matched'] + 1
+                else:
+                    record('changed', actualLine, goldenLine)
+            for _ in range(i - min(i, j)):
+                record('added', actualPending.popleft(), None)
+            for _ in range(j - min(i, j)):
+                record('missing', None, goldenPending.popleft())
+
+        return {
+            'equal':       counts['added'] + counts['missing'] + counts['changed'] == 0,
+            'matched':     counts['matched'],
+            'added':       counts['added'],
+            'missing':     counts['missing'],
+            'changed':     counts['changed'],
+            'first':       hunks[0] if hunks else None,
+            'hunks':       hunks,
+        }
+
+def format_hunk(hunk):
+    [kind, actualNumber, goldenNumber, actualLine, goldenLine] = hunk
+    if kind == 'added':
+        return f"+ log:{actualNumber}: {actualLine}"
+    if kind == 'missing':
+        return f"- golden:{goldenNumber}: {goldenLine}"
+    return f"! log:{actualNumber}: {actualLine}\n  golden:{goldenNumber}: {goldenLine}"
@@ -0,0 +1,260 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   health.py
+@Time        :   2024/04/18 15:22:04
+@Author      :   Shiqi Duan
+@Description :   Health of the RUMI servers and trace32 API ports. Every
+                 endpoint keeps a latency EWMA, failure counters and a
+                 circuit breaker, so requests to an endpoint known to be
+                 down fail at once instead of waiting a socket timeout.
+                 Endpoints are fed both by background probes and by the
+                 results of the real requests.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import time
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class BreakerState:
+    CLOSED    = "closed"       # Requests go through
+    OPEN      = "open"         # Requests fail at once
+    HALF_OPEN = "half_open"    # One trial request is let through, another
+                               # one if it records nothing in resetTimeout
+
+# Returned by a prober which could not check the endpoint this time, e.g.
+# the trace32 API is in use, nothing is recorded
+probeSkipped = object()
+
+def probe_tcp(host, port, timeout = 2):
+    """Connect to the endpoint
+
+    Returns:
+        Latency of the connection in milliseconds, None if unreachable
+    """
+    start = time.perf_counter()
+    try:
+        with socket.create_connection((host, port), timeout = timeout):
+            pass
+    except OSError:
+        return None
+    return (time.perf_counter() - start) * 1000
+
+#----------------------------------------------------------------
+# Endpoint health
+#----------------------------------------------------------------
+class EndpointHealth:
+    """
+    A class holding the health of a single endpoint.
+
+    Attributes:
+        kind      (str)   : "rumi" or "trace32"
+        host      (str)   : Host name of the endpoint
+        port      (int)   : Port of the endpoint
+        latency   (float) : EWMA of the latency in milliseconds
+        failures  (int)   : Consecutive failures
+        totalFailures (int) : Failures since start
+        state     (str)   : State of the circuit breaker
+
+    Methods:
+        allow(self):
+            Whether a request may be sent, False while the breaker is open
+        record_success(self, latency: float):
+            A request or probe succeeded
+        record_failure(self):
+            A request or probe failed
+    """
+    def __init__(self, kind, host, port, failureThreshold = 3, \
+                 resetTimeout = 30, alpha = 0.3):
+        self.kind     = kind
+        self.host     = host
+        self.port     = port
+        self.failureThreshold = failureThreshold
+        self.resetTimeout     = resetTimeout
+        self.alpha    = alpha
+
+        self.latency  = None
+        self.failures = 0
+        self.totalFailures = 0
+        self.state    = BreakerState.CLOSED
+        self.openedAt = None
+        self.lastCheck = None
+        self._lock    = threading.Lock()
+
+    def __str__(self) -> str:
+        latency = "-" if self.latency is None else f"{self.latency:.1f} ms"
+        return f"{self.kind} {self.host}:{self.port} {self.state} "\
+               f"latency {latency} failures {self.failures}/{self.totalFailures}"
+
+    def allow(self):
+        with self._lock:
+            if self.state == BreakerState.CLOSED:
+                return True
+            if time.monotonic() - self.openedAt >= self.resetTimeout:
+                # Let a single trial request find out if it is back, the
+                # time of the trial is kept so a trial which never records
+                # its outcome does not block the endpoint for good
+                self.state    = BreakerState.HALF_OPEN
+                self.openedAt = time.monotonic()
+                return True
+            return False
+
+    def record_success(self, latency = None):
+        with self._lock:
+            self.lastCheck = time.time()
+            if latency is not None:
+                self.latency = latency if self.latency is None \
+                    else self.alpha * latency + (1 - self.alpha) * self.latency
+            self.failures = 0
+            self.state    = BreakerState.CLOSED
+            self.openedAt = None
+
+    def record_failure(self):
+        with self._lock:
+            self.lastCheck = time.time()
+            self.failures = self.failures + 1
+            self.totalFailures = self.totalFailures + 1
+            if self.state == BreakerState.HALF_OPEN \
+                or self.failures >= self.failureThreshold:
+                self.state    = BreakerState.OPEN
+                self.openedAt = time.monotonic()
+
+    def record(self, latency):
+        if latency is None:
+            self.record_failure()
+        else:
+            self.record_success(latency)
+
+#----------------------------------------------------------------
+# Health monitor
+#----------------------------------------------------------------
+class HealthMonitor:
+    """
+    A class probing all the registered endpoints in background.
+
+    Methods:
+        register(self, kind: str, host: str, port: int):
+            Add an endpoint, returns its EndpointHealth
+        set_prober(self, kind: str, prober):
+            Check the endpoints of a kind with prober(host, port, timeout)
+            instead of a TCP connection, e.g. the UDP trace32 API
+        allow(self, host: str, port: int):
+            Whether a request to the endpoint may be sent
+        start(self, interval: float):
+            Probe all the endpoints concurrently every interval seconds
+        pick_rumi(self, rumis: dict):
+            Name of the reachable RUMI with the lowest latency
+
+    Usage:
+        monitor = get_health_monitor()
+        monitor.register("rumi", "blr-s4b-q07558", 9999)
+        monitor.start()
+        if not monitor.allow("blr-s4b-q07558", 9999):
+            ...
+    """
+    def __init__(self, probeTimeout = 2, maxWorkers = 16):
+        self.probeTimeout = probeTimeout
+        self.endpoints = {}
+        self._lock     = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers = maxWorkers, \
+                                            thread_name_prefix = "health-probe")
+        self._stop     = threading.Event()
+        self._thread   = None
+        self._probers  = {}
+
+    def set_prober(self, kind, prober):
+        """prober(host, port, timeout) returns the latency in milliseconds,
+           None if unreachable or probeSkipped
+        """
+        self._probers[kind] = prober
+
+    def register(self, kind, host, port):
+        key = (host, int(port))
+        with self._lock:
+            if key not in self.endpoints:
+                self.endpoints[key] = EndpointHealth(kind, host, int(port))
+            return self.endpoints[key]
+
+    def get(self, host, port):
+        return self.endpoints.get((host, int(port)))
+
+    def allow(self, host, port):
+        endpoint = self.get(host, port)
+        return endpoint is None or endpoint.allow()
+
+    def record(self, host, port, latency, kind = "rumi"):
+        self.register(kind, host, port).record(latency)
+
+    def probe(self, endpoint):
+        prober = self._probers.get(endpoint.kind, probe_tcp)
+        latency = prober(endpoint.host, endpoint.port, self.probeTimeout)
+        if latency is not probeSkipped:
+            endpoint.record(latency)
+        return endpoint
+
+    def probe_all(self):
+        """Probe all the endpoints concurrently and wait for the results"""
+        with self._lock:
+            endpoints = list(self.endpoints.values())
+        futures = [self._executor.submit(self.probe, endpoint) for endpoint in endpoints]
+        for endpoint, future in zip(endpoints, futures):
+            try:
+                future.result()
+            except Exception:
+                # A prober raising counts as an unreachable endpoint, the
+                # monitor keeps probing the others
+                endpoint.record_failure()
+        return endpoints
+
+    def _run(self, interval):
+        while not self._stop.is_set():
+            self.probe_all()
+            self._stop.wait(interval)
+
+    def start(self, interval = 10):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target = self._run, args = (interval,), \
+                                            daemon = True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def pick_rumi(self, rumis):
+        """Pick the RUMI to route work to
+
+        Args:
+            rumis (dict): name -> RUMI object
+
+        Returns:
+            Name of the RUMI with a closed breaker and the lowest latency,
+            None if none of them is healthy
+        """
+        candidates = []
+        for name, rumi in rumis.items():
+            endpoint = self.register("rumi", rumi.ip, rumi.port)
+            if endpoint.state != BreakerState.CLOSED:
+                continue
+            latency = endpoint.latency if endpoint.latency is not None else float('inf')
+            candidates.append([latency, endpoint.failures, name])
+        if not candidates:
+            return None
+        return min(candidates)[2]
+
+_monitor = None
+_monitorLock = threading.Lock()
+
+def get_health_monitor():
+    """Get the health monitor shared by the process"""
+    global _monitor
+    with _monitorLock:
+        if _monitor is None:
+            _monitor = HealthMonitor()
+        return _monitor
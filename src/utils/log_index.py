@@ -0,0 +1,269 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   log_index.py
+@Time        :   2024/04/10 16:05:42
+@Author      :   Shiqi Duan
+@Description :   Inverted index over the TERM captures stored under results.
+                 Tokens are mapped to the capture archive and chunk where
+                 they appear, so a signature can be located across all runs
+                 with an index lookup plus the decompression of only the
+                 candidate chunks.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import os
+import re
+import sys
+import sqlite3
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.capture_archive import CaptureReader, read_capture_index, \
+                                  read_capture_meta, indexFileName
+
+indexDbName = "term_index.sqlite"
+tokenPattern = re.compile(r"[a-z0-9_]{2,}")
+
+def tokenize(text):
+    return set(tokenPattern.findall(text.lower()))
+
+def find_capture_dirs(resultsDir):
+    """Find all capture archives under the results directory"""
+    for root, dirs, files in os.walk(resultsDir):
+        if indexFileName in files:
+            dirs[:] = []
+            yield root
+
+def _run_name(resultsDir, captureDir):
+    # results/<module>/<timestamp>/captures/<test>/<platform>
+    relPath = os.path.relpath(captureDir, resultsDir)
+    parts = relPath.split(os.sep)
+    if 'captures' in parts:
+        parts = parts[:parts.index('captures')]
+    return '/'.join(parts)
+
+#----------------------------------------------------------------
+# Log index
+#----------------------------------------------------------------
+class LogIndex:
+    """
+    A class maintaining the inverted index of the TERM captures.
+
+    Attributes:
+        resultsDir (str): Root directory of the test results
+        dbFile     (str): Path of the sqlite index file
+
+    Methods:
+        update(self):
+            Index the chunks added since the last update
+        search(self, text: str):
+            First appearance of the text in every run
+
+    Usage:
+        index = LogIndex('results')
+        index.update()
+        for hit in index.search("DDR training failed"):
+            print(hit)
+    """
+    def __init__(self, resultsDir, dbFile = None):
+        self.resultsDir = resultsDir
+        self.dbFile = dbFile if dbFile is not None \
+                      else os.path.join(resultsDir, indexDbName)
+        self.db = sqlite3.connect(self.dbFile)
+        self.db.create_function("reverse", 1, lambda token: token[::-1], deterministic = True)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS captures (
+                id       INTEGER PRIMARY KEY,
+                path     TEXT UNIQUE,
+                run      TEXT,
+                rumi     TEXT,
+                platform TEXT,
+                test     TEXT,
+                chunks   INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                token    TEXT,
+                capture  INTEGER,
+                chunk    INTEGER,
+                PRIMARY KEY (token, capture, chunk)
+            ) WITHOUT ROWID;
+            -- The distinct tokens, reversed is searched for the tokens
+            -- ending with a word
+            CREATE TABLE IF NOT EXISTS tokens (
+                token    TEXT PRIMARY KEY,
+                reversed TEXT
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS tokensReversed ON tokens (reversed);
+        """)
+        # An index built before the tokens table
+        if self.db.execute("SELECT NOT EXISTS (SELECT 1 FROM tokens) "\
+                           "AND EXISTS (SELECT 1 FROM postings)").fetchone()[0]:
+            self.db.execute("INSERT INTO tokens SELECT DISTINCT token, reverse(token) "\
+                            "FROM postings")
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def _capture_id(self, captureDir):
+        path = os.path.relpath(captureDir, self.resultsDir)
+        row = self.db.execute("SELECT id, chunks FROM captures WHERE path = ?", \
+                              (path,)).fetchone()
+        if row is not None:
+            return row
+
+        meta = read_capture_meta(captureDir)
+        cursor = self.db.execute(
+            "INSERT INTO captures (path, run, rumi, platform, test, chunks) "\
+            "VALUES (?, ?, ?, ?, ?, 0)", \
+            (path, _run_name(self.resultsDir, captureDir), meta.get('rumi', ''), \
+             meta.get('platform', os.path.basename(captureDir)), meta.get('test', '')))
+        return [cursor.lastrowid, 0]
+
+    def update(self):
+        """Index the new chunks of all captures, the chunks are appended
+           only so every capture just continues from the last indexed one
+
+        Returns:
+            Number of chunks indexed
+        """
+        indexed = 0
+        for captureDir in find_capture_dirs(self.resultsDir):
+            [captureId, chunks] = self._capture_id(captureDir)
+            entries = read_capture_index(captureDir)
+            if len(entries) <= chunks:
+                continue
+
+            reader = CaptureReader(captureDir)
+            for entry in entries[chunks:]:
+                tokens = tokenize(reader.read_chunk(entry))
+                self.db.executemany(
+                    "INSERT OR IGNORE INTO postings VALUES (?, ?, ?)", \
+                    ((token, captureId, entry['chunk']) for token in tokens))
+                self.db.executemany(
+                    "INSERT OR IGNORE INTO tokens VALUES (?, ?)", \
+                    ((token, token[::-1]) for token in tokens))
+            self.db.execute("UPDATE captures SET chunks = ? WHERE id = ?", \
+                            (len(entries), captureId))
+            self.db.commit()
+            indexed = indexed + len(entries) - chunks
+        return indexed
+
+    @staticmethod
+    def token_patterns(text):
+        """GLOB patterns of the indexed tokens a text must appear in. A word
+           cut by an end of the text may be a part of a longer token, the
+           word at the start ends a token and the word at the end starts
+           one, e.g. "training fail" is in "DDR training failed"
+        """
+        text = text.lower()
+        patterns = set()
+        for m in tokenPattern.finditer(text):
+            pattern = m.group(0)
+            if m.start() == 0:
+                pattern = '*' + pattern
+            if m.end() == len(text):
+                pattern = pattern + '*'
+            patterns.add(pattern)
+        return patterns
+
+    def _candidates(self, patterns):
+        """[capture, chunk] with a token matching each of the patterns,
+           every chunk if there is no pattern, ordered by time
+        """
+        if not patterns:
+            return [[captureId, chunk] for [captureId, chunks] in \
+                    self.db.execute("SELECT id, chunks FROM captures ORDER BY id") \
+                    for chunk in range(chunks)]
+        queries = []
+        values = []
+        for pattern in patterns:
+            word = pattern.strip('*')
+            # Every lookup but the one of a word cut at both ends is a
+            # search of an index, that one scans the tokens, not the postings
+            if pattern.startswith('*') and pattern.endswith('*'):
+                queries.append("SELECT capture, chunk FROM postings WHERE token IN "\
+                               "(SELECT token FROM tokens WHERE token GLOB ?)")
+                values.append(pattern)
+            elif pattern.startswith('*'):
+                queries.append("SELECT capture, chunk FROM postings WHERE token IN "\
+                               "(SELECT token FROM tokens WHERE reversed GLOB ?)")
+                values.append(word[::-1] + '*')
+            elif pattern.endswith('*'):
+                queries.append("SELECT capture, chunk FROM postings WHERE token GLOB ?")
+                values.append(pattern)
+            else:
+                queries.append("SELECT capture, chunk FROM postings WHERE token = ?")
+                values.append(pattern)
+        return self.db.execute(' INTERSECT '.join(queries) + " ORDER BY capture, chunk", \
+                               tuple(values)).fetchall()
+
+    def search(self, text, ignoreCase = True):
+        """Find in which runs and RUMIs the text first appeared. The tokens
+           only select the candidate chunks, the text itself is looked for
+           in their lines
+
+        Args:
+            text (str): The string to search
+            ignoreCase (bool): Case insensitive match
+
+        Returns:
+            List: [run, rumi, platform, test, timestamp, line] ordered by
+                  time of the first appearance
+        """
+        if not text:
+            return []
+
+        needle = text.lower() if ignoreCase else text
+        hits = []
+        readers = {}
+        captures = {}
+        for [captureId, chunk] in self._candidates(LogIndex.token_patterns(text)):
+            # Only the first appearance in every capture is needed
+            if captureId in captures:
+                continue
+
+            if captureId not in readers:
+                row = self.db.execute(
+                    "SELECT path, run, rumi, platform, test FROM captures "\
+                    "WHERE id = ?", (captureId,)).fetchone()
+                readers[captureId] = [CaptureReader(os.path.join(self.resultsDir, row[0])), row]
+            [reader, row] = readers[captureId]
+
+            entry = reader.index[chunk]
+            for line in reader.read_chunk(entry).splitlines():
+                if needle in (line.lower() if ignoreCase else line):
+                    captures[captureId] = True
+                    hits.append([row[1], row[2], row[3], row[4], entry['start'], line])
+                    break
+
+        hits.sort(key = lambda hit: hit[4])
+        return hits
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Index and search TERM captures")
+    parser.add_argument('-r', '--results', default = 'results', help = "Results directory")
+    subParsers = parser.add_subparsers(dest = 'action', required = True)
+    subParsers.add_parser('update', help = "Index new captures")
+    searchParser = subParsers.add_parser('search', help = "Search a string")
+    searchParser.add_argument('text')
+    searchParser.add_argument('--no-update', action = 'store_true', \
+                              help = "Do not index new captures before searching")
+    args = parser.parse_args(argv)
+
+    index = LogIndex(args.results)
+    if args.action == 'update':
+        print(f"{index.update()} chunks indexed")
+    else:
+        if not args.no_update:
+            index.update()
+        for [run, rumi, platform, test, timestamp, line] in index.search(args.text):
+            print(f"{run}  {rumi}  {platform}  {test}  {line.strip()}")
+    index.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
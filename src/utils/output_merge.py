@@ -0,0 +1,385 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   output_merge.py
+@Time        :   2024/04/08 14:12:36
+@Author      :   Shiqi Duan
+@Description :   Streaming merge and summary of robot output.xml files. The
+                 files are walked with iterparse and elements are released
+                 as soon as they are written, so the memory usage does not
+                 grow with the size of the regression.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import os
+import heapq
+import datetime
+from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape, quoteattr
+
+# Number of slowest tests kept in the summary
+slowestTestsCount = 10
+
+# Robot 6 writes "20230411 21:43:20.442", robot 7 writes ISO timestamps
+robotTimeFormat = "%Y%m%d %H:%M:%S.%f"
+
+def _parse_robot_time(value):
+    if not value or value == "N/A":
+        return None
+    try:
+        return datetime.datetime.strptime(value, robotTimeFormat)
+    except ValueError:
+        pass
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+def _format_robot_time(value):
+    if value is None:
+        return "N/A"
+    return value.strftime(robotTimeFormat)[:-3]
+
+def _format_iso_time(value):
+    if value is None:
+        return "N/A"
+    return value.isoformat(timespec = 'microseconds')
+
+def _is_robot7_schema(schemaVersion):
+    """Robot 7 outputs are schema 5 and later, they write ISO timestamps
+       and start/elapsed status attributes
+    """
+    try:
+        return int(schemaVersion) >= 5
+    except (TypeError, ValueError):
+        return False
+
+def _status_attributes(start, end, robot7):
+    if robot7:
+        elapsed = (end - start).total_seconds() if start is not None and end is not None else 0.0
+        return f"start={quoteattr(_format_iso_time(start))} elapsed=\"{elapsed:.6f}\""
+    return f"starttime={quoteattr(_format_robot_time(start))} "\
+           f"endtime={quoteattr(_format_robot_time(end))}"
+
+def _status_times(status):
+    """Get start time, end time and elapsed seconds of a <status> element,
+       both robot 6 (starttime/endtime) and robot 7 (start/elapsed) formats
+       are supported
+    """
+    start = _parse_robot_time(status.get('starttime') or status.get('start'))
+    end   = _parse_robot_time(status.get('endtime'))
+    elapsed = status.get('elapsed')
+    if elapsed is not None:
+        elapsed = float(elapsed)
+        if start is not None and end is None:
+            end = start + datetime.timedelta(seconds = elapsed)
+    elif start is not None and end is not None:
+        elapsed = (end - start).total_seconds()
+    return [start, end, elapsed]
+
+#----------------------------------------------------------------
+# Test result collector
+#----------------------------------------------------------------
+class ResultSummary:
+    """
+    A class collecting test statistics while output files are streamed.
+
+    Attributes:
+        total    (int)  : Number of tests
+        passed   (int)  : Number of passed tests
+        failed   (int)  : Number of failed tests
+        skipped  (int)  : Number of skipped tests
+        failures (list) : [longname, message, elapsed] of the failed tests
+        slowest  (list) : [elapsed, longname] of the slowest tests
+        tags     (dict) : tag -> [pass, fail, skip]
+        suites   (dict) : top level suite name -> [pass, fail, skip]
+        start    (datetime) : Earliest start time of all tests
+        end      (datetime) : Latest end time of all tests
+
+    Usage:
+        summary = ResultSummary()
+        summary.add_test("USB.Test1.Case", "PASS", "", 1.2, [])
+        print(summary)
+    """
+    def __init__(self) -> None:
+        self.total    = 0
+        self.passed   = 0
+        self.failed   = 0
+        self.skipped  = 0
+        self.failures = []
+        self.slowest  = []
+        self.tags     = {}
+        self.suites   = {}
+        self.start    = None
+        self.end      = None
+
+    def add_test(self, longname, status, message, elapsed, tags, suite = None):
+        self.total = self.total + 1
+        index = {'PASS': 0, 'FAIL': 1, 'SKIP': 2}.get(status, 1)
+        if index == 0:
+            self.passed = self.passed + 1
+        elif index == 1:
+            self.failed = self.failed + 1
+            self.failures.append([longname, message, elapsed])
+        else:
+            self.skipped = self.skipped + 1
+
+        for tag in tags:
+            self.tags.setdefault(tag, [0, 0, 0])[index] += 1
+        if suite is not None:
+            self.suites.setdefault(suite, [0, 0, 0])[index] += 1
+
+        # Only keep the N slowest tests, the heap never grows beyond N
+        if elapsed is not None:
+            item = (elapsed, longname)
+            if len(self.slowest) < slowestTestsCount:
+                heapq.heappush(self.slowest, item)
+            else:
+                heapq.heappushpop(self.slowest, item)
+
+    def update_time(self, start, end):
+        if start is not None and (self.start is None or start < self.start):
+            self.start = start
+        if end is not None and (self.end is None or end > self.end):
+            self.end = end
+
+    @property
+    def status(self):
+        return "FAIL" if self.failed else "PASS"
+
+    def __str__(self) -> str:
+        summaryInfo = f"Summary:\n"\
+                      f"  Total: {self.total}\n"\
+                      f"  Pass: {self.passed}\n"\
+                      f"  Fail: {self.failed}\n"\
+                      f"  Skip: {self.skipped}\n"
+        if self.start is not None and self.end is not None:
+            summaryInfo += f"  Elapsed: {(self.end - self.start).total_seconds():.3f}s\n"
+
+        if self.failures:
+            summaryInfo += "Failures:\n"
+            for [longname, message, elapsed] in self.failures:
+                summaryInfo += f"  {longname}: {message}\n"
+
+        if self.slowest:
+            summaryInfo += "Slowest tests:\n"
+            for [elapsed, longname] in sorted(self.slowest, reverse = True):
+                summaryInfo += f"  {elapsed:10.3f}s  {longname}\n"
+        return summaryInfo
+
+#----------------------------------------------------------------
+# Streaming parse
+#----------------------------------------------------------------
+def _iterparse(outputFile):
+    """Iterate over the start/end events of an output file, the children
+       of an element are released after its end event so the tree built by
+       iterparse never holds more than the current branch
+    """
+    stack = []
+    for event, elem in ET.iterparse(outputFile, events = ('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+            yield event, elem, stack
+        else:
+            yield event, elem, stack
+            stack.pop()
+            # All the children have been consumed by now, only keep the
+            # element itself since a pending writer may still need its tail
+            del elem[:]
+
+def _test_result(test, suiteNames):
+    """Extract [longname, status, message, start, end, elapsed, tags] from
+       an ended <test> element
+    """
+    longname = '.'.join(suiteNames + [test.get('name', '')])
+    status = None
+    tags = []
+    for child in test:
+        if child.tag == 'status':
+            status = child
+        elif child.tag == 'tag':
+            tags.append(child.text or '')
+
+    if status is None:
+        return [longname, 'FAIL', 'No status', None, None, None, tags]
+
+    [start, end, elapsed] = _status_times(status)
+    return [longname, status.get('status', 'FAIL'), status.text or '', \
+            start, end, elapsed, tags]
+
+def summarize_output_files(outputFiles, summary = None):
+    """Collect test statistics from output files without building the DOM
+
+    Args:
+        outputFiles (list): Paths of the robot output.xml files
+        summary (ResultSummary): Existing summary which will be updated
+
+    Returns:
+        ResultSummary: Collected statistics
+    """
+    if summary is None:
+        summary = ResultSummary()
+
+    for outputFile in outputFiles:
+        suiteNames = []
+        for event, elem, stack in _iterparse(outputFile):
+            if elem.tag == 'suite':
+                if event == 'start':
+                    suiteNames.append(elem.get('name', ''))
+                else:
+                    suiteNames.pop()
+            elif elem.tag == 'test' and event == 'end':
+                _add_test_to_summary(summary, elem, suiteNames)
+    return summary
+
+def _add_test_to_summary(summary, test, suiteNames, suiteKey = None):
+    [longname, status, message, start, end, elapsed, tags] = \
+        _test_result(test, suiteNames)
+    if suiteKey is None and suiteNames:
+        suiteKey = suiteNames[0]
+    summary.add_test(longname, status, message, elapsed, tags, suiteKey)
+    summary.update_time(start, end)
+
+#----------------------------------------------------------------
+# Streaming merge
+#----------------------------------------------------------------
+class _StreamWriter:
+    """Write elements of an iterparse stream back to a file. The text of
+       an element is only complete when the next event arrives, so every
+       event is kept pending until the next one is seen
+    """
+    def __init__(self, out, idPrefix = None) -> None:
+        self.out = out
+        self.idPrefix = idPrefix
+        self.pending = None
+
+    def _attributes(self, elem):
+        attrs = ""
+        for key, value in elem.attrib.items():
+            if key == 'id' and self.idPrefix is not None \
+                and elem.tag in ('suite', 'test', 'kw') and value.startswith('s1'):
+                value = self.idPrefix + value[2:]
+            attrs += f" {key}={quoteattr(value)}"
+        return attrs
+
+    def _flush(self):
+        if self.pending is None:
+            return
+        [event, elem] = self.pending
+        if event == 'start':
+            self.out.write(f"<{elem.tag}{self._attributes(elem)}>")
+            if elem.text:
+                self.out.write(escape(elem.text))
+        else:
+            self.out.write(f"</{elem.tag}>")
+            if elem.tail:
+                self.out.write(escape(elem.tail))
+        self.pending = None
+
+    def feed(self, event, elem):
+        self._flush()
+        self.pending = [event, elem]
+
+    def close(self):
+        self._flush()
+
+def merge_output_files(outputFiles, mergedFile, name = "Merged"):
+    """Merge the output files of several workers into a single output file,
+       the top level suite of each file becomes a child of a new suite
+
+    Args:
+        outputFiles (list): Paths of the robot output.xml files
+        mergedFile (str): Path of the merged output file
+        name (str): Name of the new top level suite
+
+    Returns:
+        ResultSummary: Statistics collected during the merge
+    """
+    summary = ResultSummary()
+    errors = []
+    generator = "Robot"
+    robot7 = False
+
+    tmpFile = mergedFile + ".part"
+    with open(tmpFile, 'w', encoding = 'utf-8') as out:
+        out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        headerWritten = False
+
+        for index, outputFile in enumerate(outputFiles, start = 1):
+            suiteNames = []
+            writer = None
+            for event, elem, stack in _iterparse(outputFile):
+                depth = len(stack)
+
+                if elem.tag == 'robot' and event == 'start':
+                    generator = elem.get('generator', generator)
+                    if not headerWritten:
+                        headerWritten = True
+                        # The header and the statuses follow the schema of the sources
+                        schemaVersion = elem.get('schemaversion', '3')
+                        robot7 = _is_robot7_schema(schemaVersion)
+                        generated = _format_iso_time(datetime.datetime.now()) if robot7 \
+                                    else _format_robot_time(datetime.datetime.now())
+                        out.write(f"<robot generator={quoteattr(generator)} "\
+                                  f"generated={quoteattr(generated)} "\
+                                  f"rpa={quoteattr(elem.get('rpa', 'false'))} "\
+                                  f"schemaversion={quoteattr(schemaVersion)}>\n"\
+                                  f"<suite id=\"s1\" name={quoteattr(name)}>\n")
+                    continue
+
+                # Top level suite of the worker, copy it under the new suite
+                if elem.tag == 'suite' and depth == 2 and event == 'start':
+                    writer = _StreamWriter(out, f"s1-s{index}")
+
+                if writer is not None:
+                    writer.feed(event, elem)
+
+                if elem.tag == 'suite':
+                    if event == 'start':
+                        suiteNames.append(elem.get('name', ''))
+                    else:
+                        suiteNames.pop()
+                        if depth == 2:
+                            writer.close()
+                            writer = None
+                            out.write("\n")
+                elif elem.tag == 'test' and event == 'end':
+                    # Workers may share suite names, key them by file index
+                    _add_test_to_summary(summary, elem, suiteNames, \
+                                         (index, suiteNames[0]))
+                elif elem.tag == 'msg' and event == 'end' \
+                    and depth == 3 and stack[-2].tag == 'errors':
+                    errors.append([dict(elem.attrib), elem.text or ''])
+
+        out.write(f"<status status=\"{summary.status}\" "\
+                  f"{_status_attributes(summary.start, summary.end, robot7)}/>\n"\
+                  f"</suite>\n")
+        _write_statistics(out, summary, name)
+
+        out.write("<errors>\n")
+        for [attrs, text] in errors:
+            attrText = ''.join(f" {k}={quoteattr(v)}" for k, v in attrs.items())
+            out.write(f"<msg{attrText}>{escape(text)}</msg>\n")
+        out.write("</errors>\n</robot>\n")
+
+    os.replace(tmpFile, mergedFile)
+    return summary
+
+def _write_statistics(out, summary, name):
+    def stat(counts, text, attrs = ""):
+        return f"<stat pass=\"{counts[0]}\" fail=\"{counts[1]}\" "\
+               f"skip=\"{counts[2]}\"{attrs}>{escape(text)}</stat>\n"
+
+    out.write("<statistics>\n<total>\n")
+    out.write(stat([summary.passed, summary.failed, summary.skipped], "All Tests"))
+    out.write("</total>\n<tag>\n")
+    for tag in sorted(summary.tags):
+        out.write(stat(summary.tags[tag], tag))
+    out.write("</tag>\n<suite>\n")
+    out.write(stat([summary.passed, summary.failed, summary.skipped], name, \
+                   f" id=\"s1\" name={quoteattr(name)}"))
+    for [index, suite], counts in summary.suites.items():
+        out.write(stat(counts, f"{name}.{suite}", \
+                       f" id=\"s1-s{index}\" name={quoteattr(suite)}"))
+    out.write("</suite>\n</statistics>\n")
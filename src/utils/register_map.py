@@ -0,0 +1,280 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   register_map.py
+@Time        :   2024/04/30 10:06:41
+@Author      :   Shiqi Duan
+@Description :   Register maps of the chips. The registers of a project are
+                 described by blocks, registers and fields in
+                 config/register_map.json, the address and the mask of every
+                 name are computed once at load time. Reads and writes of
+                 many registers are grouped into contiguous memory blocks so
+                 they go to trace32 in one transaction.
+
+                 {
+                     "<project>": {
+                         "<block>": {
+                             "base": "0x0A600000",
+                             "registers": {
+                                 "<register>": {
+                                     "offset": "0xC110",
+                                     "width": 32,
+                                     "static": false,
+                                     "fields": {"<field>": "13:12", "<bit>": "11"}
+                                 }
+                             }
+                         }
+                     }
+                 }
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import os
+import json
+import threading
+
+registerMapFile = os.path.join(os.path.dirname(os.path.dirname( \
+    os.path.dirname(os.path.abspath(__file__)))), 'config', 'register_map.json')
+
+# Register maps, keyed by (register map file, project)
+_maps = {}
+_mapsLock = threading.Lock()
+
+def _number(value):
+    return value if isinstance(value, int) else int(str(value), 0)
+
+def _bit_range(bits):
+    """"13:12" or "11" to (shift, mask)"""
+    [msb, _, lsb] = str(bits).partition(':')
+    msb = int(msb)
+    lsb = int(lsb) if lsb else msb
+    if lsb > msb:
+        [msb, lsb] = [lsb, msb]
+    return (lsb, ((1 << (msb - lsb + 1)) - 1) << lsb)
+
+class Register:
+    """
+    A register of a block.
+
+    Attributes:
+        name    (str)  : Full name, "<block>.<register>"
+        address (int)  : Physical address
+        size    (int)  : Bytes of the register
+        static  (bool) : The value does not change during a test, reads
+                         may be cached
+        fields  (dict) : field -> (shift, mask)
+    """
+    def __init__(self, name, address, width = 32, static = False, fields = None):
+        self.name    = name
+        self.address = address
+        self.size    = width // 8
+        self.static  = static
+        self.fields  = fields or {}
+
+    def decode(self, content):
+        return int.from_bytes(content, 'little')
+
+    def encode(self, value):
+        return int(value).to_bytes(self.size, 'little')
+
+#----------------------------------------------------------------
+# Register map
+#----------------------------------------------------------------
+class RegisterMap:
+    """
+    A class holding the registers of a project with their address and
+    field masks precomputed.
+
+    Attributes:
+        project   (str)  : Project of the DUT, e.g. miami or alder
+        registers (dict) : "<block>.<register>" -> Register
+
+    Methods:
+        resolve(self, name: str):
+            (register, shift, mask) of a register or a field name, mask is
+            None for a whole register
+        plan_blocks(self, registers: list):
+            Group registers into contiguous memory blocks
+
+    Usage:
+        registerMap = get_register_map('miami')
+        [register, shift, mask] = registerMap.resolve("USB.GCTL.PRTCAPDIR")
+    """
+    def __init__(self, project, blocks):
+        self.project   = project
+        self.registers = {}
+        self._names    = {}
+
+        for blockName, block in blocks.items():
+            base = _number(block.get('base', 0))
+            for registerName, config in block.get('registers', {}).items():
+                name = f"{blockName}.{registerName}"
+                fields = {fieldName: _bit_range(bits) \
+                          for fieldName, bits in config.get('fields', {}).items()}
+                register = Register(name, base + _number(config['offset']), \
+                                    int(config.get('width', 32)), \
+                                    bool(config.get('static', False)), fields)
+                self.registers[name] = register
+                self._names[name] = (register, 0, None)
+                for fieldName, [shift, mask] in fields.items():
+                    self._names[f"{name}.{fieldName}"] = (register, shift, mask)
+
+    def resolve(self, name):
+        try:
+            return self._names[name]
+        except KeyError:
+            raise KeyError(f"No register or field {name} in the {self.project} register map")
+
+    def plan_blocks(self, registers):
+        """Group registers into blocks of adjacent addresses. Only the
+           requested registers are covered, registers in between are never
+           accessed as reading some of them has side effects
+
+        Returns:
+            List of [address, size, registers]
+        """
+        blocks = []
+        for register in sorted(set(registers), key = lambda register: register.address):
+            if blocks and blocks[-1][0] + blocks[-1][1] == register.address:
+                blocks[-1][1] = blocks[-1][1] + register.size
+                blocks[-1][2].append(register)
+            else:
+                blocks.append([register.address, register.size, [register]])
+        return blocks
+
+def load_register_map(project, jsonFile = registerMapFile):
+    with open(jsonFile) as jf:
+        config = json.load(jf)
+    if project not in config:
+        raise KeyError(f"No register map of project {project} in {jsonFile}")
+    return config[project]
+
+def get_register_map(project, jsonFile = registerMapFile):
+    """Get the register map of a project, it is loaded at the first call and
+       shared afterwards
+    """
+    key = (jsonFile, project)
+    with _mapsLock:
+        if key not in _maps:
+            _maps[key] = RegisterMap(project, load_register_map(project, jsonFile))
+        return _maps[key]
+
+#----------------------------------------------------------------
+# Register access
+#----------------------------------------------------------------
+class RegisterAccess:
+    """
+    A class reading and writing named registers and fields of a platform
+    with one memory transaction per batch.
+
+    Attributes:
+        trace32     (Trace32)     : The trace32 of the platform
+        registerMap (RegisterMap) : Registers of the DUT project
+        cache       (dict)        : address -> value of the static registers
+                                    already read, None for no cache
+
+    Methods:
+        read(self, names: list):
+            [rc, values] of the registers or fields
+        write(self, values: dict):
+            Write registers or fields, fields are read, modified and written
+
+    Usage:
+        access = RegisterAccess(tp.trace32, get_register_map('miami'))
+        [rc, values] = access.read(["USB.GCTL", "USB.GCTL.PRTCAPDIR"])
+    """
+    def __init__(self, trace32, registerMap, cache = None):
+        self.trace32     = trace32
+        self.registerMap = registerMap
+        self.cache       = cache
+
+    def _read_registers(self, registers):
+        """address -> value of the registers, static ones from the cache"""
+        values = {}
+        missing = []
+        for register in registers:
+            if self.cache is not None and register.static and register.address in self.cache:
+                values[register.address] = self.cache[register.address]
+            else:
+                missing.append(register)
+
+        blocks = self.registerMap.plan_blocks(missing)
+        if not blocks:
+            return [0, values]
+        [rc, contents] = self.trace32.read_memory_blocks( \
+            [[address, size] for [address, size, members] in blocks])
+        if rc != 0:
+            return [rc, values]
+
+        for [address, size, members], content in zip(blocks, contents):
+            for register in members:
+                start = register.address - address
+                value = register.decode(content[start:start + register.size])
+                values[register.address] = value
+                if self.cache is not None and register.static:
+                    self.cache[register.address] = value
+        return [0, values]
+
+    def read(self, names):
+        resolved = [self.registerMap.resolve(name) for name in names]
+        [rc, values] = self._read_registers([register for [register, shift, mask] in resolved])
+        if rc != 0:
+            return [rc, {}]
+
+        result = {}
+        for name, [register, shift, mask] in zip(names, resolved):
+            value = values[register.address]
+            result[name] = value if mask is None else (value & mask) >> shift
+        return [0, result]
+
+    def write(self, values):
+        """Write registers or fields in one transaction, the registers with
+           field writes are read first in one transaction
+
+        Args:
+            values (dict): register or field name -> value
+
+        Returns:
+            0: success
+            !0: Failed to read or write the registers
+        """
+        # Whole register writes first, then the fields on top of them
+        updates = {}
+        partial = {}
+        for name, value in values.items():
+            [register, shift, mask] = self.registerMap.resolve(name)
+            value = _number(value)
+            if mask is None:
+                updates[register.address] = [register, value]
+            else:
+                if (value << shift) & ~mask:
+                    raise ValueError(f"Value {value:#x} does not fit in {name}")
+                partial.setdefault(register.address, [register, []])[1].append([shift, mask, value])
+
+        toRead = [register for address, [register, fields] in partial.items() \
+                  if address not in updates]
+        [rc, current] = self._read_registers(toRead)
+        if rc != 0:
+            return rc
+        for address, [register, fields] in partial.items():
+            value = updates[address][1] if address in updates else current[address]
+            for [shift, mask, fieldValue] in fields:
+                value = (value & ~mask) | (fieldValue << shift)
+            updates[address] = [register, value]
+
+        registers = [register for [register, value] in updates.values()]
+        blocks = []
+        for [address, size, members] in self.registerMap.plan_blocks(registers):
+            content = b"".join(member.encode(updates[member.address][1]) for member in members)
+            blocks.append([address, content])
+        rc = self.trace32.write_memory_blocks(blocks)
+
+        if self.cache is not None:
+            for [register, value] in updates.values():
+                if register.static:
+                    if rc == 0:
+                        self.cache[register.address] = value
+                    else:
+                        self.cache.pop(register.address, None)
+        return rc
@@ -0,0 +1,229 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   rumi_config_index.py
+@Time        :   2024/04/16 14:27:51
+@Author      :   Shiqi Duan
+@Description :   Index of the trace32 configs under config/rumi_config. The
+                 index maps RUMI id -> core -> parsed NODE=/PORT=/CORE=
+                 values, it is cached on disk and refreshed incrementally
+                 by mtime, and it flags the configs which do not belong to
+                 the RUMI folder they are stored in.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import os
+import re
+import json
+import threading
+
+indexCacheName = ".rumi_config_index.json"
+
+# config<id>_<core>.t32, core is arm, riscv, riscv_q6 or single_riscv
+configFilePattern = re.compile(r"^config(\d+)_(\w+)\.t32$", re.IGNORECASE)
+
+# Keys kept from the .t32 files
+configKeys = ("NODE", "PORT", "CORE", "PACKLEN")
+
+def parse_t32_config(configFile):
+    """Parse the active KEY=VALUE lines of a trace32 config file, the lines
+       commented out with ';' are skipped
+
+    Returns:
+        Dict: key -> value of the keys in configKeys
+    """
+    values = {}
+    with open(configFile, errors = 'replace') as cf:
+        for line in cf:
+            line = line.strip()
+            if not line or line.startswith(';') or '=' not in line:
+                continue
+            [key, value] = line.split('=', 1)
+            key = key.strip().upper()
+            if key in configKeys and key not in values:
+                values[key] = value.strip()
+    return values
+
+#----------------------------------------------------------------
+# RUMI config index
+#----------------------------------------------------------------
+class RumiConfigIndex:
+    """
+    A class indexing the RUMI trace32 config folders.
+
+    Attributes:
+        rumiConfigPath (str)  : The config/rumi_config directory
+        rumis          (dict) : RUMI id -> {'mtime', 'configs'}, configs is
+                                core -> {'file', 'mtime', 'fileId', values}
+        mismatches     (list) : Human readable description of the problems
+
+    Methods:
+        refresh(self):
+            Rescan the folders, only changed files are parsed again
+        get_config(self, rumiId: str, core: str):
+            Path of the config file of a core
+        get_values(self, rumiId: str, core: str):
+            Parsed NODE/PORT/CORE values of the config file
+
+    Usage:
+        index = get_rumi_config_index()
+        configFile = index.get_config("7558", "arm")
+    """
+    def __init__(self, rumiConfigPath, rumiListFile = None, cacheFile = None):
+        self.rumiConfigPath = rumiConfigPath
+        self.rumiListFile   = rumiListFile
+        self.cacheFile      = cacheFile if cacheFile is not None \
+                              else os.path.join(rumiConfigPath, indexCacheName)
+        self.rumis      = {}
+        self.mismatches = []
+        self._lock      = threading.Lock()
+        self._load_cache()
+
+    def _load_cache(self):
+        try:
+            with open(self.cacheFile) as cf:
+                self.rumis = json.load(cf)
+        except (FileNotFoundError, ValueError):
+            self.rumis = {}
+
+    def _save_cache(self):
+        tmpFile = self.cacheFile + ".tmp"
+        try:
+            with open(tmpFile, 'w') as cf:
+                json.dump(self.rumis, cf, indent = 1)
+            os.replace(tmpFile, self.cacheFile)
+        except OSError:
+            # A read-only share still works, just without the disk cache
+            pass
+
+    def _scan_folder(self, rumiId, folder, cached):
+        configs = {}
+        cachedConfigs = cached.get('configs', {}) if cached else {}
+        changed = False
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                m = configFilePattern.match(entry.name)
+                if m is None or not entry.is_file():
+                    continue
+
+                [fileId, core] = [m.group(1), m.group(2).lower()]
+                mtime = entry.stat().st_mtime
+                old = cachedConfigs.get(core)
+                if old is not None and old['file'] == entry.name and old['mtime'] == mtime:
+                    configs[core] = old
+                    continue
+
+                changed = True
+                config = {'file': entry.name, 'mtime': mtime, 'fileId': fileId}
+                config.update(parse_t32_config(entry.path))
+                if core in configs:
+                    # Two files for the same core, keep the one named after the folder
+                    if configs[core]['fileId'] == rumiId:
+                        continue
+                configs[core] = config
+        return [configs, changed or set(configs) != set(cachedConfigs)]
+
+    def refresh(self):
+        """Rescan the RUMI folders, a folder whose mtime is unchanged only
+           has its files stat-ed, only new or modified files are parsed
+
+        Returns:
+            Number of RUMI folders which changed
+        """
+        with self._lock:
+            rumis = {}
+            changedCount = 0
+            with os.scandir(self.rumiConfigPath) as entries:
+                for entry in entries:
+                    if not entry.is_dir():
+                        continue
+                    cached = self.rumis.get(entry.name)
+                    [configs, changed] = self._scan_folder(entry.name, entry.path, cached)
+                    rumis[entry.name] = {'mtime': entry.stat().st_mtime, 'configs': configs}
+                    if changed or cached is None:
+                        changedCount = changedCount + 1
+
+            if changedCount or set(rumis) != set(self.rumis):
+                self.rumis = rumis
+                self._save_cache()
+            self.mismatches = self._check()
+            return changedCount
+
+    def _rumi_list(self):
+        if self.rumiListFile is None:
+            return {}
+        try:
+            with open(self.rumiListFile) as rf:
+                return json.load(rf)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _check(self):
+        mismatches = []
+        rumiList = self._rumi_list()
+        for rumiId in sorted(self.rumis):
+            configs = self.rumis[rumiId]['configs']
+            ip = rumiList.get(rumiId, {}).get('ip')
+            for core in sorted(configs):
+                config = configs[core]
+                if config['fileId'] != rumiId:
+                    mismatches.append(f"{rumiId}/{config['file']}: file is named "\
+                                      f"for RUMI {config['fileId']}")
+                node = config.get('NODE', '')
+                if ip is not None and node and node != ip:
+                    mismatches.append(f"{rumiId}/{config['file']}: NODE={node} "\
+                                      f"but rumi.json ip is {ip}")
+                elif ip is None and node and not node.endswith(rumiId):
+                    mismatches.append(f"{rumiId}/{config['file']}: NODE={node} "\
+                                      f"does not match the folder")
+        for rumiId in sorted(set(rumiList) - set(self.rumis)):
+            mismatches.append(f"{rumiId}: in rumi.json but no config folder")
+        return mismatches
+
+    def rumi_ids(self):
+        return sorted(self.rumis, key = lambda rumiId: (len(rumiId), rumiId))
+
+    def cores(self, rumiId):
+        return sorted(self.rumis.get(rumiId, {}).get('configs', {}))
+
+    def get_config(self, rumiId, core):
+        config = self.rumis.get(str(rumiId), {}).get('configs', {}).get(core)
+        if config is None:
+            return None
+        return os.path.join(self.rumiConfigPath, str(rumiId), config['file'])
+
+    def get_values(self, rumiId, core):
+        config = self.rumis.get(str(rumiId), {}).get('configs', {}).get(core)
+        if config is None:
+            return {}
+        return {key: config[key] for key in configKeys if key in config}
+
+_indexes = {}
+_indexesLock = threading.Lock()
+
+def get_rumi_config_index(rumiConfigPath = None, rumiListFile = None, refresh = True):
+    """Get the shared index of a RUMI config directory
+
+    Args:
+        rumiConfigPath (str): config/rumi_config by default
+        rumiListFile (str): rumi.json used to check the NODE values
+        refresh (bool): Rescan changed folders before returning
+
+    Returns:
+        RumiConfigIndex
+    """
+    if rumiConfigPath is None:
+        rumiConfigPath = os.path.join(os.path.dirname(os.path.dirname( \
+            os.path.dirname(os.path.abspath(__file__)))), 'config', 'rumi_config')
+    if rumiListFile is None:
+        rumiListFile = os.path.join(rumiConfigPath, 'rumi.json')
+
+    with _indexesLock:
+        index = _indexes.get(rumiConfigPath)
+        if index is None:
+            index = RumiConfigIndex(rumiConfigPath, rumiListFile)
+            _indexes[rumiConfigPath] = index
+    if refresh:
+        index.refresh()
+    return index
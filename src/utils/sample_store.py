@@ -0,0 +1,286 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   sample_store.py
+@Time        :   2024/05/10 15:08:26
+@Author      :   Shiqi Duan
+@Description :   Storage of the time series sampled from the target. Samples
+                 go to a preallocated ring buffer, NumPy arrays if NumPy is
+                 installed, and are spilled in chunks to a binary file of
+                 fixed size rows. Statistics are updated once per chunk, the
+                 exports read the file back chunk by chunk so a long run
+                 never has to fit in memory.
+
+                 samples.json : channels and row format
+                 samples.bin  : rows of (time f64, value i64 per channel)
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import os
+import csv
+import json
+import math
+import array
+import struct
+import threading
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+metaFileName    = "samples.json"
+samplesFileName = "samples.bin"
+
+# Default ring capacity and rows spilled at once
+defaultCapacity  = 64 * 1024
+defaultSpillRows = 4 * 1024
+
+# Rows read at once by the exports
+exportChunkRows  = 64 * 1024
+
+class _ChannelStats:
+    """Running statistics of a channel, merged chunk by chunk"""
+    def __init__(self):
+        self.count = 0
+        self.minimum = None
+        self.maximum = None
+        self.total = 0.0
+        self.squares = 0.0
+        self.first = None       # [time, value]
+        self.last = None
+
+    def update(self, times, values):
+        if len(values) == 0:
+            return
+        if numpy is not None:
+            floats = values.astype(numpy.float64)
+            [minimum, maximum] = [int(values.min()), int(values.max())]
+            [total, squares] = [float(floats.sum()), float((floats * floats).sum())]
+        else:
+            [minimum, maximum] = [min(values), max(values)]
+            [total, squares] = [float(sum(values)), float(sum(value * value for value in values))]
+        self.count = self.count + len(values)
+        self.minimum = minimum if self.minimum is None else min(self.minimum, minimum)
+        self.maximum = maximum if self.maximum is None else max(self.maximum, maximum)
+        self.total = self.total + total
+        self.squares = self.squares + squares
+        if self.first is None:
+            self.first = [float(times[0]), int(values[0])]
+        self.last = [float(times[-1]), int(values[-1])]
+
+    def summary(self):
+        if self.count == 0:
+            return {'count': 0}
+        mean = self.total / self.count
+        duration = self.last[0] - self.first[0]
+        return {
+            'count': self.count,
+            'min':   self.minimum,
+            'max':   self.maximum,
+            'mean':  mean,
+            'std':   math.sqrt(max(self.squares / self.count - mean * mean, 0.0)),
+            # Change per second, the throughput of a counter
+            'rate':  (self.last[1] - self.first[1]) / duration if duration > 0 else 0.0,
+        }
+
+#----------------------------------------------------------------
+# Sample store
+#----------------------------------------------------------------
+class SampleStore:
+    """
+    A class keeping the recent samples of some channels in a ring buffer
+    and all of them in a spill file.
+
+    Attributes:
+        directory (str)  : Directory of the spill file
+        channels  (list) : Names of the channels
+        capacity  (int)  : Rows of the ring buffer
+        spillRows (int)  : Rows written to the spill file at once
+        count     (int)  : Rows appended so far
+
+    Methods:
+        append(self, timestamp: float, values: list):
+            Add a row, spilled once spillRows rows are pending
+        recent(self, count = None):
+            [times, values] of the last rows still in the ring
+        stats(self):
+            channel -> count, min, max, mean, std and rate
+        export(self, outputPath: str):
+            Write all the rows to a .csv or a .parquet file
+
+    Usage:
+        store = SampleStore(directory, ["rxBytes", "TIMER.COUNT"])
+        store.append(time.time(), [1024, 77])
+        store.close()
+        store.export("samples.csv")
+    """
+    def __init__(self, directory, channels, capacity = defaultCapacity, \
+                 spillRows = defaultSpillRows):
+        self.directory = directory
+        self.channels  = list(channels)
+        self.capacity  = max(int(capacity), 1)
+        self.spillRows = min(max(int(spillRows), 1), self.capacity)
+        self.count     = 0
+
+        self._spilled = 0
+        self._lock    = threading.Lock()
+        self._stats   = [_ChannelStats() for channel in self.channels]
+        self._row     = struct.Struct("<d" + "q" * len(self.channels))
+
+        width = len(self.channels)
+        if numpy is not None:
+            self._times  = numpy.zeros(self.capacity, dtype = numpy.float64)
+            self._values = numpy.zeros((self.capacity, width), dtype = numpy.int64)
+            self._dtype  = numpy.dtype([('time', '<f8'), ('values', '<i8', (width,))])
+        else:
+            self._times  = array.array('d', bytes(8 * self.capacity))
+            self._values = array.array('q', bytes(8 * self.capacity * width))
+
+        os.makedirs(directory, exist_ok = True)
+        with open(os.path.join(directory, metaFileName), 'w') as mf:
+            json.dump({'channels': self.channels, 'row': self._row.format}, mf)
+        self._file = open(os.path.join(directory, samplesFileName), 'wb')
+
+    def append(self, timestamp, values):
+        with self._lock:
+            position = self.count % self.capacity
+            self._times[position] = timestamp
+            if numpy is not None:
+                self._values[position] = values
+            else:
+                width = len(self.channels)
+                self._values[position * width:(position + 1) * width] = array.array('q', values)
+            self.count = self.count + 1
+            if self.count - self._spilled >= self.spillRows:
+                self._spill()
+
+    def _pending(self):
+        """[times, values] of the rows not spilled yet, values is per channel"""
+        positions = [index % self.capacity for index in range(self._spilled, self.count)]
+        if numpy is not None:
+            positions = numpy.array(positions, dtype = numpy.int64)
+            return [self._times[positions], self._values[positions]]
+        width = len(self.channels)
+        times = [self._times[position] for position in positions]
+        values = [[self._values[position * width + column] for position in positions] \
+                  for column in range(width)]
+        return [times, values]
+
+    def _spill(self):
+        if self.count == self._spilled or self._file is None:
+            return
+        [times, values] = self._pending()
+        if numpy is not None:
+            rows = numpy.empty(len(times), dtype = self._dtype)
+            rows['time'] = times
+            rows['values'] = values
+            rows.tofile(self._file)
+            columns = values.T
+        else:
+            columns = values
+            for index, timestamp in enumerate(times):
+                self._file.write(self._row.pack(timestamp, *(column[index] for column in columns)))
+        self._file.flush()
+        for channelStats, column in zip(self._stats, columns):
+            channelStats.update(times, column)
+        self._spilled = self.count
+
+    def flush(self):
+        with self._lock:
+            self._spill()
+
+    def close(self):
+        with self._lock:
+            self._spill()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def recent(self, count = None):
+        """[times, values] of the last rows still in the ring, oldest first,
+           values is a row of the channels per sample
+        """
+        with self._lock:
+            available = min(self.count, self.capacity)
+            count = available if count is None else min(int(count), available)
+            positions = [index % self.capacity for index in range(self.count - count, self.count)]
+            if numpy is not None:
+                positions = numpy.array(positions, dtype = numpy.int64)
+                return [self._times[positions].copy(), self._values[positions].copy()]
+            width = len(self.channels)
+            return [[self._times[position] for position in positions], \
+                    [list(self._values[position * width:(position + 1) * width]) \
+                     for position in positions]]
+
+    def stats(self):
+        """Statistics of all the rows so far, pending rows are spilled first"""
+        self.flush()
+        return {channel: channelStats.summary() \
+                for channel, channelStats in zip(self.channels, self._stats)}
+
+    #----------------------------------------------------------------
+    # Export
+    #----------------------------------------------------------------
+    def chunks(self, chunkRows = exportChunkRows):
+        """Read the spill file back, yields [times, columns] per chunk"""
+        self.flush()
+        with open(os.path.join(self.directory, samplesFileName), 'rb') as sf:
+            while True:
+                data = sf.read(chunkRows * self._row.size)
+                if len(data) < self._row.size:
+                    return
+                data = data[:len(data) - len(data) % self._row.size]
+                if numpy is not None:
+                    rows = numpy.frombuffer(data, dtype = self._dtype)
+                    yield [rows['time'], rows['values'].T]
+                else:
+                    rows = list(self._row.iter_unpack(data))
+                    yield [[row[0] for row in rows], \
+                           [[row[column + 1] for row in rows] for column in range(len(self.channels))]]
+
+    def export(self, outputPath):
+        """Write all the rows to outputPath, CSV or Parquet by its extension
+
+        Returns:
+            Number of rows written
+        """
+        directory = os.path.dirname(outputPath)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+        if outputPath.lower().endswith(".parquet"):
+            return self._export_parquet(outputPath)
+        return self._export_csv(outputPath)
+
+    def _export_csv(self, outputPath):
+        rows = 0
+        with open(outputPath, 'w', newline = '') as cf:
+            writer = csv.writer(cf)
+            writer.writerow(["time"] + self.channels)
+            for [times, columns] in self.chunks():
+                columns = [[int(value) for value in column] for column in columns]
+                for index, timestamp in enumerate(times):
+                    writer.writerow([f"{timestamp:.6f}"] + [column[index] for column in columns])
+                rows = rows + len(times)
+        return rows
+
+    def _export_parquet(self, outputPath):
+        if pyarrow is None:
+            raise RuntimeError("pyarrow is needed to export parquet")
+        rows = 0
+        schema = pyarrow.schema([("time", pyarrow.float64())] + \
+                                [(channel, pyarrow.int64()) for channel in self.channels])
+        with pyarrow.parquet.ParquetWriter(outputPath, schema) as writer:
+            for [times, columns] in self.chunks():
+                arrays = [pyarrow.array(times, pyarrow.float64())] + \
+                         [pyarrow.array(column, pyarrow.int64()) for column in columns]
+                writer.write_table(pyarrow.Table.from_arrays(arrays, schema = schema))
+                rows = rows + len(times)
+        return rows
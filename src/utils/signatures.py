@@ -0,0 +1,176 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   signatures.py
+@Time        :   2024/04/11 11:18:27
+@Author      :   Shiqi Duan
+@Description :   Failure signature library. The signatures of a project are
+                 compiled once into a single regular expression, every
+                 category is a named group, so each TERM line is scanned
+                 only once whatever the number of signatures.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import os
+import re
+import json
+import threading
+
+signatureFile = os.path.join(os.path.dirname(os.path.dirname( \
+    os.path.dirname(os.path.abspath(__file__)))), 'config', 'signatures.json')
+
+# Signatures shared by all the projects
+commonProject = "common"
+
+# Compiled libraries, keyed by (signature file, project)
+_libraries = {}
+_librariesLock = threading.Lock()
+
+#----------------------------------------------------------------
+# Signature library
+#----------------------------------------------------------------
+class SignatureLibrary:
+    """
+    A class holding the compiled failure signatures of a project.
+
+    Attributes:
+        project    (str)  : Project of the DUT, e.g. miami or alder
+        categories (dict) : category -> abort flag
+        matcher    (re.Pattern) : All signatures in a single pattern
+
+    Methods:
+        match(self, line: str):
+            Categories matched by a line
+        classify(self, text: str):
+            category -> matched lines for a text
+
+    Usage:
+        library = get_signature_library('miami')
+        library.classify(termContent)
+    """
+    def __init__(self, project, signatures):
+        self.project    = project
+        self.categories = {}
+        self._groups    = {}
+
+        alternatives = []
+        for category, signature in signatures.items():
+            self.categories[category] = bool(signature.get('abort', False))
+            for pattern in signature['patterns']:
+                # Check every pattern alone so a bad one is easy to locate
+                re.compile(pattern)
+                group = f"g{len(self._groups)}"
+                self._groups[group] = category
+                alternatives.append(f"(?P<{group}>{pattern})")
+
+        self.matcher = re.compile('|'.join(alternatives), re.IGNORECASE) \
+                       if alternatives else None
+
+    def match(self, line):
+        categories = []
+        if self.matcher is None:
+            return categories
+
+        for m in self.matcher.finditer(line):
+            category = self._groups[m.lastgroup]
+            if category not in categories:
+                categories.append(category)
+        return categories
+
+    def classify(self, text):
+        result = {}
+        for line in text.splitlines():
+            for category in self.match(line):
+                result.setdefault(category, []).append(line)
+        return result
+
+    def is_fatal(self, category):
+        return self.categories.get(category, False)
+
+def load_signatures(project, jsonFile = signatureFile):
+    """Read the common and the project signatures from the json file
+
+    Args:
+        project (str): Project name, e.g. miami or alder
+        jsonFile (str): Path of the signature file
+
+    Returns:
+        Dict: category -> {'abort': bool, 'patterns': list}
+    """
+    with open(jsonFile) as jf:
+        config = json.load(jf)
+
+    signatures = {}
+    for name in (commonProject, project):
+        for category, signature in config.get(name, {}).items():
+            if category in signatures:
+                # Project signatures extend the common ones
+                merged = dict(signatures[category])
+                merged['patterns'] = merged['patterns'] + signature.get('patterns', [])
+                merged['abort'] = signature.get('abort', merged.get('abort', False))
+                signatures[category] = merged
+            else:
+                signatures[category] = signature
+    return signatures
+
+def get_signature_library(project, jsonFile = signatureFile):
+    """Get the compiled signature library of a project, the library is
+       compiled at the first call and shared afterwards
+    """
+    key = (jsonFile, project)
+    with _librariesLock:
+        if key not in _libraries:
+            _libraries[key] = SignatureLibrary(project, load_signatures(project, jsonFile))
+        return _libraries[key]
+
+#----------------------------------------------------------------
+# Stream classifier
+#----------------------------------------------------------------
+class FailureClassifier:
+    """
+    A class classifying a TERM stream which arrives in pieces.
+
+    Attributes:
+        library  (SignatureLibrary) : Signatures to match
+        failures (dict) : category -> matched lines so far
+        fatal    (str)  : First category which should abort the test
+
+    Usage:
+        classifier = FailureClassifier(get_signature_library('miami'))
+        classifier.feed(content)
+        if classifier.fatal is not None:
+            ...
+    """
+    def __init__(self, library):
+        self.library  = library
+        self.failures = {}
+        self.fatal    = None
+        self._partial = ""
+
+    def feed(self, text):
+        """Classify the complete lines of the text, the trailing partial
+           line is kept until the rest of it arrives
+
+        Returns:
+            Dict: category -> lines matched in this piece of text
+        """
+        text = self._partial + text
+        lines = text.split("\n")
+        self._partial = lines.pop()
+        return self._classify(lines)
+
+    def close(self):
+        lines = [self._partial] if self._partial else []
+        self._partial = ""
+        return self._classify(lines)
+
+    def _classify(self, lines):
+        found = {}
+        for line in lines:
+            for category in self.library.match(line):
+                found.setdefault(category, []).append(line)
+                self.failures.setdefault(category, []).append(line)
+                if self.fatal is None and self.library.is_fatal(category):
+                    self.fatal = category
+        return found
@@ -0,0 +1,187 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   snapshot_cache.py
+@Time        :   2024/04/25 10:18:36
+@Author      :   Shiqi Duan
+@Description :   Local cache of the target snapshots saved after a known good
+                 boot. A snapshot is a directory holding the register restore
+                 script and the memory dumps written by trace32, it is keyed
+                 by the image and the platform config. The least recently
+                 used snapshots are evicted once the cache is over its disk
+                 budget.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+
+manifestName = "snapshot.json"
+defaultCacheDir = os.path.join(tempfile.gettempdir(), 'qverify_snapshots')
+defaultBudget = 20 * 1024 * 1024 * 1024
+
+# Seconds after which an unfinished snapshot directory is removed
+staleTime = 24 * 3600
+
+def snapshot_key(image, platformConfig):
+    """Key of a snapshot, the hash of the image and the platform config
+
+    Args:
+        image (str): Name or hash of the image booted on the target
+        platformConfig (dict): Everything which changes the booted state,
+                               e.g. core and DDR settings and the init cmm
+    """
+    text = json.dumps([image, platformConfig], sort_keys = True, default = str)
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+def _directory_size(directory):
+    size = 0
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            try:
+                size = size + os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return size
+
+#----------------------------------------------------------------
+# Snapshot cache
+#----------------------------------------------------------------
+class SnapshotCache:
+    """
+    A class managing the snapshot directories under the cache directory.
+
+    A snapshot is written to a temporary directory first and renamed to its
+    key once complete, so a snapshot interrupted while saving is never used.
+    Every lookup refreshes the last use time kept in the manifest.
+
+    Attributes:
+        cacheDir (str) : Directory of the snapshots
+        budget   (int) : Bytes the snapshots may use on the disk
+
+    Methods:
+        lookup(self, key: str):
+            Manifest of the snapshot, None if it is not cached
+        create(self, key: str):
+            Temporary directory to save a new snapshot to
+        commit(self, key: str, directory: str, manifest: dict):
+            Publish the saved snapshot, then evict the old ones
+        evict(self, keep = None):
+            Remove least recently used snapshots until under the budget
+
+    Usage:
+        cache = SnapshotCache()
+        manifest = cache.lookup(key)
+        if manifest is None:
+            directory = cache.create(key)
+            ...save...
+            cache.commit(key, directory, {"ranges": ranges})
+    """
+    def __init__(self, cacheDir = defaultCacheDir, budget = defaultBudget):
+        self.cacheDir = cacheDir
+        self.budget   = budget
+        self._lock    = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.cacheDir, key)
+
+    def _read_manifest(self, key):
+        try:
+            with open(os.path.join(self.path(key), manifestName)) as mf:
+                return json.load(mf)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_manifest(self, directory, manifest):
+        tmpFile = os.path.join(directory, manifestName + ".tmp")
+        with open(tmpFile, 'w') as mf:
+            json.dump(manifest, mf, indent = 1)
+        os.replace(tmpFile, os.path.join(directory, manifestName))
+
+    def lookup(self, key):
+        with self._lock:
+            manifest = self._read_manifest(key)
+            if manifest is None:
+                return None
+            manifest['lastUsed'] = time.time()
+            manifest['uses'] = manifest.get('uses', 0) + 1
+            self._write_manifest(self.path(key), manifest)
+            return manifest
+
+    def create(self, key):
+        os.makedirs(self.cacheDir, exist_ok = True)
+        return tempfile.mkdtemp(prefix = f".{key}.", dir = self.cacheDir)
+
+    def discard(self, directory):
+        shutil.rmtree(directory, ignore_errors = True)
+
+    def commit(self, key, directory, manifest):
+        """Publish a saved snapshot, an older snapshot of the key is replaced
+
+        Returns:
+            The manifest stored with the snapshot
+        """
+        manifest = dict(manifest)
+        manifest.update({'key': key, 'created': time.time(), 'lastUsed': time.time(), \
+                         'uses': 0, 'size': _directory_size(directory)})
+        self._write_manifest(directory, manifest)
+        with self._lock:
+            target = self.path(key)
+            if os.path.exists(target):
+                old = target + f".old.{os.getpid()}"
+                os.replace(target, old)
+                shutil.rmtree(old, ignore_errors = True)
+            os.replace(directory, target)
+        self.evict(keep = key)
+        return manifest
+
+    def remove(self, key):
+        with self._lock:
+            shutil.rmtree(self.path(key), ignore_errors = True)
+
+    def entries(self):
+        """Manifests of all the cached snapshots, the least recently used first"""
+        if not os.path.isdir(self.cacheDir):
+            return []
+        manifests = []
+        for name in os.listdir(self.cacheDir):
+            if name.startswith('.'):
+                continue
+            manifest = self._read_manifest(name)
+            if manifest is not None:
+                manifests.append(manifest)
+        return sorted(manifests, key = lambda manifest: manifest.get('lastUsed', 0))
+
+    def evict(self, keep = None):
+        """Remove the least recently used snapshots until the cache fits in
+           the budget, the snapshot just saved is kept even if it is larger
+
+        Returns:
+            Keys of the removed snapshots
+        """
+        removed = []
+        with self._lock:
+            # Temporary directories left by saves which never finished
+            for name in os.listdir(self.cacheDir):
+                directory = os.path.join(self.cacheDir, name)
+                if name.startswith('.') and os.path.isdir(directory) \
+                    and time.time() - os.path.getmtime(directory) > staleTime:
+                    shutil.rmtree(directory, ignore_errors = True)
+
+            entries = self.entries()
+            total = sum(manifest.get('size', 0) for manifest in entries)
+            for manifest in entries:
+                if total <= self.budget:
+                    break
+                if manifest['key'] == keep:
+                    continue
+                shutil.rmtree(self.path(manifest['key']), ignore_errors = True)
+                total = total - manifest.get('size', 0)
+                removed.append(manifest['key'])
+        return removed
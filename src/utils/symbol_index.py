@@ -0,0 +1,277 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   symbol_index.py
+@Time        :   2024/05/06 09:58:12
+@Author      :   Shiqi Duan
+@Description :   Local symbol index of the ELF images, so breakpoints and
+                 variables are resolved without asking trace32. The symbol
+                 tables of the mmapped ELF are written once into an index
+                 file keyed by the build id of the image, later runs mmap
+                 the index and binary search it without loading it.
+
+                 Index file, little endian:
+                     header  : magic "QSYM", version, count, big endian flag
+                     records : count x (address u64, size u64, name u32, type u32)
+                               sorted by address
+                     byName  : count x u32, record numbers sorted by name
+                     names   : the names, NUL terminated
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import os
+import mmap
+import struct
+import hashlib
+import tempfile
+import threading
+
+defaultCacheDir = os.path.join(tempfile.gettempdir(), 'qverify_symbols')
+
+indexMagic   = b"QSYM"
+indexVersion = 1
+headerFormat = struct.Struct("<4sIII")
+recordFormat = struct.Struct("<QQII")
+nameFormat   = struct.Struct("<I")
+
+# ELF constants
+SHT_SYMTAB, SHT_NOTE, SHT_DYNSYM = 2, 7, 11
+STT_NOTYPE, STT_OBJECT, STT_FUNC = 0, 1, 2
+NT_GNU_BUILD_ID = 3
+
+# Indexes opened in this process, keyed by index file
+_indexes = {}
+_indexesLock = threading.Lock()
+
+#----------------------------------------------------------------
+# ELF reader
+#----------------------------------------------------------------
+class ElfFile:
+    """
+    A minimal reader of the section headers, the symbol tables and the
+    build id of a mmapped ELF file, 32 or 64 bits, either endianness.
+
+    Attributes:
+        path      (str)  : Path of the ELF file
+        bits      (int)  : 32 or 64
+        bigEndian (bool) : Byte order of the target
+
+    Usage:
+        with ElfFile("apps.elf") as elf:
+            for [name, address, size, type] in elf.symbols():
+                ...
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._data = mmap.mmap(self._file.fileno(), 0, access = mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path} is empty")
+
+        if self._data[:4] != b"\x7fELF":
+            self.close()
+            raise ValueError(f"{path} is not an ELF file")
+        self.bits = 64 if self._data[4] == 2 else 32
+        self.bigEndian = self._data[5] == 2
+        order = ">" if self.bigEndian else "<"
+
+        if self.bits == 64:
+            header = struct.unpack_from(order + "HHIQQQIHHHHHH", self._data, 16)
+            self._section = struct.Struct(order + "IIQQQQIIQQ")
+            self._symbol  = struct.Struct(order + "IBBHQQ")
+        else:
+            header = struct.unpack_from(order + "HHIIIIIHHHHHH", self._data, 16)
+            self._section = struct.Struct(order + "IIIIIIIIII")
+            self._symbol  = struct.Struct(order + "IIIBBH")
+        self._order = order
+        [shoff, shentsize, shnum] = [header[5], header[10], header[11]]
+
+        # [name, type, addr, offset, size, link, entsize] of every section
+        self.sections = []
+        for index in range(shnum):
+            fields = self._section.unpack_from(self._data, shoff + index * shentsize)
+            [name, type, flags, addr, offset, size, link, info, align, entsize] = fields
+            self.sections.append([name, type, addr, offset, size, link, entsize])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._data.close()
+        self._file.close()
+
+    def _string(self, sectionIndex, offset):
+        start = self.sections[sectionIndex][3] + offset
+        return self._data[start:self._data.find(b"\0", start)].decode("utf-8", "replace")
+
+    def symbols(self):
+        """Defined function, object and label symbols, [name, address, size, type]"""
+        tables = [section for section in self.sections if section[1] == SHT_SYMTAB]
+        if not tables:
+            # Stripped image, only the dynamic symbols are left
+            tables = [section for section in self.sections if section[1] == SHT_DYNSYM]
+        for [name, type, addr, offset, size, link, entsize] in tables:
+            entsize = entsize or self._symbol.size
+            for position in range(offset + entsize, offset + size, entsize):
+                if self.bits == 64:
+                    [nameOffset, info, other, shndx, value, symbolSize] = \
+                        self._symbol.unpack_from(self._data, position)
+                else:
+                    [nameOffset, value, symbolSize, info, other, shndx] = \
+                        self._symbol.unpack_from(self._data, position)
+                symbolType = info & 0xf
+                if shndx == 0 or nameOffset == 0 \
+                    or symbolType not in (STT_NOTYPE, STT_OBJECT, STT_FUNC):
+                    continue
+                symbolName = self._string(link, nameOffset)
+                # Mapping symbols of ARM code, e.g. $x and $d
+                if symbolName.startswith('$'):
+                    continue
+                yield [symbolName, value, symbolSize, symbolType]
+
+    def build_id(self):
+        """The GNU build id, the hash of the whole file if there is none"""
+        for [name, type, addr, offset, size, link, entsize] in self.sections:
+            if type != SHT_NOTE:
+                continue
+            position = offset
+            while position + 12 <= offset + size:
+                [namesz, descsz, noteType] = struct.unpack_from(self._order + "III", \
+                                                                self._data, position)
+                nameStart = position + 12
+                descStart = nameStart + (namesz + 3) // 4 * 4
+                if noteType == NT_GNU_BUILD_ID and self._data[nameStart:nameStart + 3] == b"GNU":
+                    return self._data[descStart:descStart + descsz].hex()
+                position = descStart + (descsz + 3) // 4 * 4
+        return hashlib.sha1(self._data).hexdigest()
+
+#----------------------------------------------------------------
+# Index file
+#----------------------------------------------------------------
+def build_symbol_index(elfPath, indexPath):
+    """Write the index file of an ELF image, the file appears atomically"""
+    with ElfFile(elfPath) as elf:
+        symbols = sorted(elf.symbols(), key = lambda symbol: (symbol[1], symbol[0]))
+        bigEndian = elf.bigEndian
+
+    names = bytearray()
+    records = bytearray()
+    for [name, address, size, type] in symbols:
+        records += recordFormat.pack(address, size, len(names), type)
+        names += name.encode() + b"\0"
+    byName = sorted(range(len(symbols)), key = lambda index: symbols[index][0])
+
+    directory = os.path.dirname(indexPath) or "."
+    os.makedirs(directory, exist_ok = True)
+    [fd, tmpPath] = tempfile.mkstemp(prefix = ".index.", dir = directory)
+    with os.fdopen(fd, 'wb') as indexFile:
+        indexFile.write(headerFormat.pack(indexMagic, indexVersion, len(symbols), int(bigEndian)))
+        indexFile.write(records)
+        indexFile.write(struct.pack(f"<{len(byName)}I", *byName))
+        indexFile.write(names)
+    os.replace(tmpPath, indexPath)
+
+class SymbolIndex:
+    """
+    A class answering symbol lookups from a mmapped index file.
+
+    Attributes:
+        path      (str)  : Path of the index file
+        count     (int)  : Number of symbols
+        bigEndian (bool) : Byte order of the target
+
+    Methods:
+        lookup(self, name: str):
+            [address, size] of a symbol, None if not found
+        symbolize(self, address: int):
+            [name, offset] of the symbol holding an address, None if none
+
+    Usage:
+        index = get_symbol_index("apps.elf")
+        [address, size] = index.lookup("main")
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._data = mmap.mmap(self._file.fileno(), 0, access = mmap.ACCESS_READ)
+        [magic, version, self.count, bigEndian] = headerFormat.unpack_from(self._data, 0)
+        if magic != indexMagic or version != indexVersion:
+            self.close()
+            raise ValueError(f"{path} is not a symbol index")
+        self.bigEndian = bool(bigEndian)
+        self._records = headerFormat.size
+        self._byName  = self._records + self.count * recordFormat.size
+        self._names   = self._byName + self.count * nameFormat.size
+
+    def close(self):
+        self._data.close()
+        self._file.close()
+
+    def _record(self, number):
+        return recordFormat.unpack_from(self._data, self._records + number * recordFormat.size)
+
+    def _name(self, nameOffset):
+        start = self._names + nameOffset
+        return self._data[start:self._data.find(b"\0", start)].decode()
+
+    def _record_by_name(self, position):
+        [number] = nameFormat.unpack_from(self._data, self._byName + position * nameFormat.size)
+        return self._record(number)
+
+    def lookup(self, name):
+        [low, high] = [0, self.count]
+        while low < high:
+            middle = (low + high) // 2
+            if self._name(self._record_by_name(middle)[2]) < name:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count:
+            [address, size, nameOffset, type] = self._record_by_name(low)
+            if self._name(nameOffset) == name:
+                return [address, size]
+        return None
+
+    def symbolize(self, address):
+        [low, high] = [0, self.count]
+        while low < high:
+            middle = (low + high) // 2
+            if self._record(middle)[0] <= address:
+                low = middle + 1
+            else:
+                high = middle
+        # A few symbols back in case a larger one encloses the address
+        for number in range(low - 1, max(low - 9, -1), -1):
+            [start, size, nameOffset, type] = self._record(number)
+            if address < start + size:
+                return [self._name(nameOffset), address - start]
+        # Otherwise the label right before the address
+        if low > 0:
+            [start, size, nameOffset, type] = self._record(low - 1)
+            if size == 0:
+                return [self._name(nameOffset), address - start]
+        return None
+
+def elf_build_id(elfPath):
+    with ElfFile(elfPath) as elf:
+        return elf.build_id()
+
+def get_symbol_index(elfPath, cacheDir = defaultCacheDir):
+    """Get the index of an ELF image, built at the first use of its build
+
+    Returns:
+        SymbolIndex, shared by the callers in the process
+    """
+    indexPath = os.path.join(cacheDir, f"{elf_build_id(elfPath)}.qsym")
+    with _indexesLock:
+        if indexPath not in _indexes:
+            if not os.path.exists(indexPath):
+                build_symbol_index(elfPath, indexPath)
+            _indexes[indexPath] = SymbolIndex(indexPath)
+        return _indexes[indexPath]
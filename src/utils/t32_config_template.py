@@ -0,0 +1,123 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   t32_config_template.py
+@Time        :   2024/04/17 10:40:19
+@Author      :   Shiqi Duan
+@Description :   Render trace32 .t32 config files from rumi.json and a core
+                 type instead of copying them per RUMI. Rendered configs are
+                 cached in a temp directory keyed by the hash of their
+                 contents, so the same config is only written once.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import os
+import json
+import string
+import hashlib
+import tempfile
+import threading
+
+projectDir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+templateFile = os.path.join(projectDir, 'config', 't32_template.t32')
+rumiListFile = os.path.join(projectDir, 'config', 'rumi_config', 'rumi.json')
+renderDir    = os.path.join(tempfile.gettempdir(), 'qverify_t32')
+
+# Default values of every core type, None means the CORE line is left out
+coreDefaults = {
+    "arm":          {"CORE": 1},
+    "riscv":        {"CORE": 2},
+    "riscv_q6":     {"CORE": 3},
+    "single_riscv": {"CORE": None},
+}
+defaultPacklen = 1024
+
+_cacheLock = threading.Lock()
+_templates = {}
+_rendered  = {}
+
+def _load_template(templatePath):
+    mtime = os.stat(templatePath).st_mtime
+    cached = _templates.get(templatePath)
+    if cached is None or cached[0] != mtime:
+        with open(templatePath) as tf:
+            cached = [mtime, string.Template(tf.read())]
+        _templates[templatePath] = cached
+    return cached[1]
+
+def get_t32_values(rumiId, core, rumiList):
+    """Collect the values of a RUMI core config. NODE is the ip of the RUMI,
+       rumi.json can override any value with a "t32" object, either for all
+       cores or per core:
+
+           "7558": {..., "t32": {"PACKLEN": 1024, "riscv_q6": {"CORE": 2}}}
+
+    Returns:
+        Dict: NODE, PACKLEN and CORE values
+    """
+    if core not in coreDefaults:
+        raise ValueError(f"Unknown core type {core}")
+    rumiId = str(rumiId)
+    if rumiId not in rumiList:
+        raise KeyError(f"RUMI {rumiId} not in rumi.json")
+
+    rumiConfig = rumiList[rumiId]
+    values = {"NODE": rumiConfig['ip'], "PACKLEN": defaultPacklen}
+    values.update(coreDefaults[core])
+
+    overrides = rumiConfig.get('t32', {})
+    values.update({key: value for key, value in overrides.items() \
+                   if not isinstance(value, dict)})
+    values.update(overrides.get(core, {}))
+    return values
+
+def render_t32_config_text(rumiId, core, rumiList, templatePath = templateFile):
+    values = get_t32_values(rumiId, core, rumiList)
+    coreLine = "" if values.get("CORE") is None else f"CORE={values['CORE']}"
+    return _load_template(templatePath).substitute(
+        RUMI = rumiId, CORE_TYPE = core, NODE = values["NODE"], \
+        PACKLEN = values["PACKLEN"], CORE_LINE = coreLine)
+
+def render_t32_config(rumiId, core, rumiListPath = rumiListFile, \
+                      templatePath = templateFile, outputDir = renderDir):
+    """Render the config of a RUMI core and return the path of the file.
+       The file name holds the hash of the contents, an existing file is
+       reused without writing it again
+
+    Args:
+        rumiId (str): RUMI id, e.g. 7558
+        core (str): arm, riscv, riscv_q6 or single_riscv
+        rumiListPath (str): Path of rumi.json
+        templatePath (str): Path of the .t32 template
+        outputDir (str): Directory of the rendered configs
+
+    Returns:
+        Path of the rendered .t32 file
+    """
+    rumiId = str(rumiId)
+    with _cacheLock:
+        # rumi.json and the template rarely change, skip the rendering
+        # completely while both mtimes are the same
+        key = (rumiId, core, rumiListPath, templatePath, outputDir)
+        stamps = (os.stat(rumiListPath).st_mtime, os.stat(templatePath).st_mtime)
+        cached = _rendered.get(key)
+        if cached is not None and cached[0] == stamps and os.path.exists(cached[1]):
+            return cached[1]
+
+        with open(rumiListPath) as rf:
+            rumiList = json.load(rf)
+        text = render_t32_config_text(rumiId, core, rumiList, templatePath)
+        digest = hashlib.sha1(text.encode()).hexdigest()[:12]
+        configFile = os.path.join(outputDir, f"config{rumiId}_{core}_{digest}.t32")
+
+        if not os.path.exists(configFile):
+            os.makedirs(outputDir, exist_ok = True)
+            tmpFile = f"{configFile}.{os.getpid()}.tmp"
+            with open(tmpFile, 'w') as cf:
+                cf.write(text)
+            os.replace(tmpFile, configFile)
+
+        _rendered[key] = [stamps, configFile]
+        return configFile
@@ -0,0 +1,253 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   trace_file.py
+@Time        :   2024/05/13 09:47:30
+@Author      :   Shiqi Duan
+@Description :   Binary file of the on-chip trace records read from trace32.
+                 The records are written as they are read, in independently
+                 compressed chunks, the chunk index is appended at the end
+                 and its offset patched into the header. A reader loads the
+                 header and the index only, the records are decompressed a
+                 chunk at a time while they are iterated.
+
+                 header : magic "QTRC", version, codec, record size, mask,
+                          trace type, chunk count, record count, index offset,
+                          meta length, then the meta as json
+                 chunks : compressed records
+                 index  : chunk count x (first record i64, records u32,
+                          offset u64, length u32)
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import os
+import json
+import zlib
+import bisect
+import struct
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+traceMagic   = b"QTRC"
+traceVersion = 1
+headerFormat = struct.Struct("<4sIIIIIIQQI")
+indexFormat  = struct.Struct("<qIQI")
+
+CODEC_NONE, CODEC_ZLIB, CODEC_ZSTD = 0, 1, 2
+
+def _default_codec():
+    return CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+
+def _compress(codec, data):
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor().compress(data)
+    if codec == CODEC_ZLIB:
+        return zlib.compress(data, 1)
+    return data
+
+def _decompress(codec, data):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstandard is needed to read this trace")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data)
+    return data
+
+#----------------------------------------------------------------
+# Trace writer
+#----------------------------------------------------------------
+class TraceWriter:
+    """
+    A class writing trace records to a trace file chunk by chunk.
+
+    Attributes:
+        path       (str)  : Path of the trace file
+        recordSize (int)  : Bytes of a record
+        mask       (int)  : Items of a record, the mask given to T32_ReadTrace
+        traceType  (int)  : Trace read, the tracetype of T32_ReadTrace
+        meta       (dict) : Description stored in the header, e.g. the
+                            platform and the names of the items
+        records    (int)  : Records written so far
+
+    Methods:
+        write(self, firstRecord: int, data: bytes):
+            Append a chunk of records
+        close(self):
+            Write the index and complete the header
+
+    Usage:
+        with TraceWriter("trace.qtrc", 8, 0x3) as tw:
+            tw.write(record, data)
+    """
+    def __init__(self, path, recordSize, mask, traceType = 0, meta = None, codec = None):
+        self.path       = path
+        self.recordSize = recordSize
+        self.mask       = mask
+        self.traceType  = traceType
+        self.meta       = meta or {}
+        self.codec      = codec if codec is not None else _default_codec()
+        self.records    = 0
+
+        self._index = []
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+        self._tmpPath = path + f".{os.getpid()}.tmp"
+        self._file = open(self._tmpPath, 'wb')
+        self._metaData = json.dumps(self.meta).encode()
+        self._file.write(self._header(0))
+        self._file.write(self._metaData)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, *args):
+        if excType is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _header(self, indexOffset):
+        return headerFormat.pack(traceMagic, traceVersion, self.codec, self.recordSize, \
+                                 self.mask, self.traceType, len(self._index), self.records, \
+                                 indexOffset, len(self._metaData))
+
+    def write(self, firstRecord, data):
+        count = len(data) // self.recordSize
+        if count == 0:
+            return
+        compressed = _compress(self.codec, bytes(data[:count * self.recordSize]))
+        self._index.append([firstRecord, count, self._file.tell(), len(compressed)])
+        self._file.write(compressed)
+        self.records = self.records + count
+
+    def close(self):
+        """Write the index, the file appears complete under its name"""
+        if self._file is None:
+            return
+        indexOffset = self._file.tell()
+        for entry in self._index:
+            self._file.write(indexFormat.pack(*entry))
+        self._file.seek(0)
+        self._file.write(self._header(indexOffset))
+        self._file.close()
+        self._file = None
+        os.replace(self._tmpPath, self.path)
+
+    def abort(self):
+        """Drop an incomplete file"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            os.remove(self._tmpPath)
+
+#----------------------------------------------------------------
+# Trace reader
+#----------------------------------------------------------------
+class TraceReader:
+    """
+    A class iterating the records of a trace file lazily.
+
+    Attributes:
+        path       (str)  : Path of the trace file
+        recordSize (int)  : Bytes of a record
+        mask       (int)  : Items of a record
+        traceType  (int)  : Trace read
+        records    (int)  : Number of records
+        meta       (dict) : Description of the trace
+
+    Methods:
+        records_between(self, start = None, stop = None):
+            [record number, items] of the records in [start, stop)
+        raw_chunks(self):
+            [first record, data] of every chunk
+
+    Usage:
+        with TraceReader("trace.qtrc") as reader:
+            for [record, items] in reader.records_between(-1000, 0):
+                ...
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        fields = headerFormat.unpack(self._file.read(headerFormat.size))
+        [magic, version, self.codec, self.recordSize, self.mask, self.traceType, \
+         chunkCount, self.records, indexOffset, metaLength] = fields
+        if magic != traceMagic or version != traceVersion:
+            self.close()
+            raise ValueError(f"{path} is not a trace file")
+        if indexOffset == 0:
+            self.close()
+            raise ValueError(f"{path} is incomplete")
+        self.meta = json.loads(self._file.read(metaLength) or b"{}")
+
+        self._file.seek(indexOffset)
+        data = self._file.read(chunkCount * indexFormat.size)
+        self._index = [list(entry) for entry in indexFormat.iter_unpack(data)]
+        self._firsts = [entry[0] for entry in self._index]
+        # Items of a record, 4 bytes each like T32_ReadTrace returns them
+        self._record = struct.Struct(f"<{self.recordSize // 4}I")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.records
+
+    def close(self):
+        self._file.close()
+
+    def _chunk(self, position):
+        [first, count, offset, length] = self._index[position]
+        self._file.seek(offset)
+        return _decompress(self.codec, self._file.read(length))
+
+    def raw_chunks(self):
+        for position, [first, count, offset, length] in enumerate(self._index):
+            yield [first, self._chunk(position)]
+
+    def records_between(self, start = None, stop = None):
+        """Records numbered in [start, stop), all of them by default, only
+           the chunks holding them are read
+
+        Yields:
+            [record number, tuple of the items]
+        """
+        position = 0
+        if start is not None:
+            position = max(bisect.bisect_right(self._firsts, start) - 1, 0)
+        for position in range(position, len(self._index)):
+            [first, count, offset, length] = self._index[position]
+            if stop is not None and first >= stop:
+                return
+            if start is not None and first + count <= start:
+                continue
+            data = self._chunk(position)
+            for number, items in enumerate(self._record.iter_unpack(data), first):
+                if start is not None and number < start:
+                    continue
+                if stop is not None and number >= stop:
+                    return
+                yield [number, items]
+
+    def __iter__(self):
+        return self.records_between()
+
+    def info(self):
+        return {
+            'records':    self.records,
+            'chunks':     len(self._index),
+            'recordSize': self.recordSize,
+            'mask':       self.mask,
+            'traceType':  self.traceType,
+            'first':      self._firsts[0] if self._firsts else None,
+            'meta':       self.meta,
+        }
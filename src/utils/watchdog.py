@@ -0,0 +1,196 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   watchdog.py
+@Time        :   2024/04/12 09:46:13
+@Author      :   Shiqi Duan
+@Description :   Deadline watchdog for test cases and hardware operations.
+                 Every watched operation gets a cancel token, when its
+                 deadline expires the token is cancelled and the expiry
+                 callback is run from the watchdog thread. Robot drops the
+                 messages logged from other threads, the watchdog queues
+                 them and release() logs them from the caller.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import time
+import heapq
+import itertools
+import threading
+
+from robot.api import logger
+
+#----------------------------------------------------------------
+# Cancel token
+#----------------------------------------------------------------
+class CancelToken:
+    """
+    A token shared between a watched operation and the watchdog, polling
+    loops check it on every iteration and stop once it is cancelled.
+
+    Attributes:
+        name     (str)   : Name of the watched operation
+        deadline (float) : time.monotonic() value of the deadline
+        reason   (str)   : Why the token was cancelled
+
+    Usage:
+        while not token.cancelled():
+            ...
+    """
+    def __init__(self, name, deadline = None):
+        self.name     = name
+        self.deadline = deadline
+        self.reason   = ""
+        self._event   = threading.Event()
+
+    def cancel(self, reason = "cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    def cancelled(self):
+        return self._event.is_set()
+
+    def remaining(self):
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0)
+
+    def wait(self, seconds):
+        """Sleep for seconds, wake up early if cancelled
+
+        Returns:
+            True if the token is cancelled
+        """
+        return self._event.wait(seconds)
+
+#----------------------------------------------------------------
+# Watchdog
+#----------------------------------------------------------------
+class Watchdog:
+    """
+    A class tracking the deadlines of tests and hardware operations in a
+    single background thread.
+
+    Methods:
+        watch(self, name: str, timeout: float, onExpire = None, parent = None):
+            Start watching an operation, returns its CancelToken
+        release(self, token: CancelToken):
+            The operation finished or was cancelled, stop watching it and
+            log the messages queued by the watchdog thread
+        flush(self):
+            Log the messages queued by the watchdog thread
+        operation(self, name: str, timeout: float, onExpire = None, parent = None):
+            Context manager around watch/release
+
+    Usage:
+        watchdog = Watchdog()
+        testToken = watchdog.watch("Case1", 1200, dump_snapshot)
+        with watchdog.operation("CMM", 300, parent = testToken) as token:
+            trace32.execute_cmm_script(path, cancelToken = token)
+    """
+    def __init__(self):
+        self._heap     = []
+        self._watched  = {}
+        self._children = {}
+        self._counter  = itertools.count()
+        self._messages = []
+        self._cond     = threading.Condition()
+        self._thread   = None
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target = self._run, daemon = True)
+            self._thread.start()
+
+    def watch(self, name, timeout, onExpire = None, parent = None):
+        deadline = time.monotonic() + float(timeout)
+        # An operation can never outlive the test it belongs to
+        if parent is not None and parent.deadline is not None:
+            deadline = min(deadline, parent.deadline)
+
+        token = CancelToken(name, deadline)
+        with self._cond:
+            key = next(self._counter)
+            self._watched[id(token)] = [token, onExpire]
+            heapq.heappush(self._heap, (deadline, key, token))
+            if parent is not None:
+                self._children.setdefault(id(parent), []).append(token)
+                if parent.cancelled():
+                    token.cancel(parent.reason)
+            self._start()
+            self._cond.notify()
+        return token
+
+    def release(self, token):
+        with self._cond:
+            self._watched.pop(id(token), None)
+            self._children.pop(id(token), None)
+        self.flush()
+
+    def flush(self):
+        with self._cond:
+            [messages, self._messages] = [self._messages, []]
+        for message in messages:
+            logger.error(message, html = False)
+
+    def _queue_message(self, message):
+        with self._cond:
+            self._messages.append(message)
+
+    def cancel(self, token, reason = "cancelled"):
+        """Cancel an operation and all the operations started under it"""
+        with self._cond:
+            tokens = [token]
+            while tokens:
+                current = tokens.pop()
+                current.cancel(reason)
+                tokens.extend(self._children.pop(id(current), []))
+
+    def operation(self, name, timeout, onExpire = None, parent = None):
+        watchdog = self
+
+        class _Operation:
+            def __enter__(self):
+                self.token = watchdog.watch(name, timeout, onExpire, parent)
+                return self.token
+
+            def __exit__(self, *args):
+                watchdog.release(self.token)
+
+        return _Operation()
+
+    def _run(self):
+        while True:
+            expired = []
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+
+                [deadline, key, token] = self._heap[0]
+                if id(token) not in self._watched:
+                    heapq.heappop(self._heap)
+                    continue
+
+                now = time.monotonic()
+                if deadline > now:
+                    self._cond.wait(deadline - now)
+                    continue
+
+                heapq.heappop(self._heap)
+                [token, onExpire] = self._watched.pop(id(token))
+                # Already cancelled together with its parent
+                if not token.cancelled():
+                    expired.append([token, onExpire])
+
+            # Run the callbacks outside the lock, they talk to hardware
+            for [token, onExpire] in expired:
+                self._queue_message(f"Watchdog: {token.name} expired!")
+                self.cancel(token, f"{token.name} timeout")
+                if onExpire is not None:
+                    try:
+                        onExpire(token)
+                    except Exception as e:
+                        self._queue_message(f"Watchdog: expiry handler of {token.name} "\
+                                            f"failed, {e}")
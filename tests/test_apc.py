@@ -0,0 +1,71 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   test_apc.py
+@Time        :   2024/04/22 16:02:18
+@Author      :   Shiqi Duan
+@Description :   Tests of the APC outlets against the local PDU stand-in of
+                 the benchmarks, run with pytest from the project directory
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import os
+import sys
+import errno
+
+projectDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for libraryDir in (projectDir, os.path.join(projectDir, 'src')):
+    if libraryDir not in sys.path:
+        sys.path.insert(0, libraryDir)
+
+import pytest
+
+from benchmarks.standins import APCStandIn
+from hardware.apc import APC, Power
+from hardware.apc_client import close_apc_sessions
+
+@pytest.fixture
+def pdu():
+    with APCStandIn(outlets = 8) as server:
+        yield server
+    close_apc_sessions()
+
+def outlet(pdu, port):
+    return APC("127.0.0.1", port, timeout = 5, pduPort = pdu.port, offDelay = 0)
+
+def test_power_on_off(pdu):
+    apc = outlet(pdu, 5)
+    assert apc.power_on() == 0
+    assert pdu.outlets[5] is True
+    assert apc.read_status() == Power.ON
+    assert apc.power_off() == 0
+    assert apc.read_status() == Power.OFF
+    # All the requests went through a single login
+    assert pdu.logins == 1
+
+def test_batch_is_one_request_per_pdu(pdu):
+    apcs = [outlet(pdu, port) for port in (3, 1, 2)]
+    results = APC.switch_all(apcs, Power.ON)
+    assert set(results.values()) == {0}
+    assert pdu.commands == ["olOn 1,2,3"]
+    assert set(APC.read_status_all(apcs).values()) == {Power.ON}
+    assert pdu.commands[-1] == "olStatus 1,2,3"
+
+def test_stale_session_logs_in_again(pdu):
+    apc = outlet(pdu, 4)
+    pdu.dropAfter = 1
+    assert apc.power_on() == 0
+    assert apc.read_status() == Power.ON
+    assert pdu.logins == 2
+
+def test_pdu_error_fails_the_switch(pdu):
+    apc = outlet(pdu, 42)
+    assert apc.power_on() == -errno.EIO
+    assert apc.read_status() is None
+
+def test_reset(pdu):
+    apc = outlet(pdu, 6)
+    assert apc.reset() == 0
+    assert pdu.commands == ["olOff 6", "olOn 6"]
+    assert apc.is_power_on()
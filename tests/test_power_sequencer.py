@@ -0,0 +1,102 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   test_power_sequencer.py
+@Time        :   2024/04/23 17:12:40
+@Author      :   Shiqi Duan
+@Description :   Tests of the power sequencing engine with stubbed steps,
+                 run with pytest from the project directory
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import os
+import sys
+import time
+import errno
+import threading
+
+projectDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for libraryDir in (projectDir, os.path.join(projectDir, 'src')):
+    if libraryDir not in sys.path:
+        sys.path.insert(0, libraryDir)
+
+import pytest
+
+from hardware.power_sequencer import PowerSequencer, StepState
+
+class Recorder:
+    """Stubbed actions recording when they run and how many run together
+       on every resource"""
+    def __init__(self):
+        self.lock    = threading.Lock()
+        self.order   = []
+        self.active  = {}
+        self.maximum = {}
+
+    def action(self, name, resource = None, seconds = 0.05, ret = 0):
+        def run():
+            with self.lock:
+                self.order.append(name)
+                self.active[resource] = self.active.get(resource, 0) + 1
+                self.maximum[resource] = max(self.maximum.get(resource, 0), \
+                                             self.active[resource])
+            time.sleep(seconds)
+            with self.lock:
+                self.active[resource] = self.active[resource] - 1
+            return ret
+        return run
+
+def test_dependencies_run_first():
+    recorder = Recorder()
+    sequencer = PowerSequencer()
+    sequencer.add("on", recorder.action("on"), deps = ["delay"])
+    sequencer.add("delay", recorder.action("delay"), deps = ["off"])
+    sequencer.add("off", recorder.action("off"))
+    sequencer.add("reattach", recorder.action("reattach"), deps = ["on"])
+    assert sequencer.run() == 0
+    assert recorder.order == ["off", "delay", "on", "reattach"]
+    assert [step.name for step in sequencer.critical_path()] == \
+        ["off", "delay", "on", "reattach"]
+
+def test_resource_limit():
+    recorder = Recorder()
+    sequencer = PowerSequencer(limits = {"pdu": 2})
+    for index in range(6):
+        sequencer.add(f"tp{index} on", recorder.action("pdu", "pdu"), \
+                      resources = [("pdu", "10.0.0.1")])
+    sequencer.add("other pdu on", recorder.action("other", "other"), \
+                  resources = [("pdu", "10.0.0.2")])
+    assert sequencer.run() == 0
+    assert recorder.maximum["pdu"] == 2
+    # The outlets of another PDU do not wait for the busy one
+    assert sequencer.steps["other pdu on"].waited < 0.05
+
+def test_failure_skips_dependents():
+    recorder = Recorder()
+    sequencer = PowerSequencer()
+    sequencer.add("tp1 off", recorder.action("tp1 off", ret = -errno.EIO))
+    sequencer.add("tp1 on", recorder.action("tp1 on"), deps = ["tp1 off"])
+    sequencer.add("tp1 reattach", recorder.action("tp1 reattach"), deps = ["tp1 on"])
+    sequencer.add("tp2 off", recorder.action("tp2 off"))
+    assert sequencer.run() == -errno.EIO
+    assert sequencer.steps["tp1 on"].state == StepState.SKIPPED
+    assert sequencer.steps["tp1 reattach"].state == StepState.SKIPPED
+    assert sequencer.steps["tp2 off"].state == StepState.DONE
+    assert "tp1 on" not in recorder.order
+
+def test_cycle_is_refused():
+    recorder = Recorder()
+    sequencer = PowerSequencer()
+    sequencer.add("a", recorder.action("a"), deps = ["c"])
+    sequencer.add("b", recorder.action("b"), deps = ["a"])
+    sequencer.add("c", recorder.action("c"), deps = ["b"])
+    with pytest.raises(ValueError, match = "cycle"):
+        sequencer.run()
+    assert recorder.order == []
+
+def test_unknown_dependency_is_refused():
+    sequencer = PowerSequencer()
+    sequencer.add("on", lambda: 0, deps = ["off"])
+    with pytest.raises(ValueError, match = "unknown"):
+        sequencer.run()
@@ -0,0 +1,326 @@
+#! python3
+# -*- encoding: utf-8 -*-
+'''
+@File        :   test_remote.py
+@Time        :   2024/04/27 14:20:36
+@Author      :   Shiqi Duan
+@Description :   Tests of the remote agent, a local agent on the loopback
+                 address drives the trace32 API and PDU stand-ins of the
+                 benchmarks. Every forwarded keyword makes one round trip.
+                 Run with pytest from the project directory.
+@Version     :   1.0
+@Contact     :   shiqduan@qti.qualcomm.com
+'''
+
+import os
+import sys
+import json
+import errno
+import socket
+
+projectDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for libraryDir in (projectDir, os.path.join(projectDir, 'src')):
+    if libraryDir not in sys.path:
+        sys.path.insert(0, libraryDir)
+
+import pytest
+
+from benchmarks.standins import APCStandIn, T32ApiStandIn
+from hardware import trace32
+from hardware.apc_client import close_apc_sessions
+from remote.agent import RemoteAgent
+from remote.protocol import RemoteError, encode, decode
+import VerificationLibrary as verification
+
+platformName = "tp0"
+
+def platform_config(pduPort):
+    apc = {"ip": "127.0.0.1", "port": 1, "pduPort": pduPort, "offDelay": 0}
+    return {
+        "name": platformName,
+        "dut": {
+            "basic": {"name": "dut0", "type": "rumi", "project": "example", \
+                      "addr": "0x0", "src": "test"},
+            "core": {"type": "arm", "width": 64},
+            "ddr": {"type": 160, "width": 1},
+            "apc": dict(apc),
+        },
+        "trace32": {
+            "apc": dict(apc, port = 2),
+            "ip": "localhost",
+            "port": 20000,
+            "config": "config.t32",
+            "initCmm": "init.cmm",
+        },
+    }
+
+class Remote:
+    """The controller library, the agent and what they drive"""
+    def __init__(self, directory, api, pdu):
+        self.directory = directory
+        self.api       = api
+        self.pdu       = pdu
+        self.keywords  = []
+
+        self.platformFile = str(directory / "test_platforms.json")
+        with open(self.platformFile, 'w') as pf:
+            json.dump({"test_platforms": [platform_config(pdu.port)]}, pf)
+        (directory / "script.cmm").write_text('PRINT "script"\n')
+        (directory / "golden.log").write_text("Boot done\n")
+        (directory / "image.elf").write_bytes(b"\x7fELF" + bytes(60))
+
+        self.local = verification.VerificationLibrary()
+        assert self.local.load_test_platforms(self.platformFile) == 0
+        self.agent = RemoteAgent(self.local, ("127.0.0.1", 0))
+        runCalls = self.agent.run_calls
+        def run_calls(requestId, calls, *args):
+            self.keywords.extend(call[0] for call in calls)
+            return runCalls(requestId, calls, *args)
+        self.agent.run_calls = run_calls
+        self.agent.start()
+        self.controller = verification.VerificationLibrary( \
+            remote = f"127.0.0.1:{self.agent.address[1]}")
+        self.controller._remote.callTimeout = 30
+
+    def path(self, name):
+        return str(self.directory / name)
+
+    def close(self):
+        self.controller.disconnect_remote_agent()
+        self.agent.stop()
+        # Nothing started by a test keeps running into the next one
+        for name in list(self.local._samplers):
+            self.local.stop_sampler(name)
+        self.local.stop_event_bus(platformName)
+        self.local.stop_test_watchdog(platformName)
+        self.local.release_cores()
+
+@pytest.fixture
+def remote(tmp_path, monkeypatch):
+    # The agent writes the captures relative to its working directory
+    monkeypatch.chdir(tmp_path)
+    api = T32ApiStandIn(term = b"Boot done\r\n")
+    monkeypatch.setattr(trace32, "t32api", api)
+    with APCStandIn(outlets = 8) as pdu:
+        remote = Remote(tmp_path, api, pdu)
+        yield remote
+        remote.close()
+    close_apc_sessions()
+
+class RobotRun:
+    """BuiltIn of a robot run, the controller resolves the test with it"""
+    variables = {}
+
+    def get_variable_value(self, name, default = None):
+        return self.variables.get(name, default)
+
+#----------------------------------------------------------------
+# One round trip per forwarded keyword, [calls before, keyword, args,
+# check of the result]
+#----------------------------------------------------------------
+def _ok(result):
+    return result == 0
+
+def _rc_ok(result):
+    return result[0] == 0
+
+keywordCases = {
+    "print_test_platform":      [[], lambda r: [], lambda result: result is None],
+    "load_test_platforms":      [[], lambda r: [r.platformFile], _ok],
+    "connect_trace32":          [[], lambda r: [platformName], _ok],
+    "disconnect_trace32":       [[], lambda r: [platformName], _ok],
+    "start_trace32_process":    [[], lambda r: [platformName], _ok],
+    "kill_trace32_process":     [[], lambda r: [platformName], _ok],
+    "power_on_trace32":         [[], lambda r: [platformName], _ok],
+    "power_off_trace32":        [[], lambda r: [platformName], _ok],
+    "reset_trace32":            [[], lambda r: [platformName], _ok],
+    "read_term_and_compare":    [[], lambda r: [platformName, ["Boot done"]], \
+                                 lambda result: result == [0, True]],
+    "classify_term_failures":   [[], lambda r: [platformName], lambda result: result == [0, {}]],
+    "wait_for_term_keywords":   [[], lambda r: [platformName, ["Boot done"], 5, 0.1], _ok],
+    "start_event_bus":          [[], lambda r: [platformName, 0.05], _ok],
+    "stop_event_bus":           [[["start_event_bus", [platformName, 0.05]]], \
+                                 lambda r: [platformName], _ok],
+    "start_test_watchdog":      [[], lambda r: [platformName, 60], _ok],
+    "stop_test_watchdog":       [[["start_test_watchdog", [platformName, 60]]], \
+                                 lambda r: [platformName], _ok],
+    "wait_until_not_running":   [[], lambda r: [platformName, 2], _ok],
+    "execute_trace32_command":  [[], lambda r: [platformName, "Go"], _ok],
+    "execute_cmm_script":       [[], lambda r: [platformName, r.path("script.cmm")], _ok],
+    "execute_cmm_bundle":       [[], lambda r: [platformName, r.path("script.cmm")], _ok],
+    "get_cmm_profile":          [[], lambda r: [], lambda result: result == []],
+    "save_target_snapshot":     [[], lambda r: [platformName, "image", "0x1000:0x100"], _ok],
+    "restore_target_snapshot":  [[["save_target_snapshot", [platformName, "image", "0x1000:0x100"]]], \
+                                 lambda r: [platformName, "image"], _ok],
+    "read_registers":           [[], lambda r: [platformName, "TIMER.CNTFRQ"], \
+                                 lambda result: result == [0, {"TIMER.CNTFRQ": 0}]],
+    "write_registers":          [[], lambda r: [platformName, "TIMER.CNTCTL.ENABLE=1"], _ok],
+    "load_image":               [[], lambda r: [platformName, r.path("image.elf")], _ok],
+    "prepare_cores":            [[], lambda r: [platformName], _ok],
+    "go_cores":                 [[["prepare_cores", [platformName]]], lambda r: [], _rc_ok],
+    "halt_cores":               [[["prepare_cores", [platformName]]], lambda r: [2], _rc_ok],
+    "get_core_skew":            [[["prepare_cores", [platformName]], ["go_cores", []]], \
+                                 lambda r: [], lambda result: platformName in result['offsets']],
+    "release_cores":            [[["prepare_cores", [platformName]]], lambda r: [], _ok],
+    "load_symbols":             [[], lambda r: [platformName, r.path("image.elf")], _ok],
+    "resolve_symbol":           [[], lambda r: [platformName, "0x1000"], \
+                                 lambda result: result == [0, 0x1000]],
+    "symbolize_address":        [[], lambda r: [platformName, "0x1000"], \
+                                 lambda result: result == "0x1000"],
+    "set_breakpoint":           [[], lambda r: [platformName, "0x1000"], _ok],
+    "read_variable":            [[], lambda r: [platformName, "0x1000", 4], \
+                                 lambda result: result == [0, 0]],
+    "start_sampler":            [[], lambda r: [platformName, 50, "0x1000"], _ok],
+    "stop_sampler":             [[["start_sampler", [platformName, 50, "0x1000"]]], \
+                                 lambda r: [platformName], _rc_ok],
+    "get_sampler_stats":        [[["start_sampler", [platformName, 50, "0x1000"]]], \
+                                 lambda r: [platformName], _rc_ok],
+    "export_samples":           [[["start_sampler", [platformName, 50, "0x1000"]], \
+                                  ["stop_sampler", [platformName]]], \
+                                 lambda r: [platformName, r.path("samples.csv")], _rc_ok],
+    "export_trace":             [[], lambda r: [platformName], _rc_ok],
+    "get_trace_file_info":      [[["export_trace", [platformName, "trace.qtrc"]]], \
+                                 lambda r: ["trace.qtrc"], lambda result: result['records'] == 0],
+    "read_trace_records":       [[["export_trace", [platformName, "trace.qtrc"]]], \
+                                 lambda r: ["trace.qtrc"], lambda result: result == []],
+    "compare_term_with_golden": [[], lambda r: [platformName, r.path("golden.log")], \
+                                 lambda result: result[0] == 0 and result[1]['equal']],
+    "get_trace32_view_message": [[], lambda r: [platformName], lambda result: result == ""],
+    "power_on_dut":             [[], lambda r: [platformName], _ok],
+    "power_off_dut":            [[], lambda r: [platformName], _ok],
+    "reset_dut":                [[], lambda r: [platformName], _ok],
+    "reset_platforms":          [[], lambda r: [platformName], _ok],
+    "get_dut_power_status":     [[["power_on_dut", [platformName]]], lambda r: [platformName], \
+                                 lambda result: str(result).endswith("ON")],
+}
+
+def forwarded_keywords():
+    wrapper = verification._remote_keyword(lambda self: None).__code__
+    return sorted(name for name, function in vars(verification.VerificationLibrary).items() \
+                  if getattr(function, '__code__', None) is wrapper)
+
+def test_every_forwarded_keyword_has_a_case():
+    assert forwarded_keywords() == sorted(keywordCases)
+
+@pytest.mark.parametrize("keyword", sorted(keywordCases))
+def test_keyword_round_trip(remote, monkeypatch, keyword):
+    # The trace32 application is not started, only the call is checked
+    tp = remote.local.get_test_platform_by_name(platformName)
+    monkeypatch.setattr(tp, "create_trace32_process", lambda: 0, raising = False)
+    monkeypatch.setattr(tp, "kill_trace32_process", lambda: 0, raising = False)
+
+    [before, args, check] = keywordCases[keyword]
+    for [setupKeyword, setupArgs] in before:
+        getattr(remote.controller, setupKeyword)(*setupArgs)
+    remote.keywords.clear()
+    result = getattr(remote.controller, keyword)(*args(remote))
+    assert remote.keywords == [keyword]
+    assert check(result), result
+
+#----------------------------------------------------------------
+# Test of the controller
+#----------------------------------------------------------------
+def test_trace_goes_to_the_test_of_the_controller(remote, monkeypatch):
+    outputDir = remote.path("output")
+    monkeypatch.setattr(RobotRun, "variables", \
+                        {"${OUTPUT DIR}": outputDir, "${TEST NAME}": "Remote Test"})
+    monkeypatch.setattr(verification, "BuiltIn", RobotRun)
+
+    [ret, tracePath] = remote.controller.export_trace(platformName)
+    assert ret == 0
+    assert tracePath == os.path.join(outputDir, "traces", "Remote_Test", platformName, \
+                                     "trace.qtrc")
+    assert os.path.isfile(tracePath)
+
+def test_samples_go_to_the_test_of_the_controller(remote, monkeypatch):
+    outputDir = remote.path("output")
+    monkeypatch.setattr(RobotRun, "variables", \
+                        {"${OUTPUT DIR}": outputDir, "${TEST NAME}": "Remote Test"})
+    monkeypatch.setattr(verification, "BuiltIn", RobotRun)
+
+    assert remote.controller.start_sampler(platformName, 50, "0x1000") == 0
+    [ret, stats] = remote.controller.stop_sampler(platformName)
+    assert ret == 0 and stats["0x1000"]["count"] > 0
+    assert os.path.isfile(os.path.join(outputDir, "samples", "Remote_Test", platformName, \
+                                       "samples.bin"))
+
+def test_outside_of_a_robot_run_the_defaults_are_used(remote):
+    response = remote.agent.run_calls(1, [["export_trace", [platformName], {}]])
+    assert response["error"] is None
+    assert response["results"][0][1] == os.path.join("results", "traces", "suite", \
+                                                     platformName, "trace.qtrc")
+
+def test_registers_through_the_agent(remote):
+    assert remote.controller.write_registers(platformName, "TIMER.CNTCTL=0x5", \
+                                             "GPIO.CFG0.FUNC_SEL=3") == 0
+    assert remote.controller.read_registers(platformName, "TIMER.CNTCTL.ENABLE", \
+        "TIMER.CNTCTL.IMASK", "GPIO.CFG0.FUNC_SEL") == \
+        [0, {"TIMER.CNTCTL.ENABLE": 1, "TIMER.CNTCTL.IMASK": 0, "GPIO.CFG0.FUNC_SEL": 3}]
+    assert remote.controller.read_registers(platformName, "TIMER.NOPE")[0] == -errno.EINVAL
+
+
+def test_static_registers_are_cached_per_test_of_the_controller(remote, monkeypatch):
+    monkeypatch.setattr(verification, "BuiltIn", RobotRun)
+    monkeypatch.setattr(RobotRun, "variables", {"${TEST NAME}": "First"})
+    assert remote.controller.read_registers(platformName, "TIMER.CNTFRQ") == \
+        [0, {"TIMER.CNTFRQ": 0}]
+    remote.api.memory[0x17C20000] = 0x40
+    assert remote.controller.read_registers(platformName, "TIMER.CNTFRQ") == \
+        [0, {"TIMER.CNTFRQ": 0}]
+    monkeypatch.setattr(RobotRun, "variables", {"${TEST NAME}": "Second"})
+    assert remote.controller.read_registers(platformName, "TIMER.CNTFRQ") == \
+        [0, {"TIMER.CNTFRQ": 0x40}]
+
+def test_batch_is_one_round_trip(remote):
+    results = remote.controller.run_remote_keywords( \
+        "Connect Trace32", platformName, "AND", \
+        "Execute Trace32 Command", platformName, "Go", "AND", \
+        "Read Term And Compare", platformName, ["Boot done"])
+    assert results == [0, 0, [0, True]]
+    assert remote.keywords == ["Connect Trace32", "Execute Trace32 Command", \
+                               "Read Term And Compare"]
+
+def test_keyword_error_is_raised_on_the_controller(remote):
+    with pytest.raises(RemoteError):
+        remote.controller.run_remote_keywords("Get Trace File Info", "nope.qtrc")
+
+#----------------------------------------------------------------
+# Protocol
+#----------------------------------------------------------------
+def send_raw(remote, *messages):
+    with socket.create_connection(remote.agent.address, timeout = 10) as sock:
+        reader = sock.makefile('rb')
+        responses = []
+        for message in messages:
+            sock.sendall(message if isinstance(message, bytes) else encode(message))
+            if isinstance(message, dict):
+                responses.append(decode(reader.readline()))
+        return responses
+
+def test_malformed_call_is_an_error_response(remote):
+    [bad, good] = send_raw(remote, b"[1, 2]\n", {"id": 1, "calls": [["Connect Trace32"]]}, \
+                           {"id": 2, "calls": [["Connect Trace32", [platformName], {}]]})
+    assert bad["id"] == 1 and bad["error"]["index"] == 0
+    # The connection still serves the next request
+    assert good == {"id": 2, "results": [0], "error": None}
+
+def test_wrong_token_is_refused(tmp_path):
+    agent = RemoteAgent(verification.VerificationLibrary(), ("127.0.0.1", 0), token = "secret")
+    agent.start()
+    try:
+        for token in ("wrong", None, "sécret"):
+            [response] = send_raw(type("Remote", (), {"agent": agent}), \
+                                  {"id": 1, "token": token, "calls": [["Print Test Platform", [], {}]]})
+            assert response["error"]["message"] == "Wrong agent token"
+        [response] = send_raw(type("Remote", (), {"agent": agent}), \
+                              {"id": 1, "token": "secret", "calls": [["Print Test Platform", [], {}]]})
+        assert response["error"] is None
+    finally:
+        agent.stop()
+
+def test_silent_agent_times_out(remote):
+    remote.controller._remote.callTimeout = 0.5
+    with remote.agent.lock:
+        with pytest.raises(RemoteError):
+            remote.controller.connect_trace32(platformName)
+    assert remote.controller._remote._pending == {}